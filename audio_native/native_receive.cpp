@@ -0,0 +1,95 @@
+#include "receive_engine.h"
+
+#include <cstdint>
+
+#if defined(_WIN32) || defined(_WIN64)
+#define EXPORT_API __declspec(dllexport)
+#else
+#define EXPORT_API
+#endif
+
+extern "C" {
+EXPORT_API void* rx_create(int sampleRate, int frameSize, int window, int minFrames, int maxFrames) {
+    try {
+        if (sampleRate <= 0 || frameSize <= 0 || window <= 0) {
+            return nullptr;
+        }
+        return new ReceiveEngine(sampleRate, frameSize, window, minFrames, maxFrames);
+    } catch (...) {
+        return nullptr;
+    }
+}
+
+EXPORT_API void rx_destroy(void* handle) {
+    try {
+        if (!handle) {
+            return;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        delete rx;
+    } catch (...) {
+        return;
+    }
+}
+
+EXPORT_API int rx_push(
+    void* handle, uint32_t sender, int seq, uint32_t timestamp, const uint8_t* packet, int offset, int length) {
+    try {
+        if (!handle || !packet || offset < 0 || offset >= length) {
+            return 0;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        return rx->push(sender, static_cast<uint16_t>(seq), timestamp, packet + offset, length - offset);
+    } catch (...) {
+        return 0;
+    }
+}
+
+EXPORT_API int rx_set_heard(void* handle, const uint32_t* senders, int count) {
+    try {
+        if (!handle) {
+            return 0;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        return rx->setHeard(senders, count);
+    } catch (...) {
+        return 0;
+    }
+}
+
+EXPORT_API int rx_mix(void* handle, int16_t* out, int frameSamples) {
+    try {
+        if (!handle || !out || frameSamples <= 0) {
+            return 0;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        return rx->mix(out, frameSamples);
+    } catch (...) {
+        return 0;
+    }
+}
+
+EXPORT_API int rx_get_stats(void* handle, uint64_t* out, int count) {
+    try {
+        if (!handle || !out) {
+            return 0;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        return rx->getStats(out, count);
+    } catch (...) {
+        return 0;
+    }
+}
+
+EXPORT_API int rx_jitter_ms(void* handle, uint32_t sender) {
+    try {
+        if (!handle) {
+            return 0;
+        }
+        auto* rx = static_cast<ReceiveEngine*>(handle);
+        return rx->jitterMs(sender);
+    } catch (...) {
+        return 0;
+    }
+}
+}
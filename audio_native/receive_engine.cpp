@@ -0,0 +1,649 @@
+#include "receive_engine.h"
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstring>
+#include <mutex>
+#include <unordered_map>
+#include <unordered_set>
+#include <vector>
+
+#if defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+#include <emmintrin.h>
+#define RX_HAVE_SSE2 1
+#endif
+
+// libopus is linked from ../opus, which ships the import library only.
+extern "C" {
+typedef struct OpusDecoder OpusDecoder;
+OpusDecoder* opus_decoder_create(int32_t fs, int channels, int* error);
+int opus_decode(OpusDecoder* st, const unsigned char* data, int32_t len, int16_t* pcm, int frameSize, int decodeFec);
+void opus_decoder_destroy(OpusDecoder* st);
+}
+
+namespace {
+
+// Per-stream AGC targets, same as client/mixing.py
+constexpr float kTargetPeak = 12000.f;
+constexpr float kMaxGain = 3.f;
+constexpr float kMinGain = 0.5f;
+constexpr float kFullScale = 32767.f;
+constexpr int kMaxPayload = 1500;
+constexpr int kRestartGap = 1000;  // a seq this far behind means the sender started over
+constexpr int kRestartFrames = 50;  // so does a timestamp this many frames behind playout
+
+// Adaptive playout, same as client/jitter.py's PlayoutBuffer
+constexpr double kJitterMult = 4.0;
+constexpr double kLevelGain = 0.1;
+constexpr int kMaxConcealFrames = 3;
+
+// WSOLA time stretch, same as client/timestretch.py
+constexpr int kPitchMin = 40;
+constexpr int kPitchMax = 160;
+constexpr int kOverlap = 160;
+constexpr double kMatchMin = 0.6;
+constexpr int kSilencePeak = 400;
+
+enum class Play { None, Frame, Fec, Plc };
+
+enum class Action { Play, Accelerate, Expand };
+
+enum Stat { kReceived, kMissing, kFec, kLate, kDropped, kAccelerate, kExpand, kStatCount };
+
+double monotonicSeconds() {
+    using namespace std::chrono;
+    return duration<double>(steady_clock::now().time_since_epoch()).count();
+}
+
+int peakOf(const int16_t* pcm, int n) {
+    int hi = 0;
+    int lo = 0;
+    int i = 0;
+#ifdef RX_HAVE_SSE2
+    __m128i vhi = _mm_setzero_si128();
+    __m128i vlo = _mm_setzero_si128();
+    for (; i + 8 <= n; i += 8) {
+        const __m128i x = _mm_loadu_si128(reinterpret_cast<const __m128i*>(pcm + i));
+        vhi = _mm_max_epi16(vhi, x);
+        vlo = _mm_min_epi16(vlo, x);
+    }
+    alignas(16) int16_t his[8];
+    alignas(16) int16_t los[8];
+    _mm_store_si128(reinterpret_cast<__m128i*>(his), vhi);
+    _mm_store_si128(reinterpret_cast<__m128i*>(los), vlo);
+    for (int k = 0; k < 8; ++k) {
+        hi = std::max<int>(hi, his[k]);
+        lo = std::min<int>(lo, los[k]);
+    }
+#endif
+    for (; i < n; ++i) {
+        hi = std::max<int>(hi, pcm[i]);
+        lo = std::min<int>(lo, pcm[i]);
+    }
+    return std::max(hi, -lo);
+}
+
+void accumulate(float* acc, const int16_t* pcm, float gain, int n) {
+    int i = 0;
+#ifdef RX_HAVE_SSE2
+    const __m128 g = _mm_set1_ps(gain);
+    for (; i + 8 <= n; i += 8) {
+        const __m128i x = _mm_loadu_si128(reinterpret_cast<const __m128i*>(pcm + i));
+        // Sign-extend each int16 half to int32 lanes, then to float.
+        const __m128 lo = _mm_cvtepi32_ps(_mm_srai_epi32(_mm_unpacklo_epi16(x, x), 16));
+        const __m128 hi = _mm_cvtepi32_ps(_mm_srai_epi32(_mm_unpackhi_epi16(x, x), 16));
+        _mm_storeu_ps(acc + i, _mm_add_ps(_mm_loadu_ps(acc + i), _mm_mul_ps(lo, g)));
+        _mm_storeu_ps(acc + i + 4, _mm_add_ps(_mm_loadu_ps(acc + i + 4), _mm_mul_ps(hi, g)));
+    }
+#endif
+    for (; i < n; ++i) {
+        acc[i] += gain * static_cast<float>(pcm[i]);
+    }
+}
+
+// Best pitch period near the start of x (kPitchMax + kOverlap samples),
+// or -1 if it is not periodic enough to splice inaudibly.
+int pitchPeriod(const int16_t* x) {
+    if (peakOf(x, kPitchMax + kOverlap) < kSilencePeak) {
+        return kPitchMax;
+    }
+    double templateEnergy = 0.0;
+    double windowEnergy = 0.0;
+    for (int i = 0; i < kOverlap; ++i) {
+        templateEnergy += static_cast<double>(x[i]) * x[i];
+        windowEnergy += static_cast<double>(x[kPitchMin + i]) * x[kPitchMin + i];
+    }
+    int best = -1;
+    double bestScore = 0.0;
+    for (int lag = kPitchMin; lag <= kPitchMax; ++lag) {
+        if (lag > kPitchMin) {
+            const double in = x[lag + kOverlap - 1];
+            const double out = x[lag - 1];
+            windowEnergy += in * in - out * out;
+        }
+        double corr = 0.0;
+        for (int i = 0; i < kOverlap; ++i) {
+            corr += static_cast<double>(x[i]) * x[lag + i];
+        }
+        const double score = corr / std::sqrt(std::max(windowEnergy * templateEnergy, 1e-9));
+        if (best < 0 || score > bestScore) {
+            best = lag;
+            bestScore = score;
+        }
+    }
+    return bestScore < kMatchMin ? -1 : best;
+}
+
+float fadeIn(int i) {
+    return static_cast<float>(i) / (kOverlap - 1);
+}
+
+// x with one pitch period cut out (accelerate) or repeated (expand), written
+// to out; returns the new length, or n with x copied if there is no period.
+int timeStretch(const int16_t* x, int n, bool faster, int16_t* out) {
+    const int p = n >= kPitchMax + kOverlap ? pitchPeriod(x) : -1;
+    if (p < 0) {
+        std::memcpy(out, x, static_cast<size_t>(n) * sizeof(int16_t));
+        return n;
+    }
+    if (faster) {
+        // Fade from x[0:] into x[p:], which continues the same waveform one period later.
+        for (int i = 0; i < kOverlap; ++i) {
+            out[i] = static_cast<int16_t>(x[i] * (1.f - fadeIn(i)) + x[p + i] * fadeIn(i));
+        }
+        std::memcpy(out + kOverlap, x + p + kOverlap, static_cast<size_t>(n - p - kOverlap) * sizeof(int16_t));
+        return n - p;
+    }
+    // After x[:p] comes a second copy of the first period, faded from x[p:] back into x[0:].
+    std::memcpy(out, x, static_cast<size_t>(p) * sizeof(int16_t));
+    for (int i = 0; i < kOverlap; ++i) {
+        out[p + i] = static_cast<int16_t>(x[p + i] * (1.f - fadeIn(i)) + x[i] * fadeIn(i));
+    }
+    std::memcpy(out + p + kOverlap, x + kOverlap, static_cast<size_t>(n - kOverlap) * sizeof(int16_t));
+    return n + p;
+}
+
+struct Slot {
+    int32_t seq = -1;
+    uint32_t timestamp = 0;
+    std::vector<uint8_t> payload;
+};
+
+struct Job {
+    Play play = Play::None;
+    std::vector<uint8_t> payload;
+};
+
+// One sender's jitter buffer and adaptive playout (the native twin of
+// client/jitter.py's JitterRing and PlayoutBuffer). Ring and playout state
+// are guarded by the engine lock; the decoder, AGC level, jobs and PCM fifo
+// belong to the mix thread alone.
+struct Stream {
+    Stream(int window, int minFrames, int frameSize) : window(window), target(minFrames) {
+        int capacity = 1;
+        while (capacity < window) {
+            capacity <<= 1;
+        }
+        mask = static_cast<uint16_t>(capacity - 1);
+        slots.resize(static_cast<size_t>(capacity));
+        for (auto& slot : slots) {
+            slot.payload.reserve(kMaxPayload);
+        }
+        for (auto& job : jobs) {
+            job.payload.reserve(kMaxPayload);
+        }
+        // Two decoded frames, and what is left over plus up to two stretched ones.
+        pcm.resize(static_cast<size_t>(2 * frameSize));
+        fifo.resize(static_cast<size_t>(3 * frameSize + kPitchMax));
+    }
+
+    ~Stream() {
+        if (decoder) {
+            opus_decoder_destroy(decoder);
+        }
+    }
+
+    Slot* find(uint16_t seq) {
+        Slot& slot = slots[seq & mask];
+        return slot.seq == seq ? &slot : nullptr;
+    }
+
+    void evict(Slot& slot) {
+        if (slot.seq >= 0) {
+            slot.seq = -1;
+            --count;
+        }
+    }
+
+    bool restarts(uint16_t seq, uint32_t timestamp, int frameSize) const {
+        const uint16_t behind = static_cast<uint16_t>(newest - seq);
+        if (hasNewest && behind >= kRestartGap && behind <= 0x8000) {
+            return true;
+        }
+        // Seq may land ahead after a restart, but the timestamp starts over too.
+        return hasPlayout
+            && static_cast<int32_t>(timestamp - playoutTs) < -kRestartFrames * frameSize;
+    }
+
+    void restart() {
+        for (auto& slot : slots) {
+            evict(slot);
+        }
+        hasNewest = false;
+        playing = false;
+        hasPlayout = false;
+    }
+
+    // Lowest buffered seq; only called with count > 0.
+    uint16_t oldest() const {
+        for (int k = window - 1; k > 0; --k) {
+            const uint16_t seq = static_cast<uint16_t>(newest - k);
+            if (slots[seq & mask].seq == seq) {
+                return seq;
+            }
+        }
+        return newest;
+    }
+
+    // RFC 3550 (section 6.4.1) interarrival jitter, in seconds.
+    void updateJitter(double arrival, uint32_t timestamp, int sampleRate) {
+        if (hasArrival) {
+            const double sent = static_cast<double>(static_cast<int32_t>(timestamp - lastTs)) / sampleRate;
+            jitter += (std::fabs(arrival - lastArrival - sent) - jitter) / 16.0;
+        }
+        hasArrival = true;
+        lastArrival = arrival;
+        lastTs = timestamp;
+    }
+
+    // The next frame to decode into job; false if nothing is buffered.
+    bool next(Job& job, uint64_t* stats, int frameSize) {
+        for (;;) {
+            const uint16_t exp = expected;
+            if (Slot* slot = find(exp)) {
+                expected = static_cast<uint16_t>(exp + 1);
+                const uint32_t ts = slot->timestamp;
+                if (hasPlayout && static_cast<int32_t>(ts - playoutTs) < 0) {
+                    evict(*slot);
+                    ++stats[kLate];
+                    continue;
+                }
+                job.payload.assign(slot->payload.begin(), slot->payload.end());
+                job.play = Play::Frame;
+                hasPlayout = true;
+                playoutTs = ts + static_cast<uint32_t>(frameSize);
+                evict(*slot);
+                return true;
+            }
+            if (count == 0) {
+                return false;  // late rather than lost: conceal it without moving on
+            }
+            const uint16_t behind = static_cast<uint16_t>(newest - exp);
+            if (behind >= window && behind < 0x8000) {
+                // Everything up to the oldest buffered frame fell out of the window.
+                const uint16_t first = oldest();
+                stats[kMissing] += static_cast<uint16_t>(first - exp);
+                expected = first;
+                continue;
+            }
+            expected = static_cast<uint16_t>(exp + 1);
+            playoutTs += static_cast<uint32_t>(frameSize);
+            ++stats[kMissing];
+            if (Slot* following = find(expected)) {
+                // Rebuild the lost frame from the next packet's FEC; that
+                // packet stays buffered and plays normally afterwards.
+                job.payload.assign(following->payload.begin(), following->payload.end());
+                job.play = Play::Fec;
+                ++stats[kFec];
+            } else {
+                job.play = Play::Plc;
+            }
+            return true;
+        }
+    }
+
+    // Fill jobs for this tick and choose how to stretch them.
+    void plan(uint64_t* stats, int frameSize) {
+        jobCount = 0;
+        action = Action::Play;
+        if (fifoLen >= frameSize) {
+            return;
+        }
+        if (!playing) {
+            if (count < target) {
+                return;
+            }
+            // Talk spurt start: playout begins at the current target delay.
+            playing = true;
+            expected = oldest();
+            hasPlayout = false;
+            concealed = 0;
+            fill = count;
+        }
+
+        fill += kLevelGain * (count + static_cast<double>(fifoLen) / frameSize - fill);
+        if (!next(jobs[0], stats, frameSize)) {
+            if (++concealed > kMaxConcealFrames) {
+                playing = false;
+                fifoLen = 0;
+                return;
+            }
+            jobs[0].play = Play::Plc;
+            jobCount = 1;
+            return;
+        }
+        concealed = 0;
+        jobCount = 1;
+        if (fill > target + 0.5) {
+            if (next(jobs[1], stats, frameSize)) {
+                ++stats[kAccelerate];
+                jobCount = 2;
+                action = Action::Accelerate;
+            }
+        } else if (fill < target - 1) {
+            ++stats[kExpand];
+            action = Action::Expand;
+        }
+    }
+
+    bool insert(uint16_t seq, uint32_t timestamp, const uint8_t* payload, int length) {
+        if (!hasNewest) {
+            hasNewest = true;
+            newest = seq;
+        } else {
+            const uint16_t ahead = static_cast<uint16_t>(seq - newest);
+            if (ahead > 0 && ahead < 0x8000) {
+                // Advance the window; slots of seqs that fall out of it are freed.
+                const uint16_t gone = static_cast<uint16_t>(newest - window + 1);
+                const int steps = std::min<int>(ahead, window);
+                for (int k = 0; k < steps; ++k) {
+                    const uint16_t out = static_cast<uint16_t>(gone + k);
+                    Slot& slot = slots[out & mask];
+                    if (slot.seq == out) {
+                        evict(slot);
+                    }
+                }
+                newest = seq;
+            } else if (static_cast<uint16_t>(newest - seq) >= window) {
+                return false;
+            }
+        }
+        Slot& slot = slots[seq & mask];
+        if (slot.seq == seq) {
+            return false;
+        }
+        if (slot.seq < 0) {
+            ++count;
+        }
+        slot.seq = seq;
+        slot.timestamp = timestamp;
+        slot.payload.assign(payload, payload + length);
+        return true;
+    }
+
+    std::vector<Slot> slots;
+    int window;
+    uint16_t mask = 0;
+    int count = 0;
+    bool hasNewest = false;
+    uint16_t newest = 0;
+
+    bool playing = false;
+    uint16_t expected = 0;
+    bool hasPlayout = false;
+    uint32_t playoutTs = 0;
+    int target;
+    int concealed = 0;
+    double fill = 0.0;  // smoothed buffer level in frames, ring plus fifo
+    bool hasArrival = false;
+    double jitter = 0.0;
+    double lastArrival = 0.0;
+    uint32_t lastTs = 0;
+
+    OpusDecoder* decoder = nullptr;
+    bool hasLevel = false;
+    float level = 0.f;
+    Job jobs[2];
+    int jobCount = 0;
+    Action action = Action::Play;
+    std::vector<int16_t> pcm;
+    std::vector<int16_t> fifo;  // decoded PCM not yet played
+    int fifoLen = 0;
+};
+
+}  // namespace
+
+class ReceiveEngine::Impl {
+public:
+    Impl(int sampleRate, int frameSize, int window, int minFrames, int maxFrames)
+        : sampleRate(sampleRate),
+          frameSize(frameSize),
+          window(std::max(2, window)),
+          minFrames(std::max(1, minFrames)),
+          maxFrames(std::max(minFrames, maxFrames)),
+          frameSec(static_cast<double>(frameSize) / sampleRate),
+          acc(static_cast<size_t>(frameSize), 0.f) {
+        std::fill(std::begin(stats), std::end(stats), 0);
+        playing.reserve(64);
+    }
+
+    int push(uint32_t sender, uint16_t seq, uint32_t timestamp, const uint8_t* payload, int length) {
+        if (length <= 0 || length > kMaxPayload) {
+            return 0;
+        }
+        const double now = monotonicSeconds();
+        std::lock_guard<std::mutex> lock(mutex);
+        if (!heard.count(sender)) {
+            ++stats[kDropped];
+            return 0;
+        }
+        auto& entry = streams[sender];
+        if (!entry) {
+            entry = std::make_unique<Stream>(window, minFrames, frameSize);
+        }
+        Stream& stream = *entry;
+        if (stream.restarts(seq, timestamp, frameSize)) {
+            stream.restart();
+        }
+        // Drop late packets
+        if (stream.hasPlayout && static_cast<int32_t>(timestamp - stream.playoutTs) < 0) {
+            ++stats[kLate];
+            return 0;
+        }
+        if (!stream.insert(seq, timestamp, payload, length)) {
+            ++stats[kDropped];
+            return 0;
+        }
+        ++stats[kReceived];
+
+        // Target delay covers kJitterMult jitter estimates, plus the FEC lookahead frame.
+        stream.updateJitter(now, timestamp, sampleRate);
+        const int target = static_cast<int>(std::ceil(kJitterMult * stream.jitter / frameSec)) + 1;
+        stream.target = std::max(minFrames, std::min(maxFrames, target));
+        return 1;
+    }
+
+    int setHeard(const uint32_t* senders, int count) {
+        std::lock_guard<std::mutex> lock(mutex);
+        heard.clear();
+        for (int i = 0; i < count; ++i) {
+            heard.insert(senders[i]);
+        }
+        return 1;
+    }
+
+    int mix(int16_t* out, int frameSamples) {
+        const int n = std::min(frameSamples, frameSize);
+        std::vector<std::unique_ptr<Stream>> retired;
+        playing.clear();
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            for (auto it = streams.begin(); it != streams.end();) {
+                if (!heard.count(it->first)) {
+                    // Muted streams go now; their decoders are freed outside the lock.
+                    retired.push_back(std::move(it->second));
+                    it = streams.erase(it);
+                    continue;
+                }
+                Stream& stream = *it->second;
+                ++it;
+                stream.plan(stats, frameSize);
+                if (stream.jobCount > 0 || stream.fifoLen > 0) {
+                    playing.push_back(&stream);
+                }
+            }
+        }
+
+        // Only the mix thread erases streams, so these stay valid unlocked.
+        std::fill(acc.begin(), acc.end(), 0.f);
+        int active = 0;
+        for (Stream* stream : playing) {
+            if (stream->jobCount > 0 && !decode(*stream)) {
+                continue;
+            }
+            if (stream->fifoLen < frameSize) {
+                continue;
+            }
+
+            // Per-stream AGC (EMA on peak)
+            const int16_t* pcm = stream->fifo.data();
+            const float peak = static_cast<float>(std::max(1, peakOf(pcm, n)));
+            stream->level = stream->hasLevel ? 0.9f * stream->level + 0.1f * peak : peak;
+            stream->hasLevel = true;
+            const float gain = std::max(kMinGain, std::min(kMaxGain, kTargetPeak / stream->level));
+            accumulate(acc.data(), pcm, gain, n);
+            ++active;
+
+            stream->fifoLen -= frameSize;
+            std::memmove(stream->fifo.data(), pcm + frameSize, static_cast<size_t>(stream->fifoLen) * sizeof(int16_t));
+        }
+
+        if (active == 0) {
+            std::memset(out, 0, static_cast<size_t>(frameSamples) * sizeof(int16_t));
+            return 0;
+        }
+
+        // Soft limiter to prevent clipping without shrinking everything
+        for (int i = 0; i < n; ++i) {
+            out[i] = static_cast<int16_t>(std::lrint(kFullScale * std::tanh(acc[i] / kFullScale)));
+        }
+        if (frameSamples > n) {
+            std::memset(out + n, 0, static_cast<size_t>(frameSamples - n) * sizeof(int16_t));
+        }
+        return active;
+    }
+
+    // Decode this tick's jobs and queue them on the fifo, stretched as planned.
+    bool decode(Stream& stream) {
+        if (!stream.decoder) {
+            int err = 0;
+            stream.decoder = opus_decoder_create(sampleRate, 1, &err);
+            if (!stream.decoder) {
+                return false;
+            }
+        }
+        int samples = 0;
+        for (int j = 0; j < stream.jobCount; ++j) {
+            Job& job = stream.jobs[j];
+            int16_t* pcm = stream.pcm.data() + samples;
+            int decoded;
+            if (job.play == Play::Plc) {
+                decoded = opus_decode(stream.decoder, nullptr, 0, pcm, frameSize, 0);
+            } else {
+                decoded = opus_decode(
+                    stream.decoder,
+                    job.payload.data(),
+                    static_cast<int32_t>(job.payload.size()),
+                    pcm,
+                    frameSize,
+                    job.play == Play::Fec ? 1 : 0);
+            }
+            job.play = Play::None;
+            if (decoded == frameSize) {
+                samples += decoded;
+            }
+        }
+        stream.jobCount = 0;
+        int16_t* tail = stream.fifo.data() + stream.fifoLen;
+        if (stream.action == Action::Accelerate && samples >= 2 * kPitchMax) {
+            stream.fifoLen += timeStretch(stream.pcm.data(), samples, true, tail);
+        } else if (stream.action == Action::Expand && samples > 0) {
+            stream.fifoLen += timeStretch(stream.pcm.data(), samples, false, tail);
+        } else {
+            std::memcpy(tail, stream.pcm.data(), static_cast<size_t>(samples) * sizeof(int16_t));
+            stream.fifoLen += samples;
+        }
+        return true;
+    }
+
+    int getStats(uint64_t* out, int count) const {
+        std::lock_guard<std::mutex> lock(mutex);
+        const int n = std::min<int>(count, kStatCount);
+        std::copy(stats, stats + n, out);
+        return n;
+    }
+
+    int jitterMs(uint32_t sender) const {
+        std::lock_guard<std::mutex> lock(mutex);
+        auto it = streams.find(sender);
+        if (it == streams.end()) {
+            return 0;
+        }
+        return static_cast<int>(it->second->jitter * 1000.0);
+    }
+
+private:
+    const int sampleRate;
+    const int frameSize;
+    const int window;
+    const int minFrames;
+    const int maxFrames;
+    const double frameSec;
+
+    mutable std::mutex mutex;
+    std::unordered_map<uint32_t, std::unique_ptr<Stream>> streams;
+    std::unordered_set<uint32_t> heard;
+    uint64_t stats[kStatCount];
+
+    // Mix thread only
+    std::vector<float> acc;
+    std::vector<Stream*> playing;
+};
+
+ReceiveEngine::ReceiveEngine(int sampleRate, int frameSize, int window, int minFrames, int maxFrames)
+    : impl(std::make_unique<Impl>(sampleRate, frameSize, window, minFrames, maxFrames)) {}
+
+ReceiveEngine::~ReceiveEngine() = default;
+
+int ReceiveEngine::push(uint32_t sender, uint16_t seq, uint32_t timestamp, const uint8_t* payload, int length) {
+    if (!payload) {
+        return 0;
+    }
+    return impl->push(sender, seq, timestamp, payload, length);
+}
+
+int ReceiveEngine::setHeard(const uint32_t* senders, int count) {
+    if (count < 0 || (count > 0 && !senders)) {
+        return 0;
+    }
+    return impl->setHeard(senders, count);
+}
+
+int ReceiveEngine::mix(int16_t* out, int frameSamples) {
+    if (!out || frameSamples <= 0) {
+        return 0;
+    }
+    return impl->mix(out, frameSamples);
+}
+
+int ReceiveEngine::getStats(uint64_t* out, int count) const {
+    if (!out || count <= 0) {
+        return 0;
+    }
+    return impl->getStats(out, count);
+}
+
+int ReceiveEngine::jitterMs(uint32_t sender) const {
+    return impl->jitterMs(sender);
+}
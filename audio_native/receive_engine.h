@@ -0,0 +1,28 @@
+#ifndef RECEIVE_ENGINE_H
+#define RECEIVE_ENGINE_H
+
+#include <cstdint>
+#include <memory>
+
+// Client receive path: per-sender adaptive jitter buffers, Opus decode and
+// time stretch at playout, per-stream AGC and the soft-limited mix, all
+// behind one mix() call per output period. push() runs on the receive thread, mix() on the audio
+// callback; the lock between them only covers the jitter buffers.
+class ReceiveEngine {
+public:
+    ReceiveEngine(int sampleRate, int frameSize, int window, int minFrames, int maxFrames);
+    ~ReceiveEngine();
+
+    int push(uint32_t sender, uint16_t seq, uint32_t timestamp, const uint8_t* payload, int length);
+    int setHeard(const uint32_t* senders, int count);
+    int mix(int16_t* out, int frameSamples);
+    int getStats(uint64_t* out, int count) const;
+    int jitterMs(uint32_t sender) const;
+
+private:
+    class Impl;
+
+    std::unique_ptr<Impl> impl;
+};
+
+#endif
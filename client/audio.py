@@ -1,58 +1,109 @@
-﻿import socket, threading, pyaudio, struct, math, time
+﻿import socket, selectors, threading, pyaudio, struct, math, time
+import numpy as np
 from opus_codec import OpusCodec
+from bitrate import BitrateController, ReceiveStats
+from decoder import DecodePool
+from jitter import PlayoutBuffer
+from mixing import StreamMixer
+from native_receive import NativeReceiver, native_receive_available
+from playout import CallbackTimer, PlayoutRing
 from echo_cancel import EchoCanceller, echo_cancel_available
+from packet import (
+    FLAG_LEVEL,
+    FLAG_RESUME,
+    MIX_SSRC,
+    is_binary,
+    pack_header,
+    pack_level,
+    pack_nack,
+    payload_offset,
+    unpack_header,
+)
 
 RATE = 16000
 FRAME = 320  # 20 ms @ 16 kHz (matches OpusCodec default)
 CHUNK = FRAME
 FRAME_MS = int(1000 * FRAME / RATE)
 AUDIO_PORT = 50002
-
-# Simple jitter buffer targets (ms)
-JITTER_MIN_MS = 20
-JITTER_TARGET_MS = 60
+MIX_SENDER = "mix"  # stream name of the server-side mix
+
+# Receive loop: one selector over the unicast and multicast sockets, each drained
+# into preallocated buffers. The larger kernel buffer absorbs bursts while the
+# receive thread waits on the GIL.
+RECV_BUFFER_BYTES = 1024 * 1024
+RECV_BATCH = 64         # datagrams read per socket per wakeup
+MAX_PACKET = 4096
+LISTEN_POLL_SEC = 1.0
+
+# Jitter buffer bounds (ms); the target in between follows the measured jitter.
+# The minimum keeps one frame of lookahead so a lost frame can be rebuilt from
+# the next packet's in-band FEC.
+JITTER_MIN_MS = 40
 JITTER_MAX_MS = 120
+JITTER_WINDOW_MS = 320  # frames this far behind the newest are given up on
 
 MIN_FRAMES = max(1, JITTER_MIN_MS // FRAME_MS)
-TARGET_FRAMES = max(1, JITTER_TARGET_MS // FRAME_MS)
 MAX_FRAMES = max(2, JITTER_MAX_MS // FRAME_MS)
+WINDOW_FRAMES = max(MAX_FRAMES, JITTER_WINDOW_MS // FRAME_MS)
+
+# Sender level byte: frames louder than this count as voice
+VAD_THRESHOLD_DBOV = 50
+
+# Gaps longer than this are an outage, not loss worth a NACK
+NACK_MAX_GAP = 17
+
+# The mixer thread keeps this many output frames rendered ahead of the callback
+PLAYOUT_LEAD_FRAMES = 2
+PLAYOUT_RING_FRAMES = 4
 
-# Per-stream AGC targets
-TARGET_PEAK = 12000
-MAX_GAIN = 3.0
-MIN_GAIN = 0.5
+# Echo path delay from the speaker back to the mic. The far-end reference is
+# fed at render time, so the AEC also waits out the render-ahead frames.
+ECHO_PATH_MS = 60
+ECHO_DELAY_MS = ECHO_PATH_MS + PLAYOUT_LEAD_FRAMES * FRAME_MS
 
 
 class AudioEngine:
     def __init__(self):
         self.client_id = None
+        self.ssrc = None            # assigned at REGISTER; None -> legacy text header
+        self.ssrc_names = {}        # ssrc -> sender_id
+        self.on_unknown_ssrc = None
+        self.mixed = False          # receiving one server mix instead of every talker
+        self.server_addr = None     # (ip, audio_port) that answers NACKs; None -> no NACKs
+        self.highest_seq = {}       # ssrc -> highest seq seen, for gap detection
         self.audio = pyaudio.PyAudio()
 
         # Opus codec (frame size MUST match)
-        self.codec = OpusCodec(rate=RATE, channels=1, frame_size=FRAME)
+        self.rate = BitrateController()
+        self.codec = OpusCodec(
+            rate=RATE, channels=1, frame_size=FRAME, bitrate=self.rate.bitrate, create_decoder=False
+        )
+        self.decoders = DecodePool(
+            lambda: OpusCodec(rate=RATE, channels=1, frame_size=FRAME, create_encoder=False)
+        )
+        self.recv_stats = {}        # sender_id -> ReceiveStats, for receiver reports
 
         # ================= RECEIVE SOCKET =================
         self.recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        self.recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
 
         # Bind to ephemeral port
         self.recv_sock.bind(("", 0))
         self.port = self.recv_sock.getsockname()[1]
+        self.recv_sock.setblocking(False)
+
+        # listen() waits on both sockets here; the key data says whether to NACK.
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.recv_sock, selectors.EVENT_READ, True)
+        self._recv_views = [memoryview(bytearray(MAX_PACKET)) for _ in range(RECV_BATCH)]
 
         # ================= AUDIO STATE =================
-        self.streams = {}          # sender_id -> dict(seq -> (timestamp, pcm, arrival_time))
-        self.expected_seq = {}     # sender_id -> next seq
-        self.playout_ts = {}       # sender_id -> expected timestamp (samples)
-        self.jitter_target = {}    # sender_id -> target frames
-        self.jitter_est = {}       # sender_id -> jitter estimate (seconds)
-        self.last_arrival = {}     # sender_id -> last arrival time
-        self.last_adjust = {}      # sender_id -> last adjust time
-        self.stream_levels = {}    # sender_id -> float (EMA of peak)
+        self.streams = {}          # sender_id -> PlayoutBuffer
+        self.mixer = StreamMixer(FRAME)  # AGC + mix + limiter for the output callback
         self.hear_targets = set()
         self.running = False
         self.listen_running = True
-        self.multicast_running = False
         self.stream_lock = threading.Lock()
         self.multicast_sock = None
         self.multicast_group = None
@@ -64,7 +115,7 @@ class AudioEngine:
         self.echo_enabled = False
         if echo_cancel_available():
             try:
-                self.echo = EchoCanceller(sample_rate=RATE, channels=1, frame_size=FRAME, delay_ms=60)
+                self.echo = EchoCanceller(sample_rate=RATE, channels=1, frame_size=FRAME, delay_ms=ECHO_DELAY_MS)
                 self.echo_enabled = True
                 print("[AUDIO] Native echo cancellation enabled")
             except Exception as e:
@@ -72,10 +123,29 @@ class AudioEngine:
         else:
             print("[AUDIO] Native echo cancellation API not found in native_mixer.dll")
 
+        # Jitter buffering, decode and mix run natively when the DLL exports them;
+        # the Python receive path below is the fallback.
+        self.native_rx = None
+        if native_receive_available():
+            try:
+                self.native_rx = NativeReceiver(RATE, FRAME, WINDOW_FRAMES, MIN_FRAMES, MAX_FRAMES)
+                print("[AUDIO] Native receive engine enabled")
+            except Exception as e:
+                print(f"[AUDIO] Native receive engine unavailable: {e}")
+        else:
+            print("[AUDIO] Native receive engine not found in native_mixer.dll (rebuild audio_native)")
+
         self.last_playout = b"\x00" * (FRAME * 2)
+        self.silence = b"\x00" * (FRAME * 2)
+        self.playout = PlayoutRing(PLAYOUT_RING_FRAMES)
+        self.callback_timer = CallbackTimer()
         self.seq = 0
         self.timestamp = 0
-        self.jitter_stats = {"missing": 0, "received": 0}
+        self.jitter_stats = {"missing": 0, "received": 0, "nacked": 0, "fec": 0, "accelerate": 0, "expand": 0, "late": 0}
+
+        # Frames are rendered ahead on their own thread; the callback only copies one out.
+        self.render_thread = threading.Thread(target=self.render, daemon=True, name="audio-render")
+        self.render_thread.start()
 
         # ================= OUTPUT STREAM =================
         self.output = self.audio.open(
@@ -94,122 +164,139 @@ class AudioEngine:
     # --------------------------------------------------
 
     def set_hear_targets(self, targets):
-        self.hear_targets = set(targets)
+        # Build the new set before publishing it; mix() iterates it unlocked.
+        hear = set(targets)
+        if self.mixed:
+            hear.add(MIX_SENDER)
+        self.hear_targets = hear
+        if self.native_rx is not None:
+            self.native_rx.set_heard(hear)
 
         # Flush muted streams immediately
         with self.stream_lock:
             for sid in list(self.streams.keys()):
                 if sid not in self.hear_targets:
                     del self.streams[sid]
-                    self.expected_seq.pop(sid, None)
-                    self.playout_ts.pop(sid, None)
-                    self.jitter_target.pop(sid, None)
-                    self.jitter_est.pop(sid, None)
-                    self.last_arrival.pop(sid, None)
-                    self.last_adjust.pop(sid, None)
-                    self.stream_levels.pop(sid, None)
+                    self.mixer.levels.pop(sid, None)
+
+    def update_roster(self, roster):
+        roster = dict(roster)
+        if self.mixed:
+            roster[MIX_SSRC] = MIX_SENDER
+        self.ssrc_names = roster
+
+    def enable_server_mix(self):
+        """Play the server's mix-minus stream; per-talker filtering moves to the server."""
+        self.mixed = True
+        self.update_roster(self.ssrc_names)
+        self.set_hear_targets(self.hear_targets)
 
     # --------------------------------------------------
 
     def _callback(self, in_data, frame_count, *_):
-        frame_bytes = frame_count * 2
-        mixed_pcm = self.mix(frame_bytes)
-        self.last_playout = mixed_pcm
-        if self.echo_enabled and self.echo is not None:
-            try:
-                self.echo.process_reverse(mixed_pcm)
-            except Exception as e:
-                print(f"[AUDIO] Echo reverse error, disabling echo canceller: {e}")
-                self.echo_enabled = False
-        return (mixed_pcm, pyaudio.paContinue)
+        start = time.perf_counter()
+        pcm = self.playout.pop()
+        underrun = pcm is None or len(pcm) != frame_count * 2
+        if underrun:
+            pcm = self.silence if frame_count == FRAME else b"\x00" * (frame_count * 2)
+        self.callback_timer.record(time.perf_counter() - start, underrun)
+        return (pcm, pyaudio.paContinue)
+
+    def render(self):
+        """Mixer thread: keep ``PLAYOUT_LEAD_FRAMES`` frames ready for the callback."""
+        period = FRAME / RATE
+        rendered = 0
+        while self.listen_running:
+            while len(self.playout) < PLAYOUT_LEAD_FRAMES:
+                mixed_pcm = self.mix(FRAME * 2)
+                self.last_playout = mixed_pcm
+                if self.echo_enabled and self.echo is not None:
+                    try:
+                        self.echo.process_reverse(mixed_pcm)
+                    except Exception as e:
+                        print(f"[AUDIO] Echo reverse error, disabling echo canceller: {e}")
+                        self.echo_enabled = False
+                self.playout.push(mixed_pcm)
+                rendered += 1
+                if rendered % 3000 == 0:
+                    stats = self.playout_stats()
+                    print(
+                        f"[PLAYOUT] callback avg {stats['avg_us']} us, max {stats['max_us']} us, "
+                        f"{stats['underruns']} underruns in {stats['callbacks']} callbacks"
+                    )
+            time.sleep(period / 4)
+
+    def playout_stats(self):
+        """Audio callback timing since the last call, underruns and frames rendered ahead."""
+        stats = self.callback_timer.snapshot()
+        stats["buffered"] = len(self.playout)
+        return stats
 
     # --------------------------------------------------
 
     def mix(self, frame_bytes):
-        samples = [0] * (frame_bytes // 2)
-        active = 0
+        if self.native_rx is not None:
+            return self._mix_native(frame_bytes)
 
-        frames = []
+        planned = []
+        missing = self.jitter_stats["missing"]
         with self.stream_lock:
-            for sid in list(self.streams.keys()):
-                if sid not in self.hear_targets:
-                    continue
-
+            for sid in self.hear_targets:
                 buf = self.streams.get(sid)
-                if not buf:
-                    continue
-
-                exp = self.expected_seq.get(sid)
-                if exp is None:
-                    continue
-
-                # Keep buffer bounded to avoid unbounded delay
-                while len(buf) > MAX_FRAMES:
-                    buf.pop(min(buf.keys()))
-
-                target = self.jitter_target.get(sid, TARGET_FRAMES)
-                if len(buf) < max(MIN_FRAMES, target):
-                    continue
-
-                if exp in buf:
-                    ts, chunk, _arr = buf.pop(exp)
-                    # Drop late packets
-                    exp_ts = self.playout_ts.get(sid)
-                    if exp_ts is not None and ts < exp_ts:
-                        self.expected_seq[sid] = (exp + 1) & 0xFFFF
-                        continue
-                    frames.append((sid, chunk, ts))
-                else:
-                    self.jitter_stats["missing"] += 1
-                    if self.jitter_stats["missing"] % 100 == 1:
-                        print(f"[JITTER] Missing seq {exp} from {sid}")
-                    frames.append((sid, None, None))
-                self.expected_seq[sid] = (exp + 1) & 0xFFFF
-
-        for sid, chunk, ts in frames:
-
-            if chunk is None:
-                pcm = self.codec.decode(None)
-                if not pcm:
-                    continue
-                chunk = pcm[:frame_bytes]
-                exp_ts = self.playout_ts.get(sid)
-                if exp_ts is not None:
-                    self.playout_ts[sid] = exp_ts + FRAME
-            else:
-                if ts is not None:
-                    self.playout_ts[sid] = ts + FRAME
+                if buf is not None:
+                    jobs, action = buf.plan()
+                    planned.append((sid, buf, jobs, action))
 
-            data = struct.unpack("<" + "h" * (frame_bytes // 2), chunk)
-            peak = max(abs(s) for s in data) or 1
+        if self.jitter_stats["missing"] // 100 > missing // 100:
+            print(f"[JITTER] {self.jitter_stats['missing']} frames missing so far")
 
-            # Per-stream AGC (EMA on peak)
-            prev = self.stream_levels.get(sid, peak)
-            level = 0.9 * prev + 0.1 * peak
-            self.stream_levels[sid] = level
+        # Only the frames played this tick get decoded (FEC or PLC for the missing ones).
+        decoded = self.decoders.decode_many(
+            [(sid, opus, fec) for sid, _buf, jobs, _action in planned for opus, fec in jobs]
+        )
+        streams = []
+        i = 0
+        for sid, buf, jobs, action in planned:
+            if jobs:
+                pcms = decoded[i : i + len(jobs)]
+                i += len(jobs)
+                if not all(pcms):
+                    print(f"[AUDIO] Failed to decode Opus from {sid}")
+                buf.play(pcms, action)
+            pcm = buf.take()
+            if pcm is not None:
+                streams.append((sid, pcm))
+
+        mixer = self.mixer
+        if mixer.frame * 2 != frame_bytes:
+            mixer = self.mixer = StreamMixer(frame_bytes // 2)
+        output_bytes, active = mixer.mix(streams)
+        if active == 0:
+            return output_bytes
 
-            gain = TARGET_PEAK / level if level > 0 else 1.0
-            gain = max(MIN_GAIN, min(MAX_GAIN, gain))
+        # Limit logging to avoid spam
+        if not hasattr(self, "_mix_count"):
+            self._mix_count = 0
+        self._mix_count += 1
+        if self._mix_count % 1000 == 0:
+            print(f"[AUDIO] Mixing {active} sources, {self._mix_count} total callbacks")
 
-            data = [int(s * gain) for s in data]
-            samples = [a + b for a, b in zip(samples, data)]
-            active += 1
+        return output_bytes
 
+    def _mix_native(self, frame_bytes):
+        output_bytes, active = self.native_rx.mix(frame_bytes)
         if active == 0:
-            return b"\x00" * frame_bytes
-
-        # Soft limiter to prevent clipping without shrinking everything
-        def soft_clip(x):
-            return int(32767 * math.tanh(x / 32767.0))
-
-        output_bytes = struct.pack("<" + "h" * len(samples), *[soft_clip(s) for s in samples])
+            return output_bytes
 
-        # Limit logging to avoid spam
         if not hasattr(self, "_mix_count"):
             self._mix_count = 0
         self._mix_count += 1
+        if self._mix_count % 50 == 0:
+            stats = self.native_rx.stats()
+            for key in ("missing", "fec", "accelerate", "expand", "late"):
+                self.jitter_stats[key] = stats.get(key, 0)
         if self._mix_count % 1000 == 0:
-            print(f"[AUDIO] Mixing {active} sources, {self._mix_count} total callbacks")
+            print(f"[AUDIO] Mixing {active} sources natively, {self._mix_count} total callbacks")
 
         return output_bytes
 
@@ -219,34 +306,118 @@ class AudioEngine:
         print(f"[AUDIO] Listening for audio on port {self.port}")
         while self.listen_running:
             try:
-                data, addr = self.recv_sock.recvfrom(4096)
-            except Exception as e:
+                events = self.selector.select(LISTEN_POLL_SEC)
+            except (OSError, ValueError) as e:
+                # A socket closed under the wait (leave_multicast, shutdown)
                 if self.listen_running:
-                    print(f"[AUDIO] recv_sock error: {e}")
+                    print(f"[AUDIO] select error: {e}")
                 continue
+            for key, _mask in events:
+                self._drain(key.fileobj, key.data)
 
-            self._handle_incoming_packet(data, addr)
+    def _drain(self, sock, nack):
+        """Handle what is queued on ``sock``, up to ``RECV_BATCH`` datagrams.
 
-    def _handle_incoming_packet(self, data, addr):
+        Each one is read into a preallocated buffer and handed on as a
+        memoryview; whatever keeps the payload copies it.
+        """
+        for view in self._recv_views:
+            try:
+                length, addr = sock.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if sock.fileno() < 0:
+                    return
+                # Windows reports ICMP port-unreachable as WSAECONNRESET on recv.
+                if self.listen_running:
+                    print(f"[AUDIO] recv error: {e}")
+                continue
+            if length:
+                self._handle_incoming_packet(view[:length], addr, nack)
+
+    def _parse_packet(self, data, addr):
+        """Return ``(sender_id, ssrc, seq, ts, opus, flags)`` or None; accepts binary and legacy text headers.
+
+        ``ssrc`` is None and ``flags`` 0 for legacy text packets.
+        """
+        view = memoryview(data)
+        if is_binary(view):
+            header = unpack_header(view)
+            if header is None:
+                return None
+            _version, flags, seq, ts, ssrc = header
+            if ssrc == self.ssrc:
+                return None
+            sender_id = self.ssrc_names.get(ssrc)
+            if sender_id is None:
+                if self.on_unknown_ssrc is not None:
+                    self.on_unknown_ssrc(ssrc)
+                return None
+            return sender_id, ssrc, seq, ts, view[payload_offset(flags):], flags
+
+        data = bytes(data)
         if b":" not in data:
             print(f"[AUDIO] Malformed packet from {addr}: {data[:50]}")
-            return
+            return None
 
         header, opus = data.split(b":", 1)
         header = header.decode(errors="ignore")
         if "|" not in header:
-            return
+            return None
         sender_id, seq_s, ts_s = header.split("|", 2)
         try:
             seq = int(seq_s) & 0xFFFF
             ts = int(ts_s)
         except ValueError:
+            return None
+        return sender_id.strip(), None, seq, ts, opus, 0
+
+    def _detect_loss(self, ssrc, seq, resume=False):
+        """NACK the seqs skipped between the highest seen and ``seq``.
+
+        With ``resume`` the server dropped the skipped seqs on purpose
+        (active-speaker selection), so there is nothing to ask for.
+        """
+        highest = self.highest_seq.get(ssrc)
+        if highest is None:
+            self.highest_seq[ssrc] = seq
+            return
+        gap = (seq - highest) & 0xFFFF
+        if gap == 0 or gap >= 0x8000:
+            return  # duplicate, reordered or a retransmit
+        self.highest_seq[ssrc] = seq
+        missing = gap - 1
+        if resume or missing == 0 or missing > NACK_MAX_GAP:
+            return
+        first = (highest + 1) & 0xFFFF
+        mask = (1 << (missing - 1)) - 1
+        try:
+            self.recv_sock.sendto(pack_nack(ssrc, first, mask), self.server_addr)
+            self.jitter_stats["nacked"] += missing
+        except OSError as e:
+            print(f"[AUDIO] NACK send error: {e}")
+
+    def _handle_incoming_packet(self, data, addr, nack=True):
+        parsed = self._parse_packet(data, addr)
+        if parsed is None:
             return
-        sender_id = sender_id.strip()
+        sender_id, ssrc, seq, ts, opus, flags = parsed
+        resume = bool(flags & FLAG_RESUME)
 
         if sender_id == self.client_id:
             return
 
+        # Only unicast listeners can NACK: the server answers the address it
+        # forwards to, and a multicast group member is not one of those.
+        if nack and ssrc is not None and ssrc != MIX_SSRC and self.server_addr is not None:
+            self._detect_loss(ssrc, seq, resume)
+        if sender_id != MIX_SENDER:
+            stats = self.recv_stats.get(sender_id)
+            if stats is None:
+                stats = self.recv_stats[sender_id] = ReceiveStats()
+            stats.record(seq, len(opus), resume)
+
         if not hasattr(self, "_packet_count"):
             self._packet_count = {}
 
@@ -260,69 +431,43 @@ class AudioEngine:
         if self._packet_count[sender_id] % 20 == 1:
             print(f"[AUDIO] Received #{self._packet_count[sender_id]} from {sender_id} (size: {len(opus)} bytes)")
 
-        # Always decode & buffer
-        try:
-            pcm = self.codec.decode(opus)
-            if pcm:
-                frame_bytes = CHUNK * 2
-                arrival_time = time.time()
-                with self.stream_lock:
-                    buf = self.streams.setdefault(sender_id, {})
-                    exp_ts = self.playout_ts.get(sender_id)
-                    if exp_ts is not None and ts < exp_ts:
-                        return
-                    buf[seq] = (ts, pcm[:frame_bytes], arrival_time)
-                    if sender_id not in self.expected_seq:
-                        self.expected_seq[sender_id] = seq
-                    if sender_id not in self.playout_ts:
-                        self.playout_ts[sender_id] = ts
-                    if sender_id not in self.jitter_target:
-                        self.jitter_target[sender_id] = TARGET_FRAMES
-
-                    # Jitter estimate (arrival delta vs expected frame time)
-                    if sender_id in self.last_arrival:
-                        delta = arrival_time - self.last_arrival[sender_id]
-                        expected = FRAME / RATE
-                        jitter = abs(delta - expected)
-                        prev = self.jitter_est.get(sender_id, jitter)
-                        self.jitter_est[sender_id] = 0.9 * prev + 0.1 * jitter
-                    self.last_arrival[sender_id] = arrival_time
-
-                    # Adapt jitter target ~1x per second
-                    last_adj = self.last_adjust.get(sender_id, 0)
-                    if arrival_time - last_adj > 1.0:
-                        j = self.jitter_est.get(sender_id, 0)
-                        tgt = self.jitter_target.get(sender_id, TARGET_FRAMES)
-                        if j > 0.020:
-                            tgt = min(MAX_FRAMES, tgt + 1)
-                        elif j < 0.005:
-                            tgt = max(MIN_FRAMES, tgt - 1)
-                        self.jitter_target[sender_id] = tgt
-                        self.last_adjust[sender_id] = arrival_time
-                        if int(arrival_time) % 5 == 0:
-                            print(f"[JITTER] {sender_id}: target={tgt} jitter={j*1000:.1f}ms")
-
-                    # Prevent unbounded growth (drop oldest)
-                    while len(buf) > MAX_FRAMES:
-                        buf.pop(min(buf.keys()))
-            else:
-                print(f"[AUDIO] Failed to decode Opus from {sender_id}")
-        except Exception as e:
-            print(f"[AUDIO] Decode error from {sender_id}: {e}")
+        if self.native_rx is not None:
+            # opus is the tail of data for both header formats.
+            self.native_rx.push(sender_id, seq, ts, data, len(data) - len(opus))
+            return
 
-    def listen_multicast(self):
-        while self.listen_running and self.multicast_running:
-            try:
-                data, addr = self.multicast_sock.recvfrom(4096)
-            except socket.timeout:
+        # Buffer compressed; mix() decodes only what it actually plays.
+        with self.stream_lock:
+            buf = self.streams.get(sender_id)
+            if buf is None:
+                buf = self.streams[sender_id] = PlayoutBuffer(
+                    WINDOW_FRAMES, RATE, FRAME, MIN_FRAMES, MAX_FRAMES, self.jitter_stats
+                )
+            buf.insert(seq, ts, bytes(opus), time.monotonic())
+
+    def receiver_reports(self):
+        """``(sender_id, loss_pct, jitter_ms, kbps)`` per sender heard since the last call."""
+        now = time.monotonic()
+        reports = []
+        for sender_id, stats in list(self.recv_stats.items()):
+            result = stats.report(now)
+            if result is None:
                 continue
-            except Exception as e:
-                if self.listen_running and self.multicast_running:
-                    print(f"[AUDIO] multicast recv error: {e}")
-                break
-            self._handle_incoming_packet(data, addr)
+            loss, kbps = result
+            if self.native_rx is not None:
+                jitter_ms = self.native_rx.jitter_ms(sender_id)
+            else:
+                buf = self.streams.get(sender_id)
+                jitter_ms = int(buf.jitter.jitter * 1000) if buf is not None else 0
+            reports.append((sender_id, int(loss * 100 + 0.5), jitter_ms, int(kbps)))
+        return reports
+
+    def on_receiver_report(self, receiver, loss_pct, jitter_ms, kbps):
+        # Control reader thread; the send loop picks the result up via rate.take().
+        self.rate.on_report(receiver, loss_pct / 100.0, jitter_ms, kbps)
 
-    def join_multicast(self, multicast_addr):
+    def join_multicast(self, multicast_addr, port=AUDIO_PORT):
+        """Receive a room's multicast fallback; ``port`` is the server's audio port."""
         if not multicast_addr:
             return
         if self.multicast_group == multicast_addr and self.multicast_sock is not None:
@@ -336,29 +481,32 @@ class AudioEngine:
                 msock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             except (AttributeError, OSError):
                 pass
-            msock.bind(("", AUDIO_PORT))
+            msock.bind(("", port))
             mreq = struct.pack("4s4s", socket.inet_aton(multicast_addr), socket.inet_aton("0.0.0.0"))
             msock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-            msock.settimeout(1.0)
+            msock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+            msock.setblocking(False)
 
+            # Group members cannot NACK (see _handle_incoming_packet).
+            self.selector.register(msock, selectors.EVENT_READ, False)
             self.multicast_sock = msock
             self.multicast_group = multicast_addr
-            self.multicast_running = True
-            self.multicast_thread = threading.Thread(target=self.listen_multicast, daemon=True)
-            self.multicast_thread.start()
-            print(f"[AUDIO] Joined multicast group {multicast_addr}:{AUDIO_PORT}")
+            print(f"[AUDIO] Joined multicast group {multicast_addr}:{port}")
         except Exception as e:
-            print(f"[AUDIO] Failed to join multicast {multicast_addr}:{AUDIO_PORT}: {e}")
+            print(f"[AUDIO] Failed to join multicast {multicast_addr}:{port}: {e}")
             try:
                 msock.close()
             except Exception:
                 pass
             self.multicast_sock = None
             self.multicast_group = None
-            self.multicast_running = False
 
     def leave_multicast(self):
-        self.multicast_running = False
+        if self.multicast_sock is not None:
+            try:
+                self.selector.unregister(self.multicast_sock)
+            except (KeyError, ValueError):
+                pass
         if self.multicast_sock is not None and self.multicast_group:
             try:
                 mreq = struct.pack("4s4s", socket.inet_aton(self.multicast_group), socket.inet_aton("0.0.0.0"))
@@ -375,12 +523,24 @@ class AudioEngine:
 
     # --------------------------------------------------
 
-    def start(self, server_ip):
+    @staticmethod
+    def frame_dbov(pcm):
+        """Frame level in -dBov (0 = full scale, 127 = digital silence)."""
+        count = len(pcm) // 2
+        if count == 0:
+            return 127
+        samples = np.frombuffer(pcm, np.int16, count).astype(np.float32)
+        rms = math.sqrt(float(np.dot(samples, samples)) / count)
+        if rms < 1.0:
+            return 127
+        return min(127, int(-20.0 * math.log10(rms / 32768.0)))
+
+    def start(self, server_ip, server_port=AUDIO_PORT):
         if self.running or not self.client_id:
             return
 
         self.running = True
-        print(f"[AUDIO] Audio capture ACTIVE for {self.client_id} -> {server_ip}:50002")
+        print(f"[AUDIO] Audio capture ACTIVE for {self.client_id} -> {server_ip}:{server_port}")
 
         self.input = self.audio.open(
             format=pyaudio.paInt16,
@@ -405,15 +565,26 @@ class AudioEngine:
                             print(f"[AUDIO] Echo capture error, disabling echo canceller: {e}")
                             self.echo_enabled = False
 
+                    settings = self.rate.take()
+                    if settings is not None:
+                        self.codec.configure(*settings)
                     opus = self.codec.encode(pcm)
                     if opus:
                         if not self.running or self.send_sock is None:
                             break
-                        header = f"{self.client_id}|{self.seq}|{self.timestamp}".encode()
-                        packet = header + b":" + opus
+                        if self.ssrc is not None:
+                            dbov = self.frame_dbov(pcm)
+                            packet = (
+                                pack_header(FLAG_LEVEL, self.seq, self.timestamp, self.ssrc)
+                                + pack_level(dbov, dbov <= VAD_THRESHOLD_DBOV)
+                                + opus
+                            )
+                        else:
+                            header = f"{self.client_id}|{self.seq}|{self.timestamp}".encode()
+                            packet = header + b":" + opus
                         self.seq = (self.seq + 1) & 0xFFFF
                         self.timestamp += FRAME
-                        self.send_sock.sendto(packet, (server_ip, 50002))
+                        self.send_sock.sendto(packet, (server_ip, server_port))
                         packet_count += 1
                         if packet_count % 100 == 0:
                             print(f"[AUDIO] Sent {packet_count} packets from {self.client_id}")
@@ -455,6 +626,7 @@ class AudioEngine:
         self.running = False
         self.listen_running = False
         self.leave_multicast()
+        self.decoders.stop()
         if self.echo is not None:
             try:
                 self.echo.close()
@@ -464,6 +636,7 @@ class AudioEngine:
             self.echo_enabled = False
 
         try:
+            self.selector.unregister(self.recv_sock)
             self.recv_sock.close()
         except Exception:
             pass
@@ -474,6 +647,10 @@ class AudioEngine:
         except Exception:
             pass
 
+        if self.native_rx is not None:
+            self.native_rx.close()
+            self.native_rx = None
+
         try:
             self.audio.terminate()
         except Exception:
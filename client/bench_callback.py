@@ -0,0 +1,158 @@
+"""Output-callback mix cost as the number of concurrent speakers grows.
+
+Mixes ``--ticks`` frames of random 20 ms PCM from every speaker, once with
+the old per-sample Python loop (unpack, AGC, sum, tanh, pack) and once with
+``StreamMixer``, and reports the time per callback against the 20 ms
+budget. No audio device or libopus needed.
+
+    python bench_callback.py --speakers 1,2,4,8,16,32 --ticks 500
+
+With libopus, a second table times the whole receive callback, decode
+included: the Python path (``DecodePool`` + ``StreamMixer``) against one
+``rx_mix`` call into the native receive engine, when native_mixer.dll
+exports it.
+"""
+
+import argparse
+import math
+import random
+import struct
+import time
+
+from decoder import DecodePool
+from mixing import MAX_GAIN, MIN_GAIN, TARGET_PEAK, StreamMixer
+
+FRAME = 320
+FRAME_MS = 20
+
+
+def _pcm_frames(count, seed):
+    rng = random.Random(seed)
+    amp = 2000 + 8000 * rng.random()
+    return [
+        struct.pack(f"<{FRAME}h", *[int(max(-32768, min(32767, rng.gauss(0, amp)))) for _ in range(FRAME)])
+        for _ in range(count)
+    ]
+
+
+class PythonMixer:
+    """The callback mix as it was before ``StreamMixer``, for reference."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.levels = {}
+
+    def mix(self, streams):
+        frame_bytes = self.frame * 2
+        samples = [0] * self.frame
+        active = 0
+        for sid, pcm in streams:
+            data = struct.unpack("<" + "h" * self.frame, pcm[:frame_bytes])
+            peak = max(abs(s) for s in data) or 1
+            level = 0.9 * self.levels.get(sid, peak) + 0.1 * peak
+            self.levels[sid] = level
+            gain = max(MIN_GAIN, min(MAX_GAIN, TARGET_PEAK / level))
+            data = [int(s * gain) for s in data]
+            samples = [a + b for a, b in zip(samples, data)]
+            active += 1
+        if active == 0:
+            return b"\x00" * frame_bytes, 0
+        return struct.pack("<" + "h" * len(samples), *[int(32767 * math.tanh(x / 32767.0)) for x in samples]), active
+
+
+def bench(mixer, streams, ticks):
+    start = time.perf_counter()
+    for n in range(ticks):
+        mixer.mix([(sid, frames[n % len(frames)]) for sid, frames in streams.items()])
+    return (time.perf_counter() - start) / ticks
+
+
+def _opus_frames(count, seed):
+    from opus_codec import OpusCodec
+
+    encoder = OpusCodec(frame_size=FRAME, create_decoder=False)
+    return [encoder.encode(pcm) for pcm in _pcm_frames(count, seed)]
+
+
+def bench_python_receive(streams, ticks):
+    from opus_codec import OpusCodec
+
+    pool = DecodePool(lambda: OpusCodec(frame_size=FRAME, create_encoder=False), workers=1)
+    mixer = StreamMixer(FRAME)
+    start = time.perf_counter()
+    for n in range(ticks):
+        decoded = pool.decode_many([(sid, frames[n % len(frames)], False) for sid, frames in streams.items()])
+        mixer.mix(list(zip(streams, decoded)))
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    return elapsed / ticks
+
+
+def bench_native_receive(streams, ticks):
+    """Only ``rx_mix`` is timed; pushes happen between callbacks, like the listen thread."""
+    from native_receive import NativeReceiver
+
+    rx = NativeReceiver(16000, FRAME, 16, 1, 6)
+    rx.set_heard(streams)
+    packets = {sid: [bytes(12) + frame for frame in frames] for sid, frames in streams.items()}
+    elapsed = 0.0
+    for n in range(ticks):
+        for sid, frames in packets.items():
+            rx.push(sid, n & 0xFFFF, n * FRAME, frames[n % len(frames)], 12)
+        start = time.perf_counter()
+        rx.mix(FRAME * 2)
+        elapsed += time.perf_counter() - start
+    rx.close()
+    return elapsed / ticks
+
+
+def receive_table(speaker_counts, ticks):
+    try:
+        from native_receive import native_receive_available
+
+        native = native_receive_available()
+    except OSError:
+        native = False
+    print()
+    print(f"ms per {FRAME_MS} ms callback, decode included")
+    print(f"{'speakers':>9}{'python':>18}{'native':>18}")
+    for speakers in speaker_counts:
+        streams = {f"s{i}": _opus_frames(25, i) for i in range(speakers)}
+        old = bench_python_receive(streams, ticks)
+        row = f"{speakers:>9}{1000 * old:>10.3f} ({100 * old * 1000 / FRAME_MS:>5.1f}%)"
+        if native:
+            new = bench_native_receive(streams, ticks)
+            row += f"{1000 * new:>10.3f} ({100 * new * 1000 / FRAME_MS:>5.1f}%)"
+        else:
+            row += f"{'n/a':>18}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--speakers", default="1,2,4,8,16,32")
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"ms per {FRAME_MS} ms output callback (share of the budget)")
+    print(f"{'speakers':>9}{'python':>18}{'numpy':>18}{'speedup':>9}")
+    speaker_counts = [int(x) for x in args.speakers.split(",")]
+    for speakers in speaker_counts:
+        streams = {f"s{i}": _pcm_frames(25, i) for i in range(speakers)}
+        old = bench(PythonMixer(FRAME), streams, args.ticks)
+        new = bench(StreamMixer(FRAME), streams, args.ticks)
+        print(
+            f"{speakers:>9}{1000 * old:>10.3f} ({100 * old * 1000 / FRAME_MS:>5.1f}%)"
+            f"{1000 * new:>10.3f} ({100 * new * 1000 / FRAME_MS:>5.1f}%)"
+            f"{old / new:>8.0f}x"
+        )
+
+    try:
+        import opus_codec  # noqa: F401
+    except OSError:
+        return
+    receive_table(speaker_counts, args.ticks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Client decode throughput as the number of concurrent speakers grows.
+
+Decodes ``--seconds`` of pre-encoded synthetic speech from every speaker,
+once on a single thread and once through ``DecodePool.decode_many`` per
+20 ms tick with each of the ``--workers`` counts, always with one decoder
+per sender. Reports decoded
+frames per second and how many times faster than real time that is.
+Needs libopus.
+
+    python bench_decode.py --speakers 1,2,4,8,16,32 --workers 1,2,4 --seconds 5
+
+The second table is the receive path: CPU per received stream when every
+packet is decoded on arrival vs. only the frames the mixer plays
+(``--heard`` streams of each row, ``--late`` of their frames missed).
+"""
+
+import argparse
+import math
+import random
+import struct
+import time
+
+from decoder import DecodePool
+from opus_codec import OpusCodec
+
+RATE = 16000
+FRAME = 320
+FRAME_SEC = FRAME / RATE
+
+
+def _speech_frames(count, seed):
+    """Opus frames of a wobbling tone plus noise, roughly speech-like in level."""
+    rng = random.Random(seed)
+    encoder = OpusCodec(rate=RATE, frame_size=FRAME, create_decoder=False)
+    freq = 140 + 60 * rng.random()
+    frames = []
+    phase = 0.0
+    for n in range(count):
+        amp = 6000 * (0.6 + 0.4 * math.sin(n / 7.0))
+        samples = []
+        for _ in range(FRAME):
+            phase += 2 * math.pi * freq / RATE
+            samples.append(int(amp * math.sin(phase) + rng.gauss(0, 300)))
+        frames.append(encoder.encode(struct.pack(f"<{FRAME}h", *samples)))
+    return frames
+
+
+def _new_decoder():
+    return OpusCodec(rate=RATE, frame_size=FRAME, create_encoder=False)
+
+
+def bench_serial(streams, ticks):
+    decoders = {sid: _new_decoder() for sid in streams}
+    start = time.perf_counter()
+    for n in range(ticks):
+        for sid, frames in streams.items():
+            decoders[sid].decode(frames[n % len(frames)])
+    return time.perf_counter() - start
+
+
+def bench_pool(streams, ticks, workers):
+    """One ``decode_many`` per 20 ms tick, the way the mixer calls it."""
+    pool = DecodePool(_new_decoder, workers=workers)
+    pool.decode_many([(sid, frames[0], False) for sid, frames in streams.items()])  # create decoders
+    start = time.perf_counter()
+    for n in range(ticks):
+        pool.decode_many([(sid, frames[n % len(frames)], False) for sid, frames in streams.items()])
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    return elapsed
+
+
+def bench_receive(streams, ticks, heard, late):
+    """CPU per received stream: decode on arrival vs. decode at playout.
+
+    Every stream is received, but only ``heard`` of them are played and a
+    ``late`` share of their frames misses playout (dropped late or trimmed).
+    """
+    rng = random.Random(1)
+    played = [sid for i, sid in enumerate(streams) if i < heard]
+    dropped = {(sid, n) for sid in played for n in range(ticks) if rng.random() < late}
+
+    decoders = {sid: _new_decoder() for sid in streams}
+    start = time.process_time()
+    for n in range(ticks):
+        for sid, frames in streams.items():
+            decoders[sid].decode(frames[n % len(frames)])
+    eager = time.process_time() - start
+
+    pool = DecodePool(_new_decoder, workers=1)
+    start = time.process_time()
+    for n in range(ticks):
+        pool.decode_many(
+            [(sid, streams[sid][n % len(streams[sid])], False) for sid in played if (sid, n) not in dropped]
+        )
+    lazy = time.process_time() - start
+    return eager, lazy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--speakers", default="1,2,4,8,16,32")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--heard", type=int, default=4)
+    parser.add_argument("--late", type=float, default=0.05)
+    args = parser.parse_args()
+
+    ticks = int(args.seconds / FRAME_SEC)
+    worker_counts = [int(x) for x in args.workers.split(",")]
+    print(f"{args.seconds:.0f} s of audio per speaker; frames/s (x real time)")
+    print(f"{'speakers':>9}{'serial':>22}" + "".join(f"{f'pool x{w}':>22}" for w in worker_counts))
+    speaker_counts = [int(x) for x in args.speakers.split(",")]
+    all_streams = {n: {f"s{i}": _speech_frames(50, i) for i in range(n)} for n in speaker_counts}
+    for speakers, streams in all_streams.items():
+        frames = ticks * speakers
+        audio_sec = frames * FRAME_SEC
+        row = f"{speakers:>9}"
+        for elapsed in [bench_serial(streams, ticks)] + [bench_pool(streams, ticks, w) for w in worker_counts]:
+            row += f"{frames / elapsed:>14.0f} ({audio_sec / elapsed:>4.0f}x)"
+        print(row)
+
+    print()
+    print(f"receive path, {args.heard} heard, {args.late:.0%} of their frames late; CPU ms per stream-second")
+    print(f"{'streams':>9}{'on arrival':>14}{'at playout':>14}{'saved':>8}")
+    for speakers, streams in all_streams.items():
+        eager, lazy = bench_receive(streams, ticks, args.heard, args.late)
+        stream_sec = speakers * args.seconds
+        print(
+            f"{speakers:>9}{1000 * eager / stream_sec:>14.3f}{1000 * lazy / stream_sec:>14.3f}"
+            f"{1 - lazy / eager:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Playout delay and loss of the jitter buffer under simulated network jitter.
+
+Replays the same packet trace (``--seconds`` of 20 ms frames per profile,
+``--loss`` random loss) through the old playout rules (target stepped one
+frame per second from an arrival-delta average, stall below it) and
+through ``PlayoutBuffer`` (RFC 3550 jitter target, accelerate/expand,
+talk-spurt reset). Reports the mean mouth-to-ear buffering delay, frames
+that arrived but were never played, and the share of ticks that stalled
+or were concealed. Needs NumPy only; "decoding" returns the payload.
+
+    python bench_jitter.py --seconds 60 --loss 0.02
+"""
+
+import argparse
+import random
+
+import numpy as np
+
+from jitter import JitterRing, PlayoutBuffer
+
+RATE = 16000
+FRAME = 320
+FRAME_SEC = FRAME / RATE
+MIN_FRAMES = 2
+MAX_FRAMES = 6
+WINDOW_FRAMES = 16
+
+# name -> (base delay s, mean exponential jitter s, spike probability, spike s)
+PROFILES = {
+    "lan": (0.002, 0.001, 0.0, 0.0),
+    "wifi": (0.005, 0.008, 0.01, 0.060),
+    "congested": (0.020, 0.020, 0.02, 0.100),
+}
+
+
+def _trace(profile, frames, loss, seed):
+    """``[(arrival, seq, ts)]`` in arrival order; frame n is sent at ``n * FRAME_SEC``."""
+    base, mean, spike_p, spike = PROFILES[profile]
+    rng = random.Random(seed)
+    packets = []
+    extra = 0.0
+    last = 0.0
+    for n in range(frames):
+        if rng.random() < spike_p:
+            extra = spike
+        # One queue along the path: packets never overtake each other.
+        last = max(last, n * FRAME_SEC + base + rng.expovariate(1 / mean) + extra)
+        extra = max(0.0, extra - FRAME_SEC)  # a spike drains like a queue
+        if rng.random() >= loss:
+            packets.append((last, n & 0xFFFF, n * FRAME))
+    return packets
+
+
+def _pcm(ts):
+    t = (ts + np.arange(FRAME)) / RATE
+    return (6000 * np.sin(2 * np.pi * 150 * t)).astype(np.int16).tobytes()
+
+
+class FixedBuffer:
+    """The playout rules before ``PlayoutBuffer``, for reference."""
+
+    def __init__(self):
+        self.ring = JitterRing(MAX_FRAMES)
+        self.expected = None
+        self.playout_ts = None
+        self.target = MIN_FRAMES
+        self.jitter = None
+        self.last_arrival = None
+        self.last_adjust = 0.0
+        self.played = 0
+
+    def insert(self, seq, ts, payload, arrival):
+        if self.playout_ts is not None and ts < self.playout_ts:
+            return
+        if not self.ring.insert(seq, ts, payload, arrival):
+            return
+        if self.expected is None:
+            self.expected = seq
+        if self.playout_ts is None:
+            self.playout_ts = ts
+        if self.last_arrival is not None:
+            jitter = abs(arrival - self.last_arrival - FRAME_SEC)
+            self.jitter = jitter if self.jitter is None else 0.9 * self.jitter + 0.1 * jitter
+        self.last_arrival = arrival
+        if arrival - self.last_adjust > 1.0:
+            j = self.jitter or 0.0
+            if j > 0.020:
+                self.target = min(MAX_FRAMES, self.target + 1)
+            elif j < 0.005:
+                self.target = max(MIN_FRAMES, self.target - 1)
+            self.last_adjust = arrival
+
+    def tick(self):
+        """``(pcm or None, media ts of the frame played or None)``."""
+        if not len(self.ring) or self.expected is None or len(self.ring) < self.target:
+            return None, None
+        exp = self.expected
+        self.expected = (exp + 1) & 0xFFFF
+        frame = self.ring.pop(exp)
+        if frame is not None:
+            ts, payload = frame
+            if ts < self.playout_ts:
+                return None, None
+            self.playout_ts = ts + FRAME
+            self.played += 1
+            return payload, ts
+        self.playout_ts += FRAME
+        return bytes(FRAME * 2), self.playout_ts - FRAME
+
+
+def run_fixed(packets, ticks, phase):
+    buf = FixedBuffer()
+    delays, silent, i = [], 0, 0
+    for k in range(ticks):
+        now = phase + k * FRAME_SEC
+        while i < len(packets) and packets[i][0] <= now:
+            arrival, seq, ts = packets[i]
+            buf.insert(seq, ts, _pcm(ts), arrival)
+            i += 1
+        pcm, ts = buf.tick()
+        if pcm is None:
+            silent += buf.expected is not None
+        else:
+            delays.append(now - ts / RATE)
+    return delays, silent, buf.played, {}
+
+
+def run_adaptive(packets, ticks, phase):
+    stats = {}
+    buf = PlayoutBuffer(WINDOW_FRAMES, RATE, FRAME, MIN_FRAMES, MAX_FRAMES, stats)
+    delays, silent, played, i = [], 0, 0, 0
+    for k in range(ticks):
+        now = phase + k * FRAME_SEC
+        while i < len(packets) and packets[i][0] <= now:
+            arrival, seq, ts = packets[i]
+            buf.insert(seq, ts, _pcm(ts), arrival)
+            i += 1
+        jobs, action = buf.plan()
+        played += sum(1 for opus, fec in jobs if opus is not None and not fec)
+        buf.play([opus if opus is not None else bytes(FRAME * 2) for opus, _fec in jobs], action)
+        if buf.take() is None or buf.concealed:
+            silent += buf.expected is not None
+        elif buf.playing and buf.playout_ts is not None:
+            # The next frame to decode starts at playout_ts; the fifo plays before it.
+            media = buf.playout_ts - len(buf.fifo) // 2 - FRAME
+            delays.append(now - media / RATE)
+    return delays, silent, played, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--loss", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    frames = int(args.seconds / FRAME_SEC)
+    print(f"{args.seconds:.0f} s per profile, {args.loss:.0%} random loss")
+    print(f"{'profile':>10}{'buffer':>10}{'delay ms':>10}{'late':>8}{'stalled':>9}  stretch")
+    for profile in PROFILES:
+        packets = _trace(profile, frames, args.loss, args.seed)
+        phase = 0.5 * FRAME_SEC
+        for name, run in (("fixed", run_fixed), ("adaptive", run_adaptive)):
+            delays, silent, played, stats = run(packets, frames, phase)
+            late = (len(packets) - played) / len(packets)
+            stretch = f"{stats['accelerate']} acc / {stats['expand']} exp" if stats else ""
+            print(
+                f"{profile:>10}{name:>10}{1000 * sum(delays) / max(1, len(delays)):>10.1f}"
+                f"{late:>8.1%}{silent / frames:>9.1%}  {stretch}"
+            )
+
+
+if __name__ == "__main__":
+    main()
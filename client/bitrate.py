@@ -0,0 +1,140 @@
+import threading
+import time
+
+REPORT_INTERVAL_SEC = 2.0
+REPORT_MAX_GAP = 25           # longer seq jumps are suppression or a restart, not loss
+REPORT_STALE_SEC = 3 * REPORT_INTERVAL_SEC
+
+MIN_BITRATE = 12000
+MAX_BITRATE = 48000
+START_BITRATE = 32000
+INCREASE = 1.08               # per step on a clean link
+LOSS_LOW = 0.02               # below: probe upwards
+LOSS_HIGH = 0.10              # above: back off
+JITTER_HIGH_MS = 30           # queues are building; hold the rate
+FEC_LOSS = 0.01               # turn in-band FEC on at this loss
+MAX_LOSS_PERC = 30
+
+
+class ReceiveStats:
+    """Per-sender counters behind one receiver report (RFC 3550 style).
+
+    ``record`` runs on the audio listen thread and ``report`` on the
+    report thread; both only touch plain numbers under ``lock``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.highest = None     # extended highest seq
+        self.received = 0
+        self.bytes = 0
+        self.base = None        # extended seq the current interval starts after
+        self.base_received = 0
+        self.base_bytes = 0
+        self.base_time = time.monotonic()
+
+    def record(self, seq, size, resume=False):
+        """Count one packet; ``resume`` (``FLAG_RESUME``) says the seq gap before it is not loss."""
+        with self.lock:
+            if self.highest is None:
+                self.highest = seq
+                self.base = seq - 1
+            else:
+                gap = (seq - self.highest) & 0xFFFF
+                if gap == 0 or gap >= 0x8000:
+                    pass  # duplicate, reordered or a retransmit
+                elif resume or gap > REPORT_MAX_GAP:
+                    # Start the interval over instead of reporting it as loss.
+                    self.highest += gap
+                    self.base = self.highest - 1
+                    self.base_received = self.received
+                    self.base_bytes = self.bytes
+                else:
+                    self.highest += gap
+            self.received += 1
+            self.bytes += size
+
+    def report(self, now):
+        """``(loss_fraction, kbps)`` since the last report, or None if nothing arrived."""
+        with self.lock:
+            if self.highest is None:
+                return None
+            expected = self.highest - self.base
+            received = self.received - self.base_received
+            size = self.bytes - self.base_bytes
+            elapsed = now - self.base_time
+            self.base = self.highest
+            self.base_received = self.received
+            self.base_bytes = self.bytes
+            self.base_time = now
+        if received <= 0 or elapsed <= 0:
+            return None
+        loss = max(0, expected - received) / expected if expected > 0 else 0.0
+        return loss, size * 8 / elapsed / 1000
+
+
+class BitrateController:
+    """Sender-side loss-based rate control from the listeners' reports.
+
+    Reports come in on the control thread; every ``REPORT_INTERVAL_SEC``
+    the worst fresh report sets the next encoder settings. The encoder is
+    only touched from the send thread, which calls ``take`` before each
+    frame and applies what it returns.
+    """
+
+    def __init__(self, bitrate=START_BITRATE, min_bitrate=MIN_BITRATE, max_bitrate=MAX_BITRATE):
+        self.min_bitrate = min_bitrate
+        self.max_bitrate = max_bitrate
+        self.bitrate = bitrate
+        self.fec = True
+        self.loss_perc = 5
+        self.reports = {}       # receiver id -> (loss, jitter_ms, kbps, time)
+        self.last_step = 0.0
+        self.changed = True
+        self.lock = threading.Lock()
+
+    def on_report(self, receiver, loss, jitter_ms, kbps, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.reports[receiver] = (loss, jitter_ms, kbps, now)
+            if now - self.last_step >= REPORT_INTERVAL_SEC:
+                self.last_step = now
+                self._step(now)
+
+    def _step(self, now):
+        fresh = [r for r in self.reports.values() if now - r[3] <= REPORT_STALE_SEC]
+        self.reports = {k: r for k, r in self.reports.items() if now - r[3] <= REPORT_STALE_SEC}
+        if not fresh:
+            return
+        loss = max(r[0] for r in fresh)
+        jitter_ms = max(r[1] for r in fresh)
+        kbps = min(r[2] for r in fresh)
+
+        bitrate = self.bitrate
+        if loss > LOSS_HIGH:
+            bitrate *= 1 - 0.5 * loss
+            if kbps > 0:
+                # What actually got through is a better guess at the bottleneck.
+                bitrate = min(bitrate, kbps * 1000 * 1.05)
+        elif loss < LOSS_LOW and jitter_ms < JITTER_HIGH_MS:
+            bitrate *= INCREASE
+        bitrate = int(max(self.min_bitrate, min(self.max_bitrate, bitrate)))
+        fec = loss >= FEC_LOSS
+        loss_perc = min(MAX_LOSS_PERC, int(loss * 100 + 0.5) + (2 if fec else 0))
+
+        if (bitrate, fec, loss_perc) != (self.bitrate, self.fec, self.loss_perc):
+            if abs(bitrate - self.bitrate) >= 4000 or fec != self.fec:
+                print(
+                    f"[BITRATE] {self.bitrate // 1000} -> {bitrate // 1000} kbit/s "
+                    f"(loss {loss * 100:.1f}%, jitter {jitter_ms} ms, fec {'on' if fec else 'off'})"
+                )
+            self.bitrate, self.fec, self.loss_perc = bitrate, fec, loss_perc
+            self.changed = True
+
+    def take(self):
+        """New ``(bitrate, fec, loss_perc)`` for the encoder, or None if unchanged."""
+        if not self.changed:
+            return None
+        with self.lock:
+            self.changed = False
+            return self.bitrate, self.fec, self.loss_perc
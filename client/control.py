@@ -0,0 +1,180 @@
+import socket
+import threading
+
+CONTROL_PORT = 50001
+SESSION_VERSION = 1
+
+
+def send_control_command(server_ip, command, timeout=5.0, port=CONTROL_PORT):
+    ctrl = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    ctrl.settimeout(timeout)
+    try:
+        ctrl.connect((server_ip, port))
+        ctrl.sendall((command + "\n").encode())
+        response = ctrl.recv(1024).decode(errors="ignore").strip()
+        return True, response
+    except Exception as e:
+        return False, str(e)
+    finally:
+        ctrl.close()
+
+
+class OneShotControl:
+    """Fallback for servers without sessions: one TCP connection per command."""
+
+    persistent = False
+
+    def __init__(self, server_ip, port=CONTROL_PORT):
+        self.server_ip = server_ip
+        self.port = port
+
+    def request(self, command, timeout=5.0):
+        return send_control_command(self.server_ip, command, timeout=timeout, port=self.port)
+
+    def close(self):
+        pass
+
+
+class ControlSession:
+    """Long-lived control connection carrying framed requests and server events.
+
+    Requests go out as ``#<rid> <command>`` and the matching response comes
+    back as ``#<rid> <response>``, so several threads can share the
+    connection. Lines starting with ``EVENT:`` are pushed by the server and
+    handed to ``on_event`` on the reader thread.
+    """
+
+    persistent = True
+
+    def __init__(self, server_ip, on_event=None, on_close=None, port=CONTROL_PORT):
+        self.server_ip = server_ip
+        self.port = port
+        self.on_event = on_event
+        self.on_close = on_close
+        self.sock = None
+        self.connected = False
+        self._next_rid = 1
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = None
+
+    @classmethod
+    def open(cls, server_ip, on_event=None, on_close=None, timeout=3.0, port=CONTROL_PORT):
+        """Return a connected session, or a OneShotControl if the server predates sessions."""
+        session = cls(server_ip, on_event=on_event, on_close=on_close, port=port)
+        try:
+            if session.connect(timeout=timeout):
+                return session
+        except OSError as e:
+            print(f"[CONTROL] Session connect failed: {e}")
+        session.close()
+        print("[CONTROL] Server does not support sessions, using one-shot commands")
+        return OneShotControl(server_ip, port=port)
+
+    def connect(self, timeout=3.0):
+        sock = socket.create_connection((self.server_ip, self.port), timeout=timeout)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(f"#0 HELLO:{SESSION_VERSION}\n".encode())
+        reply = self._read_line(sock, timeout)
+        if not reply.startswith("#0 OK"):
+            sock.close()
+            return False
+        sock.settimeout(None)
+        self.sock = sock
+        self.connected = True
+        self._reader = threading.Thread(target=self._read_loop, daemon=True, name="control-session")
+        self._reader.start()
+        return True
+
+    @staticmethod
+    def _read_line(sock, timeout):
+        sock.settimeout(timeout)
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(1)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode(errors="ignore").strip()
+
+    def request(self, command, timeout=5.0):
+        if not self.connected:
+            return False, "session closed"
+        slot = [threading.Event(), None]
+        with self._lock:
+            rid = self._next_rid
+            self._next_rid += 1
+            self._pending[rid] = slot
+        try:
+            self.sock.sendall(f"#{rid} {command}\n".encode())
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(rid, None)
+            self._handle_close()
+            return False, str(e)
+        if not slot[0].wait(timeout):
+            with self._lock:
+                self._pending.pop(rid, None)
+            return False, "timeout"
+        if slot[1] is None:
+            return False, "session closed"
+        return True, slot[1]
+
+    def _read_loop(self):
+        buf = b""
+        try:
+            while self.connected:
+                chunk = self.sock.recv(4096)
+                if not chunk:
+                    break
+                buf += chunk
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    self._dispatch(line.decode(errors="ignore").strip())
+        except OSError:
+            pass
+        self._handle_close()
+
+    def _dispatch(self, line):
+        if line.startswith("#"):
+            rid_s, _, response = line[1:].partition(" ")
+            try:
+                rid = int(rid_s)
+            except ValueError:
+                return
+            with self._lock:
+                slot = self._pending.pop(rid, None)
+            if slot is not None:
+                slot[1] = response
+                slot[0].set()
+        elif line.startswith("EVENT:") and self.on_event is not None:
+            try:
+                self.on_event(line.split(":")[1:])
+            except Exception as e:
+                print(f"[CONTROL] Event handler error: {e}")
+
+    def _handle_close(self):
+        with self._lock:
+            was_connected = self.connected
+            self.connected = False
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for slot in pending:
+            slot[0].set()
+        if was_connected and self.on_close is not None:
+            self.on_close()
+
+    def close(self):
+        self.on_close = None
+        self.connected = False
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
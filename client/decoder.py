@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+import time
+import zlib
+
+DECODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+DECODER_IDLE_SEC = 30.0       # a sender silent this long gets a fresh decoder next time
+PARALLEL_MIN_FRAMES = 4       # fewer frames per tick decode faster inline than handed off
+SWEEP_SEC = 5.0
+
+
+class _Decoder:
+    __slots__ = ("codec", "last_used")
+
+    def __init__(self, codec, now):
+        self.codec = codec
+        self.last_used = now
+
+
+class _Worker:
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.queue = queue.SimpleQueue()
+        self.decoders = {}  # sender_id -> _Decoder, only for senders of this shard
+        self.thread = threading.Thread(target=self.run, daemon=True, name=f"decode-{index}")
+
+    def decode(self, sender_id, opus, fec, now):
+        decoder = self.decoders.get(sender_id)
+        if decoder is None:
+            decoder = self.decoders[sender_id] = _Decoder(self.pool.new_codec(), now)
+        decoder.last_used = now
+        try:
+            return decoder.codec.decode(opus, fec)
+        except Exception as e:
+            print(f"[AUDIO] Decode error from {sender_id}: {e}")
+            return b""
+
+    def decode_into(self, items, results, now):
+        for index, sender_id, opus, fec in items:
+            results[index] = self.decode(sender_id, opus, fec, now)
+
+    def sweep(self, now):
+        for sender_id in [s for s, d in self.decoders.items() if now - d.last_used > self.pool.idle_sec]:
+            del self.decoders[sender_id]
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            items, results, now, latch = job
+            self.decode_into(items, results, now)
+            latch.done()
+
+
+class _Latch:
+    __slots__ = ("lock", "count", "event")
+
+    def __init__(self, count):
+        self.lock = threading.Lock()
+        self.count = count
+        self.event = threading.Event()
+
+    def done(self):
+        with self.lock:
+            self.count -= 1
+            if self.count == 0:
+                self.event.set()
+
+
+class DecodePool:
+    """One Opus decoder per sender, decoded at playout on a few worker threads.
+
+    Opus decoders carry prediction and PLC state, so each sender gets its
+    own, created on its first decoded frame and dropped after ``idle_sec``.
+    Only the mixer calls ``decode_many``, once per tick, with the frames it
+    is about to play. Senders are sharded over the workers by id; the
+    caller decodes one shard itself and waits for the rest. ctypes drops
+    the GIL inside ``opus_decode``, so the shards really run in parallel.
+    """
+
+    def __init__(self, new_codec, workers=DECODE_WORKERS, idle_sec=DECODER_IDLE_SEC):
+        self.new_codec = new_codec
+        self.idle_sec = idle_sec
+        self.workers = [_Worker(self, i) for i in range(max(1, workers))]
+        self.last_sweep = time.monotonic()
+        for worker in self.workers[1:]:
+            worker.thread.start()
+
+    def _worker(self, sender_id):
+        return self.workers[zlib.crc32(sender_id.encode()) % len(self.workers)]
+
+    def decode_many(self, frames):
+        """PCM for each ``(sender_id, opus, fec)``; ``opus`` None asks for a PLC frame.
+
+        ``fec`` recovers the frame before ``opus`` from its in-band FEC data.
+        A failed decode yields ``b""`` in its slot.
+        """
+        now = time.monotonic()
+        if now - self.last_sweep >= SWEEP_SEC:
+            for worker in self.workers:
+                worker.sweep(now)
+            self.last_sweep = now
+
+        results = [b""] * len(frames)
+        if len(self.workers) == 1 or len(frames) < PARALLEL_MIN_FRAMES:
+            for index, (sender_id, opus, fec) in enumerate(frames):
+                results[index] = self._worker(sender_id).decode(sender_id, opus, fec, now)
+            return results
+
+        shards = {}
+        for index, (sender_id, opus, fec) in enumerate(frames):
+            shards.setdefault(self._worker(sender_id), []).append((index, sender_id, opus, fec))
+        inline = shards.pop(self.workers[0], None)
+        latch = _Latch(len(shards))
+        for worker, items in shards.items():
+            worker.queue.put((items, results, now, latch))
+        if inline:
+            self.workers[0].decode_into(inline, results, now)
+        if shards:
+            latch.event.wait()
+        return results
+
+    def stop(self):
+        for worker in self.workers[1:]:
+            worker.queue.put(None)
@@ -0,0 +1,296 @@
+import math
+
+from timestretch import PITCH_MAX, accelerate, expand
+
+RESTART_GAP = 1000            # a seq this far behind means the sender started over
+RESTART_FRAMES = 50           # so does a timestamp this many frames behind playout
+JITTER_MULT = 4               # target delay covers this many interarrival jitter estimates
+LEVEL_GAIN = 0.1              # smoothing of the buffer level the stretch decisions use
+MAX_CONCEAL_FRAMES = 3        # concealed frames with nothing buffered before a talk spurt ends
+
+# What a playout tick does with the frames it pops
+PLAY = "play"
+ACCELERATE = "accelerate"
+EXPAND = "expand"
+
+
+class JitterRing:
+    """One sender's jitter buffer: a fixed ring of slots indexed by ``seq mod capacity``.
+
+    Holds at most ``window`` consecutive seqs ending at the newest one
+    received; inserting a newer seq evicts whatever fell out of the window,
+    so the buffer never needs trimming. Seqs are 16-bit and compared with
+    wraparound, so the ring capacity is a power of two (it divides 65536)
+    and at least ``window``. All operations are O(1) and store into
+    preallocated lists.
+    """
+
+    __slots__ = ("window", "mask", "seqs", "timestamps", "payloads", "arrivals", "newest", "count")
+
+    def __init__(self, window):
+        capacity = 1
+        while capacity < window:
+            capacity <<= 1
+        self.window = window
+        self.mask = capacity - 1
+        self.seqs = [-1] * capacity
+        self.timestamps = [0] * capacity
+        self.payloads = [None] * capacity
+        self.arrivals = [0.0] * capacity
+        self.newest = None
+        self.count = 0
+
+    def reset(self):
+        for i in range(len(self.seqs)):
+            self._clear(i)
+        self.newest = None
+
+    def __len__(self):
+        return self.count
+
+    def _clear(self, i):
+        if self.seqs[i] >= 0:
+            self.seqs[i] = -1
+            self.payloads[i] = None
+            self.count -= 1
+
+    def insert(self, seq, timestamp, payload, arrival):
+        """Store a frame; False if it is a duplicate or already out of the window."""
+        newest = self.newest
+        seqs = self.seqs
+        if newest is None:
+            self.newest = seq
+        else:
+            ahead = (seq - newest) & 0xFFFF
+            if ahead == 1:
+                # In-order arrival: exactly one seq leaves the window.
+                out = (seq - self.window) & 0xFFFF
+                i = out & self.mask
+                if seqs[i] == out:
+                    seqs[i] = -1
+                    self.payloads[i] = None
+                    self.count -= 1
+                self.newest = seq
+            elif 0 < ahead < 0x8000:
+                # Advance the window; slots of seqs that fall out of it are freed.
+                window = self.window
+                gone = newest - window + 1
+                for k in range(ahead if ahead < window else window):
+                    out = (gone + k) & 0xFFFF
+                    i = out & self.mask
+                    if seqs[i] == out:
+                        seqs[i] = -1
+                        self.payloads[i] = None
+                        self.count -= 1
+                self.newest = seq
+            else:
+                behind = -ahead & 0xFFFF
+                if behind >= RESTART_GAP:
+                    self.reset()
+                    self.newest = seq
+                elif behind >= self.window:
+                    return False
+        i = seq & self.mask
+        if seqs[i] == seq:
+            return False
+        if seqs[i] < 0:
+            self.count += 1
+        seqs[i] = seq
+        self.timestamps[i] = timestamp
+        self.payloads[i] = payload
+        self.arrivals[i] = arrival
+        return True
+
+    def oldest(self):
+        """Lowest buffered seq, or None if empty."""
+        if not self.count:
+            return None
+        for k in range(self.window - 1, -1, -1):
+            seq = (self.newest - k) & 0xFFFF
+            if self.seqs[seq & self.mask] == seq:
+                return seq
+        return None
+
+    def __contains__(self, seq):
+        return self.seqs[seq & self.mask] == seq
+
+    def peek(self, seq):
+        """Payload of ``seq`` without removing it, or None."""
+        i = seq & self.mask
+        return self.payloads[i] if self.seqs[i] == seq else None
+
+    def pop(self, seq):
+        """``(timestamp, payload)`` of ``seq``, removed from the ring; None if absent."""
+        i = seq & self.mask
+        seqs = self.seqs
+        if seqs[i] != seq:
+            return None
+        seqs[i] = -1
+        self.count -= 1
+        payload = self.payloads[i]
+        self.payloads[i] = None
+        return self.timestamps[i], payload
+
+
+class InterarrivalJitter:
+    """RFC 3550 (section 6.4.1) interarrival jitter of one sender, in seconds.
+
+    Arrival times come from the monotonic clock, so wall-clock steps never
+    show up as jitter.
+    """
+
+    __slots__ = ("rate", "jitter", "last_arrival", "last_ts")
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.jitter = 0.0
+        self.last_arrival = None
+        self.last_ts = 0
+
+    def update(self, arrival, timestamp):
+        if self.last_arrival is not None:
+            sent = ((timestamp - self.last_ts + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+            d = (arrival - self.last_arrival) - sent / self.rate
+            self.jitter += (abs(d) - self.jitter) / 16
+        self.last_arrival = arrival
+        self.last_ts = timestamp
+
+
+class PlayoutBuffer:
+    """NetEq-style adaptive playout for one sender.
+
+    The target delay follows the interarrival jitter. The buffer converges
+    on it by time-stretching decoded speech (``timestretch``) instead of
+    dropping frames or stalling: two frames are played in less time when
+    it runs above target, and one is stretched when it runs below. A packet
+    that is merely late is concealed without skipping it. After
+    ``MAX_CONCEAL_FRAMES`` with nothing buffered the talk spurt is over,
+    and the next one starts from the current target.
+
+    ``insert`` and ``plan`` run under the engine's stream lock; ``play``
+    and ``take`` only on the mixer thread.
+    """
+
+    def __init__(self, window, rate, frame, min_frames, max_frames, stats=None):
+        self.ring = JitterRing(window)
+        self.jitter = InterarrivalJitter(rate)
+        self.frame = frame
+        self.frame_sec = frame / rate
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.target = min_frames
+        self.playing = False
+        self.expected = None
+        self.playout_ts = None
+        self.level = 0.0
+        self.concealed = 0
+        self.fifo = bytearray()     # decoded PCM not yet played
+        self.stats = stats if stats is not None else {}     # may be shared by every sender
+        for key in ("missing", "fec", "accelerate", "expand", "late"):
+            self.stats.setdefault(key, 0)
+
+    def insert(self, seq, timestamp, payload, arrival):
+        """Buffer a frame; False if it is late, a duplicate or out of the window."""
+        if self.playout_ts is not None:
+            behind = (self.playout_ts - timestamp) & 0xFFFFFFFF
+            if 0 < behind < 0x80000000:
+                if behind < RESTART_FRAMES * self.frame:
+                    self.stats["late"] += 1
+                    return False
+                # The timestamp started over: so did the sender.
+                self.ring.reset()
+                self.playing = False
+                self.playout_ts = None
+        if not self.ring.insert(seq, timestamp, payload, arrival):
+            return False
+        self.jitter.update(arrival, timestamp)
+        target = math.ceil(JITTER_MULT * self.jitter.jitter / self.frame_sec) + 1
+        self.target = max(self.min_frames, min(self.max_frames, target))
+        return True
+
+    def _next(self):
+        """``(opus, fec)`` for the next frame (``opus`` None: conceal), or None if nothing is buffered."""
+        ring = self.ring
+        while True:
+            exp = self.expected
+            frame = ring.pop(exp)
+            if frame is not None:
+                ts, opus = frame
+                self.expected = (exp + 1) & 0xFFFF
+                if self.playout_ts is not None and 0 < (self.playout_ts - ts) & 0xFFFFFFFF < 0x80000000:
+                    self.stats["late"] += 1
+                    continue
+                self.playout_ts = (ts + self.frame) & 0xFFFFFFFF
+                return opus, False
+            if not len(ring):
+                return None  # late rather than lost: conceal it without moving on
+            behind = (ring.newest - exp) & 0xFFFF
+            if ring.window <= behind < 0x8000:
+                # Everything up to the oldest buffered frame fell out of the window.
+                oldest = ring.oldest()
+                self.stats["missing"] += (oldest - exp) & 0xFFFF
+                self.expected = oldest
+                continue
+            self.expected = (exp + 1) & 0xFFFF
+            self.playout_ts = (self.playout_ts + self.frame) & 0xFFFFFFFF
+            self.stats["missing"] += 1
+            following = ring.peek(self.expected)
+            if following is not None:
+                # Rebuild the lost frame from the next packet's FEC; that
+                # packet stays buffered and plays normally afterwards.
+                self.stats["fec"] += 1
+                return following, True
+            return None, False
+
+    def plan(self):
+        """``(jobs, action)`` for this tick: the ``(opus, fec)`` frames to decode for ``play``."""
+        if len(self.fifo) >= self.frame * 2:
+            return [], PLAY
+        ring = self.ring
+        if not self.playing:
+            if len(ring) < self.target:
+                return [], PLAY
+            # Talk spurt start: playout begins at the current target delay.
+            self.playing = True
+            self.expected = ring.oldest()
+            self.playout_ts = None
+            self.concealed = 0
+            self.level = float(len(ring))
+
+        self.level += LEVEL_GAIN * (len(ring) + len(self.fifo) / (self.frame * 2) - self.level)
+        job = self._next()
+        if job is None:
+            self.concealed += 1
+            if self.concealed > MAX_CONCEAL_FRAMES:
+                self.playing = False
+                self.fifo.clear()
+                return [], PLAY
+            return [(None, False)], PLAY
+        self.concealed = 0
+        if self.level > self.target + 0.5:
+            second = self._next()
+            if second is not None:
+                self.stats["accelerate"] += 1
+                return [job, second], ACCELERATE
+        elif self.level < self.target - 1:
+            self.stats["expand"] += 1
+            return [job], EXPAND
+        return [job], PLAY
+
+    def play(self, decoded, action):
+        """Queue the decoded frames of this tick's ``plan``, stretched as it decided."""
+        pcm = b"".join(decoded)
+        if action == ACCELERATE and len(pcm) >= 4 * PITCH_MAX:
+            pcm = accelerate(pcm)
+        elif action == EXPAND and pcm:
+            pcm = expand(pcm)
+        self.fifo += pcm
+
+    def take(self):
+        """One frame of PCM for the mix, or None if this sender is silent this tick."""
+        size = self.frame * 2
+        if len(self.fifo) < size:
+            return None
+        pcm = bytes(self.fifo[:size])
+        del self.fifo[:size]
+        return pcm
@@ -1,6 +1,5 @@
 import faulthandler
 import os
-import socket
 import sys
 import time
 import threading
@@ -10,34 +9,55 @@ from PySide6.QtWidgets import QApplication, QDialog, QMainWindow
 from PySide6.QtCore import QTimer
 
 from audio import AudioEngine
-from network import Network
+from bitrate import REPORT_INTERVAL_SEC
+from control import ControlSession
+from network import AUDIO_PORT, CONTROL_PORT, Network
+from packet import AUDIO_VERSION
 from startup_dialog import ServerIPDialog, StartupDialog
 from voice_ui import Ui_project1
 
 ACTIVE = "QPushButton { background:#2ecc71; color:white; }"
 INACTIVE = "QPushButton { background:#dddddd; }"
 SELF = "QPushButton { background:#3498db; color:white; }"
-CONTROL_PORT = 50001
 DEFAULT_ROOM = "main"
 REGISTER_SECRET = os.getenv("VOICE_REGISTER_SECRET", "mysecret")
+ROSTER_REFRESH_MIN_SEC = 1.0
+# Opt-in for low-power listeners: the server decodes and mixes, we play one stream.
+SERVER_MIX = os.getenv("VOICE_SERVER_MIX", "") == "1"
+
+
+def fetch_roster(control):
+    """Return ``{ssrc: client_id}`` from the server's ROSTER command."""
+    ok, response = control.request("ROSTER", timeout=3.0)
+    if not ok or not response.startswith("OK"):
+        return None
+    roster = {}
+    _, _, entries = response.partition(":")
+    for entry in entries.split(","):
+        cid, sep, ssrc = entry.partition("=")
+        if not sep:
+            continue
+        try:
+            roster[int(ssrc)] = cid
+        except ValueError:
+            continue
+    return roster
 
 
-def send_control_command(server_ip, command, timeout=5.0):
-    ctrl = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    ctrl.settimeout(timeout)
-    try:
-        ctrl.connect((server_ip, CONTROL_PORT))
-        ctrl.sendall((command + "\n").encode())
-        response = ctrl.recv(1024).decode(errors="ignore").strip()
-        return True, response
-    except Exception as e:
-        return False, str(e)
-    finally:
-        ctrl.close()
+def request_server_mix(control, client_id, hear_targets=None):
+    """Ask the server to mix for us; ``hear_targets`` None means everyone."""
+    command = f"MIX:{client_id}:ON"
+    if hear_targets is not None:
+        command += ":" + ",".join(sorted(hear_targets))
+    ok, response = control.request(command, timeout=3.0)
+    if not ok or response != "OK":
+        print(f"[CLIENT] Server-side mixing not available: {response}")
+        return False
+    return True
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, my_id, server_ip, audio):
+    def __init__(self, my_id, server_ip, audio, control, control_port=CONTROL_PORT, audio_port=AUDIO_PORT):
         super().__init__()
         self.ui = Ui_project1()
         self.ui.setupUi(self)
@@ -45,7 +65,10 @@ class MainWindow(QMainWindow):
 
         self.my_id = my_id
         self.server_ip = server_ip
+        self.control_port = control_port
+        self.audio_port = audio_port
         self.audio = audio
+        self.control = control
         self.audio.client_id = my_id
         self.targets = set()
         self.registration_successful = True
@@ -88,8 +111,17 @@ class MainWindow(QMainWindow):
         self.ui.statusbar.showMessage(f"You are Client {self.my_id} - Connected")
 
         self.audio.set_hear_targets(self.hear_targets)
+        if self.audio.mixed:
+            request_server_mix(self.control, self.my_id, self.hear_targets)
+        self._roster_lock = threading.Lock()
+        self._last_roster_fetch = 0.0
+        self.audio.on_unknown_ssrc = self.request_roster
+        self.control.on_event = self.handle_control_event
+        self.control.on_close = self._on_control_closed
         self._hb_stop = threading.Event()
+        self._hb_wake = threading.Event()
         threading.Thread(target=self.heartbeat_loop, daemon=True, name="heartbeat").start()
+        threading.Thread(target=self.report_loop, daemon=True, name="reports").start()
         self._stop_capture_timer = QTimer(self)
         self._stop_capture_timer.setSingleShot(True)
         self._stop_capture_timer.setInterval(1200)
@@ -139,6 +171,8 @@ class MainWindow(QMainWindow):
             btn.setStyleSheet(INACTIVE)
 
         self.audio.set_hear_targets(self.hear_targets)
+        if self.audio.mixed:
+            request_server_mix(self.control, self.my_id, self.hear_targets)
 
     def update_targets(self):
         if not self.registration_successful:
@@ -147,13 +181,13 @@ class MainWindow(QMainWindow):
         if self.targets and not self.audio.running:
             if self._stop_capture_timer.isActive():
                 self._stop_capture_timer.stop()
-            self.audio.start(self.server_ip)
+            self.audio.start(self.server_ip, self.audio_port)
         elif not self.targets and self.audio.running and not self._stop_capture_timer.isActive():
             # Debounce stop to avoid capture churn when users quickly toggle targets.
             self._stop_capture_timer.start()
 
         targets = ",".join(sorted(self.targets))
-        ok, response = send_control_command(self.server_ip, f"TARGETS:{self.my_id}:{targets}")
+        ok, response = self.control.request(f"TARGETS:{self.my_id}:{targets}")
         if not ok or response != "OK":
             print(f"[CLIENT] Failed to update targets: {response}")
             self.ui.statusbar.showMessage(f"You are Client {self.my_id} - Connection issue")
@@ -162,12 +196,101 @@ class MainWindow(QMainWindow):
         if not self.targets and self.audio.running:
             self.audio.stop()
 
+    def request_roster(self, _ssrc=None):
+        # Called from the audio listen thread; never block it on the network.
+        now = time.time()
+        if now - self._last_roster_fetch < ROSTER_REFRESH_MIN_SEC:
+            return
+        if not self._roster_lock.acquire(blocking=False):
+            return
+        self._last_roster_fetch = now
+        threading.Thread(target=self._refresh_roster, daemon=True, name="roster").start()
+
+    def _refresh_roster(self):
+        try:
+            roster = fetch_roster(self.control)
+            if roster is not None:
+                self.audio.update_roster(roster)
+        finally:
+            self._roster_lock.release()
+
+    def handle_control_event(self, fields):
+        # Runs on the control session reader thread.
+        kind = fields[0] if fields else ""
+        if kind == "ADD" and len(fields) == 3:
+            try:
+                ssrc = int(fields[2])
+            except ValueError:
+                return
+            names = dict(self.audio.ssrc_names)
+            names[ssrc] = fields[1]
+            self.audio.update_roster(names)
+            print(f"[CLIENT] {fields[1]} joined (ssrc={ssrc})")
+        elif kind == "REMOVE" and len(fields) == 2:
+            names = {ssrc: cid for ssrc, cid in self.audio.ssrc_names.items() if cid != fields[1]}
+            self.audio.update_roster(names)
+            print(f"[CLIENT] {fields[1]} left")
+        elif kind == "ROOM" and len(fields) == 3:
+            print(f"[CLIENT] {fields[1]} is in room {fields[2]}")
+        elif kind == "REPORT" and len(fields) == 5:
+            try:
+                loss_pct, jitter_ms, kbps = (int(x) for x in fields[2:5])
+            except ValueError:
+                return
+            self.audio.on_receiver_report(fields[1], loss_pct, jitter_ms, kbps)
+
+    def _on_control_closed(self):
+        self._hb_wake.set()
+
+    def _reconnect(self):
+        control = ControlSession.open(
+            self.server_ip,
+            on_event=self.handle_control_event,
+            on_close=self._on_control_closed,
+            port=self.control_port,
+        )
+        registered, _multicast_addr, ssrc = register_client_with_server(self.my_id, control, self.audio.port)
+        if not registered:
+            control.close()
+            return False
+        self.control = control
+        self.audio.ssrc = ssrc
+        roster = fetch_roster(control)
+        if roster:
+            self.audio.update_roster(roster)
+        targets = ",".join(sorted(self.targets))
+        control.request(f"TARGETS:{self.my_id}:{targets}")
+        if self.audio.mixed:
+            request_server_mix(control, self.my_id, self.hear_targets)
+        print("[CLIENT] Control session re-established")
+        return True
+
     def heartbeat_loop(self):
+        # With a control session this is one small frame on the open connection.
         while not self._hb_stop.is_set():
-            ok, response = send_control_command(self.server_ip, f"PING:{self.my_id}", timeout=3.0)
+            self._hb_wake.clear()
+            if self.control.persistent and not self.control.connected:
+                print("[CLIENT] Control session lost, reconnecting...")
+                if not self._reconnect():
+                    self._hb_stop.wait(2.0)
+                    continue
+            ok, response = self.control.request(f"PING:{self.my_id}", timeout=3.0)
             if not ok or response != "OK":
                 print(f"[CLIENT] Heartbeat failed: {response}")
-            self._hb_stop.wait(10.0)
+            self._hb_wake.wait(10.0)
+
+    def report_loop(self):
+        # Receiver reports reach senders as events, so they need a session.
+        while not self._hb_stop.wait(REPORT_INTERVAL_SEC):
+            if not self.control.persistent or not self.control.connected:
+                continue
+            reports = self.audio.receiver_reports()
+            if not reports:
+                continue
+            entries = ",".join(f"{sid}={loss}/{jitter}/{kbps}" for sid, loss, jitter, kbps in reports)
+            ok, response = self.control.request(f"REPORT:{self.my_id}:{entries}", timeout=3.0)
+            if not ok or response != "OK":
+                print(f"[CLIENT] Receiver report failed: {response}")
 
     def broadcast(self):
         if not self.registration_successful:
@@ -191,10 +314,12 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         try:
             self._hb_stop.set()
+            self._hb_wake.set()
             if self._stop_capture_timer.isActive():
                 self._stop_capture_timer.stop()
-            send_control_command(self.server_ip, f"UNREGISTER:{self.my_id}")
+            self.control.request(f"UNREGISTER:{self.my_id}")
             print(f"[CLIENT] Sent unregistration: {self.my_id}")
+            self.control.close()
         except Exception as e:
             print(f"[CLIENT] Unregistration error: {e}")
 
@@ -202,38 +327,44 @@ class MainWindow(QMainWindow):
         event.accept()
 
 
-def register_client_with_server(client_id, server_ip, audio_port):
+def register_client_with_server(client_id, control, audio_port):
     try:
-        ok, response = send_control_command(
-            server_ip,
-            f"REGISTER:{client_id}:{audio_port}:{REGISTER_SECRET}",
+        ok, response = control.request(
+            f"REGISTER:{client_id}:{audio_port}:{REGISTER_SECRET}:{AUDIO_VERSION}",
         )
         if not ok:
             print(f"[CLIENT] Registration error: {response}")
-            return False, None
+            return False, None, None
 
         if response == "TAKEN":
             print(f"[CLIENT] Client ID {client_id} already taken")
-            return False, None
-
-        if response != "OK":
+            return False, None, None
+
+        # Older servers answer a bare OK and only understand text audio headers.
+        ssrc = None
+        if response.startswith("OK:"):
+            try:
+                ssrc = int(response.split(":", 1)[1])
+            except ValueError:
+                ssrc = None
+        elif response != "OK":
             print(f"[CLIENT] Unexpected registration response: {response}")
-            return False, None
+            return False, None, None
 
-        join_ok, join_response = send_control_command(server_ip, f"JOIN:{client_id}:{DEFAULT_ROOM}")
+        join_ok, join_response = control.request(f"JOIN:{client_id}:{DEFAULT_ROOM}")
         if not join_ok or not join_response.startswith("OK"):
             print(f"[CLIENT] JOIN failed for client {client_id}: {join_response}")
-            return False, None
+            return False, None, None
 
         multicast_addr = None
         if ":" in join_response:
             _, multicast_addr = join_response.split(":", 1)
 
-        print(f"[CLIENT] Registration successful for client {client_id}")
-        return True, multicast_addr
+        print(f"[CLIENT] Registration successful for client {client_id} (ssrc={ssrc})")
+        return True, multicast_addr, ssrc
     except Exception as e:
         print(f"[CLIENT] Registration error: {e}")
-        return False, None
+        return False, None, None
 
 
 def main():
@@ -290,7 +421,7 @@ def main():
     else:
         print(f"[CLIENT] Server found at: {net.server_ip}")
 
-    dlg = StartupDialog(net.server_ip, 0)
+    dlg = StartupDialog(net.server_ip, net.audio_port)
     if not dlg.exec():
         print("[CLIENT] User cancelled client setup, exiting")
         sys.exit(0)
@@ -303,7 +434,8 @@ def main():
     print(f"[CLIENT] Audio engine initialized on port {audio_port}")
 
     print("[CLIENT] Registering with server...")
-    registered, multicast_addr = register_client_with_server(client_id, net.server_ip, audio_port)
+    control = ControlSession.open(net.server_ip, port=net.control_port)
+    registered, multicast_addr, ssrc = register_client_with_server(client_id, control, audio_port)
     if not registered:
         from PySide6.QtWidgets import QMessageBox
 
@@ -313,15 +445,27 @@ def main():
         msg.setText(f"Client ID {client_id} is already in use or registration failed!")
         msg.setInformativeText("Please choose a different client ID and try again.")
         msg.exec()
+        control.close()
         audio.stop()
         sys.exit(1)
-    if multicast_addr:
-        audio.join_multicast(multicast_addr.strip())
+    net.remember()
+    audio.ssrc = ssrc
+    if ssrc is not None:
+        audio.server_addr = (net.server_ip, net.audio_port)
+        roster = fetch_roster(control)
+        if roster:
+            audio.update_roster(roster)
+    if SERVER_MIX and ssrc is not None and request_server_mix(control, client_id):
+        # The mix already contains the room; joining the group would double it.
+        audio.enable_server_mix()
+        print("[CLIENT] Receiving server-side mix")
+    elif multicast_addr:
+        audio.join_multicast(multicast_addr.strip(), net.audio_port)
 
     print("[CLIENT] Registration successful - starting UI...")
 
     try:
-        w = MainWindow(client_id, net.server_ip, audio)
+        w = MainWindow(client_id, net.server_ip, audio, control, net.control_port, net.audio_port)
         w.show()
         print("[CLIENT] Client ready")
         sys.exit(app.exec())
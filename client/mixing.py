@@ -0,0 +1,62 @@
+import numpy as np
+
+# Per-stream AGC targets
+TARGET_PEAK = 12000
+MAX_GAIN = 3.0
+MIN_GAIN = 0.5
+
+# The soft limiter is 32767 * tanh(x / 32767) looked up per sample; sums
+# beyond +-LIMITER_RANGE are past tanh(4) and saturate anyway.
+LIMITER_RANGE = 4 * 32768
+LIMITER_LUT = np.round(
+    32767.0 * np.tanh(np.arange(-LIMITER_RANGE, LIMITER_RANGE, dtype=np.float64) / 32767.0)
+).astype(np.int16)
+
+
+class StreamMixer:
+    """Per-stream AGC, mix and soft limiter for one output frame, vectorized.
+
+    All working buffers are allocated once; ``mix`` only views the decoded
+    PCM in place, accumulates into float32 and reads the limiter table, so
+    the only allocation per call is the returned ``bytes``.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.levels = {}    # sender_id -> EMA of peak
+        self.acc = np.zeros(frame, dtype=np.float32)
+        self.scaled = np.zeros(frame, dtype=np.float32)
+        self.index = np.zeros(frame, dtype=np.int32)
+        self.out = np.zeros(frame, dtype=np.int16)
+        self.silence = bytes(frame * 2)
+
+    def mix(self, streams):
+        """Mix ``[(sender_id, pcm_bytes)]`` into one frame of int16 bytes."""
+        frame = self.frame
+        acc = self.acc
+        acc.fill(0.0)
+        active = 0
+        for sid, pcm in streams:
+            if len(pcm) < frame * 2:
+                continue
+            samples = np.frombuffer(pcm, dtype=np.int16, count=frame)
+            peak = max(int(samples.max()), -int(samples.min())) or 1
+
+            # Per-stream AGC (EMA on peak)
+            level = 0.9 * self.levels.get(sid, peak) + 0.1 * peak
+            self.levels[sid] = level
+            gain = max(MIN_GAIN, min(MAX_GAIN, TARGET_PEAK / level))
+
+            np.multiply(samples, np.float32(gain), out=self.scaled)
+            np.add(acc, self.scaled, out=acc)
+            active += 1
+
+        if active == 0:
+            return self.silence, 0
+
+        # Soft limiter to prevent clipping without shrinking everything
+        np.clip(acc, -LIMITER_RANGE, LIMITER_RANGE - 1, out=acc)
+        np.add(acc, LIMITER_RANGE, out=acc)
+        np.copyto(self.index, acc, casting="unsafe")
+        np.take(LIMITER_LUT, self.index, out=self.out)
+        return self.out.tobytes(), active
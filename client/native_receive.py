@@ -0,0 +1,119 @@
+import ctypes
+import threading
+from ctypes import POINTER, c_char, c_int, c_int16, c_uint32, c_uint64, c_void_p
+
+from native_mixer import _dll as _native_dll
+
+_RX_API = ("rx_create", "rx_destroy", "rx_push", "rx_set_heard", "rx_mix", "rx_get_stats", "rx_jitter_ms")
+_STATS = ("received", "missing", "fec", "late", "dropped", "accelerate", "expand")
+
+
+if _native_dll is not None and all(hasattr(_native_dll, name) for name in _RX_API):
+    _native_dll.rx_create.argtypes = [c_int, c_int, c_int, c_int, c_int]
+    _native_dll.rx_create.restype = c_void_p
+
+    _native_dll.rx_destroy.argtypes = [c_void_p]
+    _native_dll.rx_destroy.restype = None
+
+    _native_dll.rx_push.argtypes = [c_void_p, c_uint32, c_int, c_uint32, c_void_p, c_int, c_int]
+    _native_dll.rx_push.restype = c_int
+
+    _native_dll.rx_set_heard.argtypes = [c_void_p, POINTER(c_uint32), c_int]
+    _native_dll.rx_set_heard.restype = c_int
+
+    _native_dll.rx_mix.argtypes = [c_void_p, POINTER(c_int16), c_int]
+    _native_dll.rx_mix.restype = c_int
+
+    _native_dll.rx_get_stats.argtypes = [c_void_p, POINTER(c_uint64), c_int]
+    _native_dll.rx_get_stats.restype = c_int
+
+    _native_dll.rx_jitter_ms.argtypes = [c_void_p, c_uint32]
+    _native_dll.rx_jitter_ms.restype = c_int
+
+
+def native_receive_available():
+    if _native_dll is None:
+        return False
+    return all(hasattr(_native_dll, name) for name in _RX_API)
+
+
+class NativeReceiver:
+    """Adaptive jitter buffers, Opus decode, AGC and mix in native_mixer.dll.
+
+    The listen thread pushes packets and the output callback makes one
+    ``rx_mix`` call per period; ctypes releases the GIL for both, and the
+    engine only locks its jitter buffers, never across decode or mix.
+    Sender ids get engine numbers in ``set_heard`` and lose them when they
+    leave the heard set, so sender churn does not grow the map; a sender
+    heard again gets a new number and starts from a fresh stream.
+    """
+
+    def __init__(self, sample_rate, frame_size, window, min_frames, max_frames):
+        self.frame_size = int(frame_size)
+        self.slots = {}     # heard sender_id -> engine sender number
+        self.next_slot = 0
+        self._slot_lock = threading.Lock()
+        self._handle = _native_dll.rx_create(
+            int(sample_rate), self.frame_size, int(window), int(min_frames), int(max_frames)
+        )
+        if not self._handle:
+            raise RuntimeError("Failed to create native receive engine")
+        self._out = (c_int16 * self.frame_size)()
+        self._stats = (c_uint64 * len(_STATS))()
+
+    def close(self):
+        if self._handle:
+            _native_dll.rx_destroy(self._handle)
+            self._handle = None
+
+    def push(self, sender_id, seq, timestamp, packet, offset):
+        """Buffer the payload at ``packet[offset:]``; False if dropped (late, duplicate, unheard).
+
+        ``packet`` is bytes or a writable buffer (the receive loop's
+        memoryviews); the engine copies the payload, so neither is kept.
+        """
+        slot = self.slots.get(sender_id)
+        if slot is None or not self._handle:
+            return False
+        length = len(packet)
+        if not isinstance(packet, bytes):
+            packet = (c_char * length).from_buffer(packet)
+        return bool(_native_dll.rx_push(self._handle, slot, seq, timestamp, packet, offset, length))
+
+    def set_heard(self, sender_ids):
+        if not self._handle:
+            return
+        with self._slot_lock:
+            heard = {}
+            for sid in sender_ids:
+                slot = self.slots.get(sid)
+                if slot is None:
+                    self.next_slot += 1
+                    slot = self.next_slot
+                heard[sid] = slot
+            # Published whole: push() and jitter_ms() read it unlocked.
+            self.slots = heard
+        slots = list(heard.values())
+        _native_dll.rx_set_heard(self._handle, (c_uint32 * len(slots))(*slots), len(slots))
+
+    def mix(self, frame_bytes):
+        """``(pcm_bytes, active)`` for the next output period."""
+        samples = frame_bytes // 2
+        if not self._handle:
+            return bytes(frame_bytes), 0
+        if samples > len(self._out):
+            self._out = (c_int16 * samples)()
+        active = _native_dll.rx_mix(self._handle, self._out, samples)
+        return ctypes.string_at(self._out, frame_bytes), active
+
+    def stats(self):
+        if not self._handle:
+            return {}
+        n = _native_dll.rx_get_stats(self._handle, self._stats, len(_STATS))
+        return dict(zip(_STATS[:n], self._stats[:n]))
+
+    def jitter_ms(self, sender_id):
+        slot = self.slots.get(sender_id)
+        if slot is None or not self._handle:
+            return 0
+        return _native_dll.rx_jitter_ms(self._handle, slot)
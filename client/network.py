@@ -1,74 +1,179 @@
+import errno
+import json
+import os
+import selectors
 import socket
 import time
 
 DISCOVERY_PORT = 50000
+CONTROL_PORT = 50001
+AUDIO_PORT = 50002
+PROBE_PORT = 50004            # servers answer VOICE_DISCOVER here, not on DISCOVERY_PORT
 DISCOVERY_MAGIC = b"VOICE_SERVER"
 DISCOVER_REQUEST = b"VOICE_DISCOVER"
+PROBE_INTERVAL_SEC = 0.25     # first re-probe; doubles up to PROBE_INTERVAL_MAX_SEC
+PROBE_INTERVAL_MAX_SEC = 2.0
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".voice_app", "last_server.json")
+COMMON_GATEWAYS = ["192.168.1.1", "192.168.0.1", "10.0.0.1", "192.168.1.255", "192.168.0.255"]
+
+
+def parse_announcement(data):
+    """``VOICE_SERVER[:<version>:<control_port>:<audio_port>]`` -> ``(version, control, audio)``."""
+    if data == DISCOVERY_MAGIC:
+        return 0, CONTROL_PORT, AUDIO_PORT
+    if not data.startswith(DISCOVERY_MAGIC + b":"):
+        return None
+    try:
+        version, control_port, audio_port = (int(x) for x in data.split(b":")[1:4])
+    except ValueError:
+        return None
+    return version, control_port, audio_port
+
 
 class Network:
-    def __init__(self):
+    def __init__(self, cache_path=CACHE_PATH):
         self.server_ip = None
+        self.control_port = CONTROL_PORT
+        self.audio_port = AUDIO_PORT
+        self.server_version = 0
+        self.cache_path = cache_path
 
-    def discover(self, timeout=10):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def load_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached["ip"], int(cached.get("control_port", CONTROL_PORT)), int(cached.get("audio_port", AUDIO_PORT))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
 
-        # Allow multiple clients on same machine
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        # Allow multiple processes to bind to same port (for discovery)
+    def remember(self):
+        """Store the current server as last-known, for a fast probe on the next start."""
+        if not self.server_ip:
+            return
         try:
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        except (AttributeError, OSError):
-            # SO_REUSEPORT not available on Windows, that's OK
-            pass
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"ip": self.server_ip, "control_port": self.control_port, "audio_port": self.audio_port},
+                    f,
+                )
+        except OSError as e:
+            print(f"[DISCOVERY] Could not save last server: {e}")
+
+    def _found(self, ip, control_port, audio_port, version, how):
+        self.server_ip = ip
+        self.control_port = control_port
+        self.audio_port = audio_port
+        self.server_version = version
+        print(f"✅ Server found via {how}: {ip} (control {control_port}, audio {audio_port})")
+
+    def discover(self, timeout=10):
+        """Find a server, trying every strategy at once; the first answer wins.
+
+        - a ``LIST`` over a non-blocking TCP connection to the cached
+          last-known server
+        - ``VOICE_DISCOVER`` probes (broadcast, cached IP, common gateways)
+          from an ephemeral socket; servers answer them immediately by unicast
+        - listening on the discovery port for the periodic broadcast
+        """
+        start = time.monotonic()
+        sel = selectors.DefaultSelector()
+        opened = []
 
+        cached = self.load_cache()
+        if cached is not None:
+            tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            tcp.setblocking(False)
+            opened.append(tcp)
+            err = tcp.connect_ex((cached[0], cached[1]))
+            if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", -1)):
+                sel.register(tcp, selectors.EVENT_WRITE, "cache")
+            print(f"[DISCOVERY] Probing last server {cached[0]}:{cached[1]}")
+
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        opened.append(probe)
+        probe.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         # DSCP EF (46 << 2 = 184)
         try:
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, 184)
+            probe.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, 184)
         except OSError:
             pass
+        probe.setblocking(False)
+        sel.register(probe, selectors.EVENT_READ, "probe")
+        probe_targets = [("<broadcast>", PROBE_PORT)]
+        if cached is not None:
+            probe_targets.append((cached[0], PROBE_PORT))
+        probe_targets += [(gateway, PROBE_PORT) for gateway in COMMON_GATEWAYS]
 
-        sock.settimeout(0.5)
-
-        # Bind to port 50000 to receive server broadcasts
+        listen = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        opened.append(listen)
+        # Allow multiple clients on same machine
+        listen.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listen.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        except (AttributeError, OSError):
+            # SO_REUSEPORT not available on Windows, that's OK
+            pass
         try:
-            sock.bind(("", DISCOVERY_PORT))
-            print(f"[DISCOVERY] Bound to port {DISCOVERY_PORT}")
+            listen.bind(("", DISCOVERY_PORT))
+            listen.setblocking(False)
+            sel.register(listen, selectors.EVENT_READ, "broadcast")
         except OSError as e:
-            print(f"[DISCOVERY] Bind failed: {e} - using manual IP entry instead")
-            return
+            print(f"[DISCOVERY] Bind to {DISCOVERY_PORT} failed: {e} - relying on probes")
 
-        start = time.time()
         print("🔍 Discovering server...")
-
-        while time.time() - start < timeout:
-            try:
-                data, addr = sock.recvfrom(1024)
-                print(f"[DISCOVERY] Received from {addr}: {data!r}")
-                if data == DISCOVERY_MAGIC:
-                    self.server_ip = addr[0]
-                    print("✅ Server found:", self.server_ip)
+        interval = PROBE_INTERVAL_SEC
+        next_probe = start
+        try:
+            while self.server_ip is None:
+                now = time.monotonic()
+                if now - start >= timeout:
                     break
-            except socket.timeout:
-                # Active probe with multiple strategies for cross-subnet discovery
-                try:
-                    # Strategy 1: Broadcast to local subnet
-                    print(f"[DISCOVERY] Sending broadcast probe to port {DISCOVERY_PORT}")
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                    sock.sendto(DISCOVER_REQUEST, ("<broadcast>", DISCOVERY_PORT))
-                    
-                    # Strategy 2: Direct probe to common gateway IPs
-                    common_gateways = ["192.168.1.1", "192.168.0.1", "10.0.0.1", "192.168.1.255", "192.168.0.255"]
-                    for gateway in common_gateways:
+                if now >= next_probe:
+                    for target in probe_targets:
                         try:
-                            sock.sendto(DISCOVER_REQUEST, (gateway, DISCOVERY_PORT))
-                        except:
+                            probe.sendto(DISCOVER_REQUEST, target)
+                        except OSError:
                             pass
-                            
-                except OSError as e:
-                    print(f"[DISCOVERY] Probe send failed: {e}")
-
-        sock.close()
+                    next_probe = now + interval
+                    interval = min(interval * 2, PROBE_INTERVAL_MAX_SEC)
+                wait = max(0.0, min(next_probe, start + timeout) - now)
+                for key, _ in sel.select(wait):
+                    if key.data == "cache":
+                        # Connected: ask something harmless so the server answers and closes.
+                        try:
+                            if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                                key.fileobj.send(b"LIST\n")
+                                sel.modify(key.fileobj, selectors.EVENT_READ, "cache reply")
+                                continue
+                        except OSError:
+                            pass
+                        sel.unregister(key.fileobj)
+                        continue
+                    if key.data == "cache reply":
+                        sel.unregister(key.fileobj)
+                        try:
+                            reply = key.fileobj.recv(4096)
+                        except OSError:
+                            continue
+                        if reply:
+                            self._found(cached[0], cached[1], cached[2], 0, "cached server")
+                            break
+                        continue
+                    try:
+                        data, addr = key.fileobj.recvfrom(1024)
+                    except OSError:
+                        continue
+                    announced = parse_announcement(data)
+                    if announced is not None:
+                        self._found(addr[0], announced[1], announced[2], announced[0], key.data)
+                        break
+        finally:
+            sel.close()
+            for sock in opened:
+                sock.close()
 
-        if not self.server_ip:
+        if self.server_ip:
+            print(f"[DISCOVERY] Took {1000 * (time.monotonic() - start):.0f} ms")
+        else:
             print("❌ Server discovery timed out - will prompt for manual IP")
@@ -1,4 +1,5 @@
 import ctypes
+import ctypes.util
 from ctypes import c_int, c_void_p, c_ubyte, POINTER, c_short
 import os
 
@@ -13,6 +14,10 @@ candidates = [
     os.path.join(os.path.dirname(__file__), "..", "opus", "opus.dll"),
     "opus.dll",
 ]
+# Non-Windows hosts (e.g. a Linux server doing mixing) use the system libopus.
+system_opus = ctypes.util.find_library("opus")
+if system_opus:
+    candidates.append(system_opus)
 
 last_exc = None
 for p in candidates:
@@ -126,6 +131,12 @@ class OpusCodec:
         except Exception as e:
             print(f"[OPUS] encoder_ctl unavailable request={request}: {e}")
 
+    def configure(self, bitrate, enable_fec, packet_loss_perc):
+        """Retune a running encoder; call from the thread that encodes."""
+        self._set_encoder_ctl_int(OPUS_SET_BITRATE_REQUEST, bitrate)
+        self._set_encoder_ctl_int(OPUS_SET_INBAND_FEC_REQUEST, 1 if enable_fec else 0)
+        self._set_encoder_ctl_int(OPUS_SET_PACKET_LOSS_PERC_REQUEST, packet_loss_perc)
+
     def encode(self, pcm_bytes):
         if not self.encoder:
             return b""
@@ -141,13 +152,14 @@ class OpusCodec:
             return b""
         return bytes(out[:size])
 
-    def decode(self, opus_bytes):
+    def decode(self, opus_bytes, fec=False):
+        """PCM for ``opus_bytes``; with ``fec`` the frame *before* it, from its in-band FEC data."""
         if not self.decoder:
             return b""
         pcm = (c_short * self.frame_size)()
         if opus_bytes:
             buf = (c_ubyte * len(opus_bytes)).from_buffer_copy(opus_bytes)
-            n = opus.opus_decode(self.decoder, buf, len(opus_bytes), pcm, self.frame_size, 0)
+            n = opus.opus_decode(self.decoder, buf, len(opus_bytes), pcm, self.frame_size, 1 if fec else 0)
         else:
             # ← IMPROVED: PLC with fade (Opus handles this internally, but we can post-process if needed)
             n = opus.opus_decode(self.decoder, None, 0, pcm, self.frame_size, 0)
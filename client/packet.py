@@ -0,0 +1,85 @@
+import struct
+
+# Binary audio header (network byte order, 12 bytes):
+#   magic/version (1) | flags (1) | seq (2) | timestamp (4) | ssrc (4)
+# The high nibble of the first byte is the magic, the low nibble the version.
+# Legacy text packets start with a printable client ID, so they never carry
+# the magic nibble.
+#
+# With FLAG_LEVEL set, one audio level byte follows the header (RFC 6464
+# style): the high bit is the sender's VAD decision and the low 7 bits the
+# frame level in -dBov (0 = full scale, 127 = silence).
+#
+# A packet with FLAG_NACK is a receiver asking the server to resend lost
+# packets (RFC 4585 generic NACK): the header carries the media SSRC and the
+# first lost seq, and a 16-bit bitmask follows in which bit i marks seq + 1 + i
+# as lost too.
+#
+# The server sets FLAG_RESUME on the first packet it forwards from a sender
+# after dropping some of its packets for the active-speaker selection: the
+# seq gap before that packet is not loss.
+AUDIO_MAGIC = 0xA0
+AUDIO_VERSION = 1
+MAGIC_MASK = 0xF0
+VERSION_MASK = 0x0F
+AUDIO_HEADER = struct.Struct("!BBHII")
+NACK_MASK = struct.Struct("!H")
+HEADER_SIZE = AUDIO_HEADER.size
+MAGIC_BYTE = AUDIO_MAGIC | AUDIO_VERSION
+
+# SSRC 0 is never assigned to a client; it marks the server's mixed stream.
+MIX_SSRC = 0
+
+FLAG_LEVEL = 0x01
+FLAG_NACK = 0x02
+FLAG_RESUME = 0x04
+LEVEL_VOICE = 0x80
+LEVEL_MASK = 0x7F
+
+
+def is_binary(packet):
+    return len(packet) > 0 and (packet[0] & MAGIC_MASK) == AUDIO_MAGIC
+
+
+def pack_header(flags, seq, timestamp, ssrc):
+    return AUDIO_HEADER.pack(MAGIC_BYTE, flags, seq & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc)
+
+
+def unpack_header(packet):
+    """Return ``(version, flags, seq, timestamp, ssrc)`` or None if too short/unknown."""
+    if len(packet) < HEADER_SIZE:
+        return None
+    magic_version, flags, seq, timestamp, ssrc = AUDIO_HEADER.unpack_from(packet)
+    version = magic_version & VERSION_MASK
+    if version == 0 or version > AUDIO_VERSION:
+        return None
+    return version, flags, seq, timestamp, ssrc
+
+
+def pack_level(dbov, voice):
+    return bytes(((LEVEL_VOICE if voice else 0) | min(LEVEL_MASK, max(0, int(dbov))),))
+
+
+def unpack_level(packet, flags):
+    """Return ``(dbov, voice)`` from the level byte, or None if the packet carries none."""
+    if not flags & FLAG_LEVEL or len(packet) <= HEADER_SIZE:
+        return None
+    level = packet[HEADER_SIZE]
+    return level & LEVEL_MASK, bool(level & LEVEL_VOICE)
+
+
+def payload_offset(flags):
+    return HEADER_SIZE + 1 if flags & FLAG_LEVEL else HEADER_SIZE
+
+
+def pack_nack(ssrc, first_seq, mask):
+    return pack_header(FLAG_NACK, first_seq, 0, ssrc) + NACK_MASK.pack(mask & 0xFFFF)
+
+
+def unpack_nack(packet):
+    """Return the list of seqs a NACK asks for (empty if malformed)."""
+    if len(packet) < HEADER_SIZE + NACK_MASK.size:
+        return []
+    first = AUDIO_HEADER.unpack_from(packet)[2]
+    (mask,) = NACK_MASK.unpack_from(packet, HEADER_SIZE)
+    return [first] + [(first + 1 + i) & 0xFFFF for i in range(16) if mask >> i & 1]
@@ -0,0 +1,71 @@
+class PlayoutRing:
+    """Rendered output frames between the mixer thread and the audio callback.
+
+    Single producer, single consumer, no lock: only the producer advances
+    ``tail`` and only the consumer advances ``head``, each after touching
+    the slot, so neither ever waits on the other.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0    # next frame to play; written by the consumer only
+        self.tail = 0    # next slot to fill; written by the producer only
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def push(self, frame):
+        tail = self.tail
+        if tail - self.head >= self.capacity:
+            return False
+        self.slots[tail % self.capacity] = frame
+        self.tail = tail + 1
+        return True
+
+    def pop(self):
+        head = self.head
+        if head == self.tail:
+            return None
+        i = head % self.capacity
+        frame = self.slots[i]
+        self.slots[i] = None
+        self.head = head + 1
+        return frame
+
+
+class CallbackTimer:
+    """Time spent inside the audio callback, and how often it had nothing to play.
+
+    ``record`` runs on the audio thread; ``snapshot`` reads from any other
+    thread and starts a new window for the maximum.
+    """
+
+    def __init__(self):
+        self.callbacks = 0
+        self.underruns = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_callbacks = 0
+        self.last_total = 0.0
+
+    def record(self, elapsed, underrun):
+        self.callbacks += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if underrun:
+            self.underruns += 1
+
+    def snapshot(self):
+        callbacks, total, peak = self.callbacks, self.total, self.max
+        self.max = 0.0
+        window = callbacks - self.last_callbacks
+        avg = (total - self.last_total) / window if window else 0.0
+        self.last_callbacks, self.last_total = callbacks, total
+        return {
+            "callbacks": callbacks,
+            "underruns": self.underruns,
+            "avg_us": int(avg * 1e6),
+            "max_us": int(peak * 1e6),
+        }
@@ -2,4 +2,4 @@ from network import Network
 
 net = Network()
 net.discover()
-print("Server IP:", net.server_ip)
\ No newline at end of file
+print("Server IP:", net.server_ip, "control", net.control_port, "audio", net.audio_port)
\ No newline at end of file
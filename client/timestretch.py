@@ -0,0 +1,58 @@
+import numpy as np
+
+# WSOLA-style time-scale modification of decoded 16 kHz speech: one pitch
+# period is cut out (accelerate) or repeated (expand) with a crossfade, so
+# the jitter buffer can drain or build up without skipping or stalling.
+PITCH_MIN = 40          # samples: 400 Hz
+PITCH_MAX = 160         # samples: 100 Hz
+OVERLAP = 160           # template and crossfade length (10 ms)
+MATCH_MIN = 0.6         # weaker periodicity than this would make the splice audible
+SILENCE_PEAK = 400      # below this a frame is background noise; any splice is inaudible
+
+_FADE_IN = np.linspace(0.0, 1.0, OVERLAP, dtype=np.float32)
+_FADE_OUT = _FADE_IN[::-1].copy()
+
+
+def _period(x):
+    """Best pitch period of ``x`` near its start, or None if it is not periodic enough."""
+    if np.abs(x[: PITCH_MAX + OVERLAP]).max() < SILENCE_PEAK:
+        return PITCH_MAX
+    template = x[:OVERLAP]
+    search = x[PITCH_MIN : PITCH_MAX + OVERLAP]
+    corr = np.correlate(search, template, mode="valid")
+    energy = np.cumsum(np.concatenate(([0.0], search.astype(np.float64) ** 2)))
+    window = energy[OVERLAP:] - energy[:-OVERLAP]
+    norm = np.sqrt(np.maximum(window * float(np.dot(template, template)), 1e-9))
+    score = corr / norm
+    best = int(np.argmax(score))
+    if score[best] < MATCH_MIN:
+        return None
+    return PITCH_MIN + best
+
+
+def accelerate(pcm):
+    """``pcm`` with one pitch period removed; needs ``2 * PITCH_MAX`` samples. Unchanged if unvoiced-but-loud."""
+    x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    if len(x) < PITCH_MAX + OVERLAP:
+        return pcm
+    p = _period(x)
+    if p is None:
+        return pcm
+    # Fade from x[0:] into x[p:], which continues the same waveform one period later.
+    splice = x[:OVERLAP] * _FADE_OUT + x[p : p + OVERLAP] * _FADE_IN
+    out = np.concatenate((splice, x[p + OVERLAP :]))
+    return out.astype(np.int16).tobytes()
+
+
+def expand(pcm):
+    """``pcm`` with one pitch period repeated; unchanged if it has no clear period."""
+    x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    if len(x) < PITCH_MAX + OVERLAP:
+        return pcm
+    p = _period(x)
+    if p is None:
+        return pcm
+    # After x[:p] comes a second copy of the first period, faded from x[p:] back into x[0:].
+    splice = x[p : p + OVERLAP] * _FADE_OUT + x[:OVERLAP] * _FADE_IN
+    out = np.concatenate((x[:p], splice, x[OVERLAP:]))
+    return out.astype(np.int16).tobytes()
@@ -0,0 +1,154 @@
+"""Packets-per-second benchmark: batched ForwardingEngine vs. per-packet asyncio tasks.
+
+Runs entirely on loopback. A generator process blasts text-header audio
+packets from ``--talkers`` senders; every talker targets ``--fanout``
+listener sockets that are bound but never read (the kernel drops the
+overflow, which is fine for measuring the forwarder itself).
+
+    python bench_forward.py --talkers 50 --fanout 3 --duration 5
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from forwarder import ForwardingEngine
+from mmsg import mmsg_available
+from server import Client, VoiceServer
+
+PAYLOAD = os.urandom(60)
+
+
+def _generate(port, talkers, duration, stop):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
+    packets = [f"t{i}|0|0".encode() + b":" + PAYLOAD for i in range(talkers)]
+    dest = ("127.0.0.1", port)
+    deadline = time.time() + duration
+    while time.time() < deadline and not stop.is_set():
+        for packet in packets:
+            try:
+                sock.sendto(packet, dest)
+            except OSError:
+                pass
+    sock.close()
+
+
+def _build_server(talkers, fanout):
+    server = VoiceServer()
+    sinks = []
+    for i in range(fanout):
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(("127.0.0.1", 0))
+        sinks.append(sink)
+        lid = f"l{i}"
+        server.clients[lid] = Client(lid, "127.0.0.1", sink.getsockname()[1])
+    for i in range(talkers):
+        tid = f"t{i}"
+        server.clients[tid] = Client(tid, "127.0.0.1", 0)
+        server.clients[tid].targets = {f"l{j}" for j in range(fanout)}
+    server.attach_audio_socket(VoiceServer.make_audio_socket(port=0, host="127.0.0.1"))
+    return server, sinks
+
+
+def _run_generator(port, talkers, duration):
+    stop = multiprocessing.Event()
+    proc = multiprocessing.Process(target=_generate, args=(port, talkers, duration, stop), daemon=True)
+    proc.start()
+    return proc, stop
+
+
+def bench_engine(talkers, fanout, duration, use_mmsg):
+    server, sinks = _build_server(talkers, fanout)
+    engine = ForwardingEngine(server.audio_sock, server.router.route_packet, use_mmsg=use_mmsg)
+    thread = threading.Thread(target=engine.run, daemon=True)
+    thread.start()
+    port = server.audio_sock.getsockname()[1]
+    proc, _stop = _run_generator(port, talkers, duration)
+    time.sleep(0.5)
+    in0, out0, t0 = engine.packets_in, engine.packets_out, time.perf_counter()
+    time.sleep(duration - 1.0)
+    in1, out1, t1 = engine.packets_in, engine.packets_out, time.perf_counter()
+    engine.stop()
+    proc.join()
+    thread.join()
+    server.audio_sock.close()
+    for sink in sinks:
+        sink.close()
+    return (in1 - in0) / (t1 - t0), (out1 - out0) / (t1 - t0)
+
+
+def bench_asyncio(talkers, fanout, duration):
+    """The pre-engine path: one recvfrom await and one task per datagram."""
+    server, sinks = _build_server(talkers, fanout)
+    sock = server.audio_sock
+    counts = {"in": 0, "out": 0}
+
+    async def forward(loop, packet, addr):
+        dests = server.router.route_packet(memoryview(packet), addr)
+        if not dests:
+            return
+        for out_sock, dest in dests:
+            try:
+                await loop.sock_sendto(out_sock, packet, dest)
+                counts["out"] += 1
+            except OSError:
+                pass
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        port = sock.getsockname()[1]
+        proc, _stop = _run_generator(port, talkers, duration)
+        deadline = time.time() + duration
+        marks = []
+
+        async def sample():
+            await asyncio.sleep(0.5)
+            marks.append((counts["in"], counts["out"], time.perf_counter()))
+            await asyncio.sleep(duration - 1.0)
+            marks.append((counts["in"], counts["out"], time.perf_counter()))
+
+        sampler = asyncio.create_task(sample())
+        while time.time() < deadline:
+            try:
+                packet, addr = await asyncio.wait_for(loop.sock_recvfrom(sock, 4096), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            counts["in"] += 1
+            asyncio.create_task(forward(loop, packet, addr))
+        await sampler
+        proc.join()
+        return marks
+
+    marks = asyncio.run(serve())
+    sock.close()
+    for sink in sinks:
+        sink.close()
+    (in0, out0, t0), (in1, out1, t1) = marks
+    return (in1 - in0) / (t1 - t0), (out1 - out0) / (t1 - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--talkers", type=int, default=50)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"talkers={args.talkers} fanout={args.fanout} duration={args.duration}s")
+    print(f"{'path':<28}{'in pps':>12}{'out pps':>12}")
+    rows = [("asyncio task per packet", lambda: bench_asyncio(args.talkers, args.fanout, args.duration))]
+    rows.append(("engine recv_into/sendto", lambda: bench_engine(args.talkers, args.fanout, args.duration, False)))
+    if mmsg_available():
+        rows.append(("engine recvmmsg/sendmmsg", lambda: bench_engine(args.talkers, args.fanout, args.duration, True)))
+    for name, fn in rows:
+        pps_in, pps_out = fn()
+        print(f"{name:<28}{pps_in:>12.0f}{pps_out:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
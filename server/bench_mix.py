@@ -0,0 +1,83 @@
+"""Server CPU per mixed listener: decode + NumPy mix-minus + per-listener Opus encode.
+
+Drives one ``MixShard`` (the work a single mixing process does) with
+pre-encoded synthetic speech from ``--speakers`` talkers and reports CPU
+time per 20 ms tick and per listener. Needs numpy and libopus.
+
+    python bench_mix.py --speakers 4 --listeners 1,4,16,32 --ticks 500
+"""
+
+import argparse
+import math
+import random
+import struct
+import time
+
+import numpy as np
+
+from mixer import FRAME, FRAME_SEC, MixShard, load_codec, mix_minus
+
+
+def _speech_frames(codec_cls, count, seed):
+    """Opus frames of a wobbling tone plus noise, roughly speech-like in level."""
+    rng = random.Random(seed)
+    encoder = codec_cls(create_decoder=False)
+    freq = 140 + 60 * rng.random()
+    frames = []
+    phase = 0.0
+    for n in range(count):
+        amp = 6000 * (0.6 + 0.4 * math.sin(n / 7.0))
+        samples = []
+        for _ in range(FRAME):
+            phase += 2 * math.pi * freq / 16000
+            samples.append(int(amp * math.sin(phase) + rng.gauss(0, 300)))
+        frames.append(encoder.encode(struct.pack(f"<{FRAME}h", *samples)))
+    return frames
+
+
+def bench(codec_cls, speakers, listeners, ticks):
+    streams = {f"s{i}": _speech_frames(codec_cls, 50, i) for i in range(speakers)}
+    senders = tuple(streams)
+    # Talkers are also listeners first, so their rows exercise the mix-minus.
+    ids = [f"s{i}" if i < speakers else f"l{i}" for i in range(listeners)]
+    shard = MixShard(codec_cls)
+    shard.set_listeners([(lid, tuple(s for s in senders if s != lid)) for lid in ids])
+    shard.tick({s: frames[0] for s, frames in streams.items()})  # create codecs
+
+    start = time.process_time()
+    for n in range(ticks):
+        shard.tick({s: frames[n % len(frames)] for s, frames in streams.items()})
+    return (time.process_time() - start) / ticks
+
+
+def bench_mix_only(speakers, listeners, ticks):
+    pcm = np.random.randint(-8000, 8000, size=(speakers, FRAME), dtype=np.int16)
+    mask = np.ones((listeners, speakers), dtype=np.float32)
+    start = time.process_time()
+    for _ in range(ticks):
+        mix_minus(pcm, mask)
+    return (time.process_time() - start) / ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--speakers", type=int, default=4)
+    parser.add_argument("--listeners", default="1,4,16,32")
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    codec_cls = load_codec()
+    print(f"speakers={args.speakers} ticks={args.ticks}")
+    print(f"{'listeners':>10}{'ms/tick':>10}{'ms/listener':>13}{'core %/listener':>17}{'numpy mix ms':>14}")
+    for listeners in (int(x) for x in args.listeners.split(",")):
+        per_tick = bench(codec_cls, args.speakers, listeners, args.ticks)
+        mix_only = bench_mix_only(args.speakers, listeners, args.ticks)
+        per_listener = per_tick / listeners
+        print(
+            f"{listeners:>10}{per_tick * 1000:>10.3f}{per_listener * 1000:>13.3f}"
+            f"{100 * per_listener / FRAME_SEC:>17.2f}{mix_only * 1000:>14.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import math
+
+
+class TimerWheel:
+    """Hashed timing wheel for client expiry.
+
+    Each key lives in exactly one slot, so scheduling, rescheduling and
+    cancelling are O(1) and ``advance`` only touches the slots the clock has
+    passed, i.e. O(expired) instead of a scan over every client. The wheel
+    spans ``horizon_sec``; later deadlines are clamped to the last slot and
+    simply fire early, so callers re-check the real deadline before acting.
+    """
+
+    def __init__(self, tick_sec, horizon_sec, now):
+        self.tick_sec = float(tick_sec)
+        self.size = int(math.ceil(horizon_sec / self.tick_sec)) + 2
+        self.slots = [set() for _ in range(self.size)]
+        self.where = {}
+        self.current = self._tick(now)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def _tick(self, t):
+        return int(t / self.tick_sec)
+
+    def schedule(self, key, deadline):
+        tick = self._tick(deadline)
+        tick = max(self.current + 1, min(tick, self.current + self.size - 1))
+        old = self.where.get(key)
+        if old == tick:
+            return
+        if old is not None:
+            self.slots[old % self.size].discard(key)
+        self.slots[tick % self.size].add(key)
+        self.where[key] = tick
+
+    def cancel(self, key):
+        old = self.where.pop(key, None)
+        if old is not None:
+            self.slots[old % self.size].discard(key)
+
+    def advance(self, now):
+        """Move the clock to ``now`` and return the keys whose slot it passed."""
+        target = self._tick(now)
+        if target <= self.current:
+            return []
+        expired = []
+        # Past one full turn every slot is due; no need to visit it twice.
+        steps = min(target - self.current, self.size)
+        for step in range(1, steps + 1):
+            slot = self.slots[(self.current + step) % self.size]
+            if slot:
+                for key in slot:
+                    del self.where[key]
+                expired.extend(slot)
+                slot.clear()
+        self.current = target
+        return expired
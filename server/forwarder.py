@@ -0,0 +1,315 @@
+import ctypes
+import logging
+import select
+import time
+from collections import deque
+
+from metrics import Histogram
+from mmsg import RecvBatch, SendBatch, mmsg_available
+
+BATCH_SIZE = 64
+MAX_PACKET = 4096
+SEND_BATCH_SIZE = 1024
+POLL_INTERVAL_SEC = 0.5
+BACKLOG_POLL_SEC = 0.01
+SEND_QUEUE_DEPTH = 32         # packets kept per blocked destination (~640 ms of one stream)
+MAX_PACKET_AGE_SEC = 0.2      # queued audio older than this is dropped instead of sent
+MAX_TRACKED_TARGETS = 4096
+
+
+class TargetQueue:
+    """Backlog and drop counters for one destination.
+
+    Created the first time a send to the destination fails; on the happy
+    path packets never touch it. While it holds packets, newer packets for
+    the same destination queue behind them so order is kept, and nothing
+    else waits on it.
+    """
+
+    __slots__ = ("sock", "addr", "packets", "sent", "dropped_stale", "dropped_full", "errors")
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.packets = deque()
+        self.sent = 0
+        self.dropped_stale = 0
+        self.dropped_full = 0
+        self.errors = 0
+
+    def push(self, received, data, depth):
+        if len(self.packets) >= depth:
+            self.packets.popleft()
+            self.dropped_full += 1
+        self.packets.append((received, data))
+
+    def expire(self, now, max_age):
+        packets = self.packets
+        while packets and now - packets[0][0] > max_age:
+            packets.popleft()
+            self.dropped_stale += 1
+
+    def drain(self, now, max_age):
+        """Send what is still fresh; returns False once the socket would block."""
+        self.expire(now, max_age)
+        packets = self.packets
+        while packets:
+            try:
+                self.sock.sendto(packets[0][1], self.addr)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError:
+                self.errors += 1
+            else:
+                self.sent += 1
+            packets.popleft()
+        return True
+
+
+class ForwardingEngine:
+    """Drains the audio socket in batches and fans packets out without asyncio.
+
+    ``route(packet, addr)`` receives a writable memoryview over a
+    preallocated buffer (it may set header flags in place) and returns an
+    iterable of ``(out_sock, dest_addr)`` pairs. Packets are otherwise
+    forwarded byte-for-byte, so on Linux the outgoing sendmmsg() vectors point
+    straight at the receive buffers. Elsewhere the engine falls back to
+    ``recvfrom_into``/``sendto`` loops over the same buffers.
+
+    A send that would block is not retried inline: the packet is copied
+    into that destination's bounded ``TargetQueue``, drained when the
+    socket becomes writable, and dropped once it is older than
+    ``max_age``. Other destinations keep going straight to the kernel.
+    """
+
+    def __init__(
+        self,
+        sock,
+        route,
+        batch_size=BATCH_SIZE,
+        use_mmsg=None,
+        queue_depth=SEND_QUEUE_DEPTH,
+        max_age=MAX_PACKET_AGE_SEC,
+    ):
+        self.sock = sock
+        self.route = route
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.max_age = max_age
+        self.targets = {}       # (fd, addr) -> TargetQueue, once a send there failed
+        self.backlogged = {}    # the subset of targets with queued packets
+        self.readers = {}       # fd -> callback for other sockets served on this thread
+        self.running = False
+        self.use_mmsg = mmsg_available() if use_mmsg is None else (use_mmsg and mmsg_available())
+        self.packets_in = 0
+        self.packets_out = 0
+        self.send_errors = 0
+        self.route_errors = 0
+        self.latency = Histogram()
+
+        self.sock.setblocking(False)
+        if self.use_mmsg:
+            self._recv = RecvBatch(batch_size, MAX_PACKET)
+            self._send = {}
+            self._buffers = self._recv.buffers
+            self._views = self._recv.views
+        else:
+            self._recv = None
+            self._send = None
+            self._buffers = [bytearray(MAX_PACKET) for _ in range(batch_size)]
+            self._views = [memoryview(b) for b in self._buffers]
+
+    def add_reader(self, sock, callback):
+        """Call ``callback()`` on the engine thread whenever ``sock`` is readable."""
+        self.readers[sock.fileno()] = callback
+
+    def run(self):
+        self.running = True
+        mode = "recvmmsg/sendmmsg" if self.use_mmsg else "recv_into/sendto"
+        logging.info("Forwarding engine running (%s, batch=%s)", mode, self.batch_size)
+        drain = self._drain_mmsg if self.use_mmsg else self._drain_portable
+        fd = self.sock.fileno()
+        fds = [fd] + list(self.readers)
+        while self.running:
+            backlog = self.backlogged
+            if backlog:
+                writers = list({q.sock.fileno() for q in backlog.values()})
+                timeout = BACKLOG_POLL_SEC
+            else:
+                writers = []
+                timeout = POLL_INTERVAL_SEC
+            try:
+                readable, writable, _ = select.select(fds, writers, [], timeout)
+            except (OSError, ValueError):
+                if self.running:
+                    logging.exception("Forwarding engine select failed")
+                break
+            if backlog:
+                self._drain_backlog(set(writable))
+            for rfd in readable:
+                if rfd != fd:
+                    self.readers[rfd]()
+            if fd not in readable:
+                continue
+            try:
+                drain()
+            except Exception:
+                logging.exception("Forwarding engine batch failed")
+
+    def stop(self):
+        self.running = False
+
+    def _target(self, sock, addr):
+        key = (sock.fileno(), addr)
+        target = self.targets.get(key)
+        if target is None:
+            if len(self.targets) >= MAX_TRACKED_TARGETS:
+                self.targets = {k: t for k, t in self.targets.items() if t.packets}
+            target = self.targets[key] = TargetQueue(sock, addr)
+        return target
+
+    def _defer(self, sock, addr, received, data):
+        target = self._target(sock, addr)
+        before = target.dropped_full
+        target.push(received, data, self.queue_depth)
+        self.send_errors += target.dropped_full - before
+        self.backlogged[(sock.fileno(), addr)] = target
+
+    def _drain_backlog(self, writable):
+        now = time.perf_counter()
+        for key, target in list(self.backlogged.items()):
+            sent, lost = target.sent, target.dropped_stale + target.errors
+            if key[0] in writable:
+                target.drain(now, self.max_age)
+            else:
+                target.expire(now, self.max_age)
+            self.packets_out += target.sent - sent
+            self.send_errors += target.dropped_stale + target.errors - lost
+            if not target.packets:
+                del self.backlogged[key]
+
+    def target_stats(self):
+        """``{addr: (queued, dropped_stale, dropped_full, errors)}`` for metrics."""
+        stats = {}
+        for (_fd, addr), t in list(self.targets.items()):
+            prev = stats.get(addr, (0, 0, 0, 0))
+            stats[addr] = (
+                prev[0] + len(t.packets),
+                prev[1] + t.dropped_stale,
+                prev[2] + t.dropped_full,
+                prev[3] + t.errors,
+            )
+        return stats
+
+    def _route(self, packet, addr):
+        """``route`` for one packet; a failure drops that packet only."""
+        try:
+            return self.route(packet, addr)
+        except Exception:
+            self.route_errors += 1
+            if self.route_errors % 100 == 1:
+                logging.exception("Routing failed (errors=%s, latest from %s)", self.route_errors, addr)
+            return None
+
+    # --------------------------------------------------
+
+    def _drain_mmsg(self):
+        recv = self._recv
+        views = self._views
+        addresses = recv.addresses
+        route = self._route
+        n = recv.recv(self.sock.fileno())
+        if n == 0:
+            return
+        received = time.perf_counter()
+        self.packets_in += n
+        pending = self._send
+        backlog = self.backlogged
+        forwarded = 0
+        try:
+            for i in range(n):
+                length = recv.length(i)
+                if length == 0:
+                    continue
+                dests = route(views[i][:length], recv.addr(i))
+                if not dests:
+                    continue
+                forwarded += 1
+                for out_sock, dest in dests:
+                    fd = out_sock.fileno()
+                    if backlog and (fd, dest) in backlog:
+                        self._defer(out_sock, dest, received, bytes(views[i][:length]))
+                        continue
+                    entry = pending.get(fd)
+                    if entry is None:
+                        entry = pending[fd] = (out_sock, SendBatch(SEND_BATCH_SIZE))
+                    batch = entry[1]
+                    if not batch.add(addresses[i], length, dest):
+                        self._flush_one(out_sock, batch, received)
+                        batch.add(addresses[i], length, dest)
+        finally:
+            # Queued entries point into the receive buffers, which the next
+            # recvmmsg overwrites: never carry them over to another batch.
+            for out_sock, batch in pending.values():
+                if batch.count:
+                    try:
+                        self._flush_one(out_sock, batch, received)
+                    finally:
+                        batch.count = 0
+        if forwarded:
+            # The whole batch left the socket together and is flushed together.
+            self.latency.observe(time.perf_counter() - received, forwarded)
+
+    def _flush_one(self, out_sock, batch, received):
+        def unsent(addr, buf_address, length, would_block):
+            if would_block:
+                # Copy now: the receive buffers are reused by the next batch.
+                self._defer(out_sock, addr, received, ctypes.string_at(buf_address, length))
+            else:
+                self._target(out_sock, addr).errors += 1
+                self.send_errors += 1
+
+        errors = self.send_errors
+        self.packets_out += batch.flush(out_sock.fileno(), unsent)
+        if self.send_errors != errors and self.send_errors % 100 == 1:
+            logging.error("Send errors=%s (backlogged targets=%s)", self.send_errors, len(self.backlogged))
+
+    def _drain_portable(self):
+        sock = self.sock
+        views = self._views
+        route = self._route
+        count = 0
+        for i in range(self.batch_size):
+            try:
+                length, addr = sock.recvfrom_into(views[i])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # Windows reports ICMP port-unreachable as WSAECONNRESET on recv.
+                logging.debug("Audio recv error: %s", e)
+                continue
+            count += 1
+            if length == 0:
+                continue
+            received = time.perf_counter()
+            dests = route(views[i][:length], addr)
+            if not dests:
+                continue
+            packet = views[i][:length]
+            backlog = self.backlogged
+            for out_sock, dest in dests:
+                if backlog and (out_sock.fileno(), dest) in backlog:
+                    self._defer(out_sock, dest, received, bytes(packet))
+                    continue
+                try:
+                    out_sock.sendto(packet, dest)
+                    self.packets_out += 1
+                except (BlockingIOError, InterruptedError):
+                    self._defer(out_sock, dest, received, bytes(packet))
+                except OSError as e:
+                    self._target(out_sock, dest).errors += 1
+                    self.send_errors += 1
+                    if self.send_errors % 100 == 1:
+                        logging.error("Send error to %s: %s", dest, e)
+            self.latency.observe(time.perf_counter() - received)
+        self.packets_in += count
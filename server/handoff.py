@@ -0,0 +1,259 @@
+"""Hot restart: hand the live sockets and the registry to a new server process.
+
+A running server listens on a Unix socket (``handoff_path``). A new process
+started with ``--takeover`` connects to it and the old one sends, as
+``SOCK_SEQPACKET`` records:
+
+1. its listening sockets (control, audio, trunk, metrics, discovery probes) via ``SCM_RIGHTS``
+2. the registry as JSON
+3. every open control connection, with the lines it had read but not yet served
+
+The new process starts forwarding on the same audio socket before it answers
+``READY``, so for a moment both processes serve packets and none wait for the
+switch. Only after ``READY`` does the old process stop its forwarders and exit.
+Clients do not reconnect and lose no audio. Packets in flight during the
+switch can be delayed by a few milliseconds (see the README), well under
+one 20 ms frame.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+
+from trunk import Peer, RemoteClient
+
+HANDOFF_TIMEOUT_SEC = 10.0
+RECORD_BYTES = 256 * 1024
+CLIENTS_PER_RECORD = 1000
+FDS_PER_RECORD = 250          # stays under the kernel's SCM_MAX_FD (253)
+
+
+def handoff_path(control_port):
+    return os.path.join(tempfile.gettempdir(), f"voice-server-{control_port}.sock")
+
+
+def handoff_supported():
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "send_fds")
+
+
+def _send(sock, record, fds=()):
+    data = json.dumps(record, separators=(",", ":")).encode()
+    if fds:
+        socket.send_fds(sock, [data], list(fds))
+    else:
+        sock.sendall(data)
+
+
+def _recv(sock):
+    data, fds, _flags, _addr = socket.recv_fds(sock, RECORD_BYTES, FDS_PER_RECORD)
+    if not data:
+        raise ConnectionError("handoff peer closed the connection")
+    return json.loads(data), fds
+
+
+def registry_records(server):
+    """The registry as JSON-able records, chunked to fit one datagram each."""
+    clients = [
+        [
+            c.client_id,
+            c.addr[0],
+            c.addr[1],
+            c.ssrc,
+            c.room,
+            sorted(c.targets),
+            c.mixed,
+            sorted(c.mix_hear) if c.mix_hear is not None else None,
+        ]
+        for c in server.clients.values()
+    ]
+    remote = [
+        [rc.client_id, rc.ssrc, rc.room, sorted(rc.targets), rc.server_id]
+        for rc in server.remote.values()
+    ]
+    peers = []
+    if server.trunk is not None:
+        peers = [[p.server_id, p.trunk_addr[0], p.trunk_addr[1]] for p in server.trunk.peers.values()]
+    records = []
+    for i in range(0, max(len(clients), 1), CLIENTS_PER_RECORD):
+        records.append({"kind": "clients", "clients": clients[i:i + CLIENTS_PER_RECORD]})
+    for i in range(0, len(remote), CLIENTS_PER_RECORD):
+        records.append({"kind": "remote", "remote": remote[i:i + CLIENTS_PER_RECORD]})
+    records.append({"kind": "peers", "peers": peers})
+    return records
+
+
+def restore_record(server, record, client_cls):
+    kind = record["kind"]
+    if kind == "clients":
+        for cid, ip, port, ssrc, room, targets, mixed, mix_hear in record["clients"]:
+            client = client_cls(cid, ip, port, ssrc)
+            client.room = room
+            client.targets = set(targets)
+            client.mixed = mixed
+            client.mix_hear = set(mix_hear) if mix_hear is not None else None
+            server.clients[cid] = client
+            server.ssrcs[ssrc] = client
+            if room:
+                server.rooms[room].add(cid)
+            server.touch_client(cid)
+    elif kind == "remote":
+        for cid, ssrc, room, targets, server_id in record["remote"]:
+            server.remote[cid] = RemoteClient(cid, ssrc, room, set(targets), server_id)
+    elif kind == "peers" and server.trunk is not None:
+        for server_id, ip, port in record["peers"]:
+            server.trunk.peers[server_id] = Peer(server_id, (ip, port), None)
+
+
+class HandoffServer:
+    """Old-process side: waits for ``--takeover`` and gives everything away."""
+
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        self.sock = None
+
+    async def start(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        sock.listen(1)
+        sock.setblocking(False)
+        self.sock = sock
+        asyncio.create_task(self.serve())
+        logging.info("Hot restart handoff listening on %s", self.path)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn, _ = await loop.sock_accept(self.sock)
+            conn.setblocking(True)
+            conn.settimeout(HANDOFF_TIMEOUT_SEC)
+            try:
+                request, _ = await loop.run_in_executor(None, _recv, conn)
+                if request.get("kind") == "takeover":
+                    await self.hand_off(conn)
+            except (OSError, ValueError, ConnectionError) as e:
+                logging.error("Hot restart handoff failed: %s", e)
+            finally:
+                conn.close()
+
+    async def hand_off(self, conn):
+        server = self.server
+        loop = asyncio.get_running_loop()
+        logging.info("Handing off to a new server process")
+        server.handing_off = True
+
+        listeners = {"control": server.control_server.sockets[0].fileno()}
+        if server.audio_sock is not None:
+            listeners["audio"] = server.audio_sock.fileno()
+        if server.trunk is not None and server.trunk.sock is not None:
+            listeners["trunk"] = server.trunk.sock.fileno()
+        if server.metrics_server is not None:
+            listeners["metrics"] = server.metrics_server.sockets[0].fileno()
+        if server.discovery_sock is not None:
+            listeners["discovery"] = server.discovery_sock.fileno()
+        _send(conn, {"kind": "listeners", "names": list(listeners)}, listeners.values())
+
+        # From here the old process accepts nothing and serves no control
+        # line; what is already buffered is stashed per connection and
+        # replayed by the new process.
+        server.control_server.close()
+        for conn_state in list(server.connections):
+            conn_state.writer.transport.pause_reading()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        for conn_state in list(server.connections):
+            try:
+                await asyncio.wait_for(conn_state.writer.drain(), 1.0)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+
+        for record in registry_records(server):
+            _send(conn, record)
+        conns = [c for c in server.connections if not c.writer.transport.is_closing()]
+        for i in range(0, len(conns), FDS_PER_RECORD):
+            chunk = conns[i:i + FDS_PER_RECORD]
+            _send(
+                conn,
+                {
+                    "kind": "connections",
+                    "connections": [
+                        [c.peer_ip, c.client_id, c.peer, c.persistent, list(c.pending)] for c in chunk
+                    ],
+                },
+                [c.writer.get_extra_info("socket").fileno() for c in chunk],
+            )
+        _send(conn, {"kind": "end"})
+
+        try:
+            reply, _ = await loop.run_in_executor(None, _recv, conn)
+        except (OSError, ValueError, ConnectionError) as e:
+            reply = {"kind": "failed", "error": str(e)}
+        if reply.get("kind") != "ready":
+            # The listening socket is gone and the control connections are
+            # half-served; the safest state is a cold restart of control.
+            logging.error("New process did not take over (%s); exiting", reply.get("error", reply))
+        else:
+            logging.info("New process took over; stopping")
+        server.stop_forwarding()
+        os._exit(0 if reply.get("kind") == "ready" else 1)
+
+
+class Takeover:
+    """New-process side: what ``take_over`` received from the old process."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.sockets = {}
+        self.connections = []   # (sock, peer_ip, client_id, peer, persistent, pending)
+
+    def socket(self, name):
+        fd = self.sockets.pop(name, None)
+        if fd is None:
+            return None
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(False)
+        return sock
+
+    def ready(self):
+        for fd in self.sockets.values():
+            os.close(fd)
+        try:
+            _send(self.conn, {"kind": "ready"})
+        finally:
+            self.conn.close()
+
+
+def take_over(server, path, client_cls):
+    """Connect to the running server at ``path`` and receive its state (blocking)."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    conn.settimeout(HANDOFF_TIMEOUT_SEC)
+    conn.connect(path)
+    _send(conn, {"kind": "takeover"})
+    takeover = Takeover(conn)
+    while True:
+        record, fds = _recv(conn)
+        kind = record["kind"]
+        if kind == "listeners":
+            takeover.sockets = dict(zip(record["names"], fds))
+        elif kind == "connections":
+            for fd, (peer_ip, client_id, peer, persistent, pending) in zip(fds, record["connections"]):
+                sock = socket.socket(fileno=fd)
+                takeover.connections.append((sock, peer_ip, client_id, peer, persistent, pending))
+        elif kind == "end":
+            break
+        else:
+            restore_record(server, record, client_cls)
+    logging.info(
+        "Took over %s clients and %s control connections",
+        len(server.clients),
+        len(takeover.connections),
+    )
+    return takeover
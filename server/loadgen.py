@@ -0,0 +1,343 @@
+"""Synthetic load generator: fake talkers and listeners against a running server.
+
+Registers ``--talkers`` and ``--listeners`` clients through the real control
+protocol, streams 20 ms frames (50 pps) from every talker with on/off
+talk-spurts, and receives on the listener sockets. Reports forwarded pps,
+loss, reordering and one-way latency percentiles. Everything runs on
+loopback without audio devices. With ``--servers N`` the spawned servers
+form a trunked mesh and clients are spread over them round-robin.
+
+    python loadgen.py --spawn --talkers 50 --listeners 20 --fanout 5 --duration 20
+    python loadgen.py --spawn --servers 3 --talkers 30 --listeners 30 --fanout 6
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import selectors
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import shared  # noqa: F401  (packet and opus_codec live in ../client)
+from packet import FLAG_LEVEL, HEADER_SIZE, pack_header, pack_level
+
+CONTROL_PORT = 50001
+AUDIO_PORT = 50002
+TRUNK_PORT = 50003
+PORT_STRIDE = 10             # port offset between spawned mesh servers
+SECRET = os.getenv("VOICE_REGISTER_SECRET", "mysecret")
+FRAME = 320
+FRAME_SEC = 0.020
+MEAN_TALK_SEC = 1.0          # exponential talk-spurt / pause lengths (Brady-style on/off model)
+MEAN_PAUSE_SEC = 1.5
+OPUS_FRAME_BYTES = (40, 90)  # payload size range when libopus is not available
+PING_SEC = 10.0
+# talker index, seq, send time (monotonic) in front of the Opus frame
+PROBE = struct.Struct("!IId")
+
+
+def control(host, command, timeout=5.0, port=CONTROL_PORT):
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((command + "\n").encode())
+        return sock.recv(1024).decode(errors="ignore").strip()
+
+
+def opus_frames(count, seed=1):
+    """Pre-encoded Opus frames of a synthetic voice, or random payloads of Opus size."""
+    rng = random.Random(seed)
+    try:
+        from opus_codec import OpusCodec
+
+        codec = OpusCodec(create_decoder=False)
+    except (ImportError, OSError) as e:
+        print(f"[LOADGEN] libopus unavailable ({e.__class__.__name__}), using random payloads")
+        return [os.urandom(rng.randint(*OPUS_FRAME_BYTES)) for _ in range(count)]
+    frames = []
+    phase = 0.0
+    for n in range(count):
+        amp = 6000 * (0.6 + 0.4 * math.sin(n / 7.0))
+        samples = []
+        for _ in range(FRAME):
+            phase += 2 * math.pi * 160 / 16000
+            samples.append(int(amp * math.sin(phase) + rng.gauss(0, 300)))
+        frames.append(codec.encode(struct.pack(f"<{FRAME}h", *samples)))
+    return frames
+
+
+class Talker:
+    def __init__(self, index, client_id, ssrc, targets, rng, home):
+        self.index = index
+        self.client_id = client_id
+        self.ssrc = ssrc
+        self.targets = targets
+        self.home = home
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.seq = 0
+        self.sent = 0
+        self.rng = rng
+        self.talking = rng.random() < MEAN_TALK_SEC / (MEAN_TALK_SEC + MEAN_PAUSE_SEC)
+        self.switch_at = time.monotonic() + self._spurt()
+
+    def _spurt(self):
+        return self.rng.expovariate(1.0 / (MEAN_TALK_SEC if self.talking else MEAN_PAUSE_SEC))
+
+    def advance(self, now):
+        if now >= self.switch_at:
+            self.talking = not self.talking
+            self.switch_at = now + self._spurt()
+        return self.talking
+
+
+class Receiver:
+    """Counts per (talker, listener) stream on one thread."""
+
+    def __init__(self, sockets):
+        self.selector = selectors.DefaultSelector()
+        for index, sock in enumerate(sockets):
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            self.selector.register(sock, selectors.EVENT_READ, index)
+        self.received = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.latencies = []
+        self.highest = {}
+        self.running = True
+        self.offset = HEADER_SIZE
+
+    def run(self):
+        buf = bytearray(2048)
+        view = memoryview(buf)
+        while self.running:
+            for key, _ in self.selector.select(0.2):
+                sock = key.fileobj
+                while True:
+                    try:
+                        n = sock.recv_into(buf)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+                    if n < self.offset + PROBE.size:
+                        continue
+                    now = time.monotonic()
+                    talker, seq, sent = PROBE.unpack_from(view, self.offset)
+                    self.received += 1
+                    self.latencies.append(now - sent)
+                    stream = (talker, key.data)
+                    top = self.highest.get(stream)
+                    if top is None or seq > top:
+                        self.highest[stream] = seq
+                    elif seq == top:
+                        self.duplicates += 1
+                    else:
+                        self.reordered += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def endpoints(count):
+    """``(control_port, audio_port)`` of each server; one server uses the defaults."""
+    return [(CONTROL_PORT + i * PORT_STRIDE, AUDIO_PORT + i * PORT_STRIDE) for i in range(count)]
+
+
+def spawn_servers(count, extra_args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    procs = []
+    ports = endpoints(count)
+    for i, (control_port, audio_port) in enumerate(ports):
+        argv = [sys.executable, os.path.join(here, "server.py")] + extra_args.split()
+        if count > 1:
+            argv += [
+                "--control-port", str(control_port),
+                "--audio-port", str(audio_port),
+                "--trunk-port", str(TRUNK_PORT + i * PORT_STRIDE),
+                "--server-id", f"lg{i}",
+                "--metrics-port", "0",
+            ]
+            for other, (peer_port, _) in enumerate(ports):
+                if other != i:
+                    argv += ["--peer", f"127.0.0.1:{peer_port}"]
+        procs.append(subprocess.Popen(argv, cwd=here, stderr=subprocess.DEVNULL))
+    time.sleep(1.5 if count == 1 else 3.0)
+    return procs
+
+
+def register_all(host, args, listener_socks, ports):
+    listener_ids = [f"lg-l{i}" for i in range(args.listeners)]
+    homes = {}
+    for i, (lid, sock) in enumerate(zip(listener_ids, listener_socks)):
+        homes[lid] = control_port = ports[i % len(ports)][0]
+        reply = control(host, f"REGISTER:{lid}:{sock.getsockname()[1]}:{SECRET}:1", port=control_port)
+        if not reply.startswith("OK"):
+            raise SystemExit(f"REGISTER {lid} failed: {reply}")
+        control(host, f"JOIN:{lid}:{args.room}", port=control_port)
+
+    rng = random.Random(args.seed)
+    talkers = []
+    for i in range(args.talkers):
+        tid = f"lg-t{i}"
+        control_port, audio_port = ports[i % len(ports)]
+        homes[tid] = control_port
+        # Declared port is unused: fake talkers never listen.
+        reply = control(host, f"REGISTER:{tid}:9:{SECRET}:1", port=control_port)
+        if not reply.startswith("OK:"):
+            raise SystemExit(f"REGISTER {tid} failed: {reply}")
+        control(host, f"JOIN:{tid}:{args.room}", port=control_port)
+        fanout = min(args.fanout, args.listeners) if args.fanout else args.listeners
+        targets = [listener_ids[(i + k) % args.listeners] for k in range(fanout)] if args.listeners else []
+        control(host, f"TARGETS:{tid}:{','.join(targets)}", port=control_port)
+        talkers.append(
+            Talker(i, tid, int(reply.split(":", 1)[1]), targets, random.Random(rng.random()), (host, audio_port))
+        )
+    return listener_ids, talkers, homes
+
+
+def keepalive(host, homes, client_ids, stop):
+    # Listeners send no audio, so they need heartbeats to survive expiry.
+    while not stop.wait(PING_SEC):
+        for cid in client_ids:
+            try:
+                control(host, f"PING:{cid}", port=homes[cid])
+            except OSError:
+                pass
+
+
+def stream(talkers, frames, duration, with_level):
+    flags = FLAG_LEVEL if with_level else 0
+    level = pack_level(30, True) if with_level else b""
+    start = next_tick = time.monotonic()
+    n = 0
+    while True:
+        now = time.monotonic()
+        if now - start >= duration:
+            break
+        for talker in talkers:
+            if not talker.advance(now):
+                continue
+            probe = PROBE.pack(talker.index, talker.seq, time.monotonic())
+            packet = pack_header(flags, talker.seq, talker.seq * FRAME, talker.ssrc) + level + probe
+            packet += frames[(talker.seq + talker.index) % len(frames)]
+            try:
+                talker.sock.sendto(packet, talker.home)
+                talker.sent += 1
+            except OSError:
+                pass
+            talker.seq += 1
+        n += 1
+        next_tick += FRAME_SEC
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", default="127.0.0.1")
+    parser.add_argument("--spawn", action="store_true", help="start server.py on loopback for the run")
+    parser.add_argument("--server-args", default="", help="extra arguments for the spawned server")
+    parser.add_argument(
+        "--servers",
+        type=int,
+        default=1,
+        help="servers to spread clients over; >1 uses a trunked mesh on ports 50001+10*i",
+    )
+    parser.add_argument("--talkers", type=int, default=20)
+    parser.add_argument("--listeners", type=int, default=10)
+    parser.add_argument("--fanout", type=int, default=0, help="listeners per talker (0 = all)")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--room", default="loadgen")
+    parser.add_argument(
+        "--level",
+        action="store_true",
+        help="send level bytes; packets withheld by active-speaker selection then count as loss",
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print one JSON line for regression tracking")
+    args = parser.parse_args()
+
+    servers = []
+    if args.spawn:
+        servers = spawn_servers(args.servers, args.server_args)
+    ports = endpoints(args.servers)
+
+    listener_socks = []
+    for _ in range(args.listeners):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        listener_socks.append(sock)
+
+    stop = threading.Event()
+    try:
+        frames = opus_frames(50)
+        listener_ids, talkers, homes = register_all(args.server, args, listener_socks, ports)
+        if args.servers > 1:
+            time.sleep(0.5)  # let the registry federate before audio starts
+        threading.Thread(
+            target=keepalive, args=(args.server, homes, listener_ids, stop), daemon=True
+        ).start()
+        receiver = Receiver(listener_socks)
+        receiver.offset = HEADER_SIZE + (1 if args.level else 0)
+        rx_thread = threading.Thread(target=receiver.run, daemon=True)
+        rx_thread.start()
+
+        started = time.monotonic()
+        stream(talkers, frames, args.duration, args.level)
+        elapsed = time.monotonic() - started
+        time.sleep(0.5)
+        receiver.running = False
+        rx_thread.join()
+
+        for cid in listener_ids + [t.client_id for t in talkers]:
+            control(args.server, f"UNREGISTER:{cid}", port=homes[cid])
+    finally:
+        stop.set()
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    sent = sum(t.sent for t in talkers)
+    expected = sum(t.sent * len(t.targets) for t in talkers)
+    latencies = sorted(receiver.latencies)
+    result = {
+        "servers": args.servers,
+        "talkers": args.talkers,
+        "listeners": args.listeners,
+        "fanout": min(args.fanout, args.listeners) if args.fanout else args.listeners,
+        "duration_sec": round(elapsed, 2),
+        "sent_pps": round(sent / elapsed, 1),
+        "forwarded_pps": round(receiver.received / elapsed, 1),
+        "loss_pct": round(100.0 * (1 - receiver.received / expected), 3) if expected else 0.0,
+        "reordered": receiver.reordered,
+        "duplicates": receiver.duplicates,
+        "latency_ms": {
+            f"p{p}": round(1000 * percentile(latencies, p), 3) for p in (50, 90, 99, 99.9)
+        },
+    }
+    result["latency_ms"]["max"] = round(1000 * latencies[-1], 3) if latencies else None
+
+    if args.json:
+        print(json.dumps(result, sort_keys=True))
+        return
+    print(f"servers={result['servers']} talkers={result['talkers']} listeners={result['listeners']} fanout={result['fanout']} "
+          f"duration={result['duration_sec']}s")
+    print(f"sent {result['sent_pps']} pps, forwarded {result['forwarded_pps']} pps, "
+          f"loss {result['loss_pct']}%, reordered {result['reordered']}, duplicates {result['duplicates']}")
+    lat = result["latency_ms"]
+    print(f"latency ms: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} p99.9={lat['p99.9']} max={lat['max']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+from bisect import bisect_left
+
+METRICS_PORT = 9102
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+LOOP_LAG_INTERVAL_SEC = 0.5
+
+
+class Histogram:
+    """Fixed-bucket histogram without locks; one writer thread, any number of readers."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, n=1):
+        self.counts[bisect_left(self.buckets, value)] += n
+        self.sum += value * n
+        self.count += n
+
+    def snapshot(self):
+        return list(self.counts), self.sum, self.count
+
+
+def merge_histograms(snapshots, size):
+    counts = [0] * size
+    total = 0.0
+    count = 0
+    for bucket_counts, hist_sum, hist_count in snapshots:
+        for i, n in enumerate(bucket_counts):
+            counts[i] += n
+        total += hist_sum
+        count += hist_count
+    return counts, total, count
+
+
+def engine_snapshot(engine, router):
+    """Everything the exporter needs from one forwarding engine, as plain data."""
+    return {
+        "router": router.snapshot(),
+        "packets_in": engine.packets_in,
+        "packets_out": engine.packets_out,
+        "send_errors": engine.send_errors,
+        "route_errors": engine.route_errors,
+        "latency": engine.latency.snapshot(),
+        "targets": engine.target_stats(),
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, text):
+        self.lines.append(f"# HELP {name} {text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name, value, **labels):
+        if labels:
+            inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            self.lines.append(f"{name}{{{inner}}} {value}")
+        else:
+            self.lines.append(f"{name} {value}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsExporter:
+    """Prometheus text endpoint over the server's plain counters.
+
+    The forwarding path only bumps integers; all aggregation and string
+    formatting happens here, when a scrape arrives.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+
+    async def watch_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL_SEC)
+            self.loop_lag = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL_SEC)
+            self.loop_lag_max = max(self.loop_lag_max, self.loop_lag)
+
+    async def start(self, host, port, sock=None):
+        if sock is not None:
+            server = await asyncio.start_server(self.handle, sock=sock)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        asyncio.create_task(self.watch_loop_lag())
+        logging.info("Metrics HTTP listening on %s:%s", host, port)
+        return server
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5.0)
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5.0)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.decode(errors="ignore").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body, content_type = "404 Not Found", b"not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.exception("Metrics request failed: %s", e)
+        finally:
+            writer.close()
+
+    def render(self):
+        server = self.server
+        snapshots = server.forwarding_snapshots()
+        names = {client.addr: cid for cid, client in list(server.clients.items())}
+        groups = {group: room for room, group in list(server.room_groups.items())}
+        peers = {}
+        if server.trunk is not None:
+            peers = {peer.trunk_addr: sid for sid, peer in list(server.trunk.peers.items())}
+
+        senders = {}
+        dests = {}
+        targets = {}
+        malformed = 0
+        nack = {"requests": 0, "resent": 0, "missed": 0, "limited": 0, "rejected": 0}
+        for snap in snapshots:
+            for addr, values in snap["targets"].items():
+                prev = targets.get(addr, (0, 0, 0, 0))
+                targets[addr] = tuple(a + b for a, b in zip(prev, values))
+            router = snap["router"]
+            malformed += router["malformed"]
+            for key, n in router.get("nack", {}).items():
+                nack[key] += n
+            for cid, values in router["senders"].items():
+                prev = senders.get(cid)
+                if prev is None:
+                    senders[cid] = list(values)
+                else:
+                    # Counters add up across shards; fan-out is the same table everywhere.
+                    senders[cid] = [a + b for a, b in zip(prev[:5], values[:5])] + [values[5]]
+            for addr, (packets, size) in router["dests"].items():
+                total = dests.setdefault(addr, [0, 0])
+                total[0] += packets
+                total[1] += size
+
+        w = _Writer()
+        w.family("voice_clients", "gauge", "Registered clients.")
+        w.sample("voice_clients", len(server.clients))
+        w.family("voice_remote_clients", "gauge", "Clients registered on trunk peers.")
+        w.sample("voice_remote_clients", len(server.remote))
+
+        w.family("voice_room_members", "gauge", "Clients per room.")
+        for room, members in sorted(server.rooms.items()):
+            w.sample("voice_room_members", len(members), room=room)
+
+        w.family("voice_client_packets_in_total", "counter", "Audio packets received from a client.")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_packets_in_total", values[0], client=cid)
+        w.family("voice_client_bytes_in_total", "counter", "Audio bytes received from a client.")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_bytes_in_total", values[1], client=cid)
+        w.family("voice_client_forwarded_packets_total", "counter", "Copies of a client's audio sent on.")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_forwarded_packets_total", values[2], client=cid)
+        w.family("voice_client_forwarded_bytes_total", "counter", "Bytes of a client's audio sent on.")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_forwarded_bytes_total", values[3], client=cid)
+        w.family("voice_client_suppressed_packets_total", "counter", "Packets held back by active-speaker selection.")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_suppressed_packets_total", values[4], client=cid)
+        w.family("voice_client_fanout", "gauge", "Destinations per packet of a client (multicast group = 1).")
+        for cid, values in sorted(senders.items()):
+            w.sample("voice_client_fanout", values[5], client=cid)
+
+        w.family("voice_client_packets_out_total", "counter", "Audio packets sent to a client, room group or trunk peer.")
+        rows = []
+        for addr, total in dests.items():
+            if addr in names:
+                rows.append(({"client": names[addr]}, total))
+            elif addr in groups:
+                rows.append(({"room": groups[addr]}, total))
+            elif addr in peers:
+                rows.append(({"peer": peers[addr]}, total))
+        for labels, total in rows:
+            w.sample("voice_client_packets_out_total", total[0], **labels)
+        w.family("voice_client_bytes_out_total", "counter", "Audio bytes sent to a client, room group or trunk peer.")
+        for labels, total in rows:
+            w.sample("voice_client_bytes_out_total", total[1], **labels)
+
+        w.family("voice_client_send_dropped_total", "counter", "Packets to a client that were never sent, by reason.")
+        labelled = []
+        for addr, values in targets.items():
+            if addr in names:
+                labelled.append(({"client": names[addr]}, values))
+            elif addr in groups:
+                labelled.append(({"room": groups[addr]}, values))
+            elif addr in peers:
+                labelled.append(({"peer": peers[addr]}, values))
+        for labels, values in labelled:
+            w.sample("voice_client_send_dropped_total", values[1], reason="stale", **labels)
+            w.sample("voice_client_send_dropped_total", values[2], reason="overflow", **labels)
+            w.sample("voice_client_send_dropped_total", values[3], reason="error", **labels)
+        w.family("voice_client_send_queue_depth", "gauge", "Packets waiting for a blocked destination.")
+        for labels, values in labelled:
+            w.sample("voice_client_send_queue_depth", values[0], **labels)
+
+        w.family("voice_forward_packets_in_total", "counter", "Datagrams read from the audio socket.")
+        w.sample("voice_forward_packets_in_total", sum(s["packets_in"] for s in snapshots))
+        w.family("voice_forward_packets_out_total", "counter", "Datagrams sent by the forwarder.")
+        w.sample("voice_forward_packets_out_total", sum(s["packets_out"] for s in snapshots))
+        w.family("voice_forward_send_errors_total", "counter", "Failed or dropped sends.")
+        w.sample("voice_forward_send_errors_total", sum(s["send_errors"] for s in snapshots))
+        w.family("voice_forward_route_errors_total", "counter", "Datagrams dropped because routing them failed.")
+        w.sample("voice_forward_route_errors_total", sum(s["route_errors"] for s in snapshots))
+        w.family("voice_malformed_packets_total", "counter", "Audio packets without a usable header.")
+        w.sample("voice_malformed_packets_total", malformed)
+
+        w.family("voice_nack_requests_total", "counter", "NACKs received from listeners.")
+        w.sample("voice_nack_requests_total", nack["requests"])
+        w.family("voice_nack_retransmits_total", "counter", "Packets asked for by NACKs, by outcome.")
+        for result in ("resent", "missed", "limited"):
+            w.sample("voice_nack_retransmits_total", nack[result], result=result)
+        w.family("voice_nack_rejected_total", "counter", "NACKs from addresses that are not listeners of the sender.")
+        w.sample("voice_nack_rejected_total", nack["rejected"])
+
+        name = "voice_forward_latency_seconds"
+        w.family(name, "histogram", "Time from socket read to send inside the forwarding engine.")
+        counts, total, count = merge_histograms(
+            [s["latency"] for s in snapshots], len(LATENCY_BUCKETS) + 1
+        )
+        running = 0
+        for bound, n in zip(LATENCY_BUCKETS, counts):
+            running += n
+            w.sample(f"{name}_bucket", running, le=repr(bound))
+        w.sample(f"{name}_bucket", count, le="+Inf")
+        w.sample(f"{name}_sum", total)
+        w.sample(f"{name}_count", count)
+
+        w.family("voice_event_loop_lag_seconds", "gauge", "Latest control event-loop scheduling delay.")
+        w.sample("voice_event_loop_lag_seconds", self.loop_lag)
+        w.family("voice_event_loop_lag_max_seconds", "gauge", "Worst event-loop delay since start.")
+        w.sample("voice_event_loop_lag_max_seconds", self.loop_lag_max)
+        return w.text()
@@ -0,0 +1,268 @@
+import logging
+import multiprocessing
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+import shared  # noqa: F401  (packet and opus_codec live in ../client)
+from packet import MIX_SSRC, pack_header
+
+RATE = 16000
+FRAME = 320  # 20 ms @ 16 kHz, same as the client
+FRAME_SEC = FRAME / RATE
+MIX_WORKERS = 2
+MIX_COMPLEXITY = 5            # encoder complexity for mixed streams; CPU is per listener here
+SENDER_QUEUE_FRAMES = 3       # per-sender backlog before the oldest frame is dropped
+SENDER_IDLE_TICKS = 5         # conceal missing frames this long before dropping a sender
+RESYNC_SEC = 0.2
+
+
+def load_codec():
+    """Return the client's ``OpusCodec`` class; the server only needs it for mixing."""
+    from opus_codec import OpusCodec
+
+    return OpusCodec
+
+
+def mix_minus(pcm, mask):
+    """Mix every listener in one matrix product.
+
+    ``pcm`` is senders x FRAME int16 and ``mask`` listeners x senders with a
+    1 where the listener hears that sender (never its own stream), so each
+    output row is that listener's mix-minus. A tanh soft limiter keeps sums
+    of several loud talkers from clipping.
+    """
+    mixed = mask @ pcm.astype(np.float32)
+    return (np.tanh(mixed / 32767.0) * 32767.0).astype(np.int16)
+
+
+class MixShard:
+    """Decoders, encoders and mixing for the listeners owned by one worker."""
+
+    def __init__(self, codec_cls):
+        self.codec_cls = codec_cls
+        self.decoders = {}
+        self.encoders = {}
+        self.listeners = ()
+
+    def set_listeners(self, listeners):
+        """``listeners`` is a sequence of ``(listener_id, sender_ids)``."""
+        self.listeners = tuple(listeners)
+        keep = {lid for lid, _ in self.listeners}
+        for lid in [lid for lid in self.encoders if lid not in keep]:
+            del self.encoders[lid]
+
+    def tick(self, frames):
+        """Mix one 20 ms frame; ``frames`` maps sender to Opus bytes, or None to conceal.
+
+        Returns ``[(listener_id, opus_bytes)]`` for listeners with at least one
+        active source.
+        """
+        for sender in [s for s in self.decoders if s not in frames]:
+            del self.decoders[sender]
+        senders = []
+        rows = []
+        for sender, opus in frames.items():
+            decoder = self.decoders.get(sender)
+            if decoder is None:
+                decoder = self.decoders[sender] = self.codec_cls(create_encoder=False)
+            pcm = decoder.decode(opus)
+            if len(pcm) != FRAME * 2:
+                continue
+            senders.append(sender)
+            rows.append(np.frombuffer(pcm, dtype=np.int16))
+        if not rows:
+            return []
+
+        index = {sender: i for i, sender in enumerate(senders)}
+        mask = np.zeros((len(self.listeners), len(senders)), dtype=np.float32)
+        for row, (_lid, sources) in enumerate(self.listeners):
+            for sender in sources:
+                col = index.get(sender)
+                if col is not None:
+                    mask[row, col] = 1.0
+        mixed = mix_minus(np.vstack(rows), mask)
+
+        out = []
+        for row, (lid, _sources) in enumerate(self.listeners):
+            if not mask[row].any():
+                continue
+            encoder = self.encoders.get(lid)
+            if encoder is None:
+                encoder = self.encoders[lid] = self.codec_cls(
+                    complexity=MIX_COMPLEXITY, create_decoder=False
+                )
+            opus = encoder.encode(mixed[row].tobytes())
+            if opus:
+                out.append((lid, opus))
+        return out
+
+
+def mix_worker_main(index, conn):
+    """Entry point of one mixing process: ``("listeners", ...)`` / ``("tick", frames)``."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"[MIX {index}] %(asctime)s %(levelname)s %(message)s",
+    )
+    shard = MixShard(load_codec())
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg is None:
+            return
+        kind, body = msg
+        if kind == "listeners":
+            shard.set_listeners(body)
+        elif kind == "tick":
+            conn.send(shard.tick(body))
+
+
+class MixerService:
+    """Server-side mix-minus for listeners that asked for it with ``MIX``.
+
+    The forwarding thread hands each relevant sender's Opus payload to
+    ``submit``; a mixer thread ticks every 20 ms, takes one frame per
+    sender and fans the work out to worker processes sharded by listener,
+    so each listener's encoder always lives in the same process. Each
+    worker decodes the senders its listeners hear, mixes them with NumPy
+    and re-encodes one stream per listener, which is sent back from the
+    audio socket with SSRC ``MIX_SSRC``.
+    """
+
+    def __init__(self, sock, workers=MIX_WORKERS):
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.pending = {}       # sender -> deque of Opus payloads
+        self.last_heard = {}    # sender -> tick of its last real frame
+        self.listeners = {}     # listener -> (addr, frozenset(senders))
+        self.seq = {}
+        self.procs = []
+        self.conns = []
+        self.shard_senders = []
+        self.running = False
+        self.ticks = 0
+        self.mixed_out = 0
+        self.late_ticks = 0
+        self._version = 0
+        self._sent_version = 0
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def start(self):
+        # Surface a missing libopus here instead of in every worker.
+        load_codec()
+        for index in range(self.workers):
+            parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+            proc = self._ctx.Process(
+                target=mix_worker_main,
+                args=(index, child_conn),
+                daemon=True,
+                name=f"audio-mix-{index}",
+            )
+            proc.start()
+            child_conn.close()
+            self.procs.append(proc)
+            self.conns.append(parent_conn)
+        self.shard_senders = [frozenset() for _ in self.conns]
+        self.running = True
+        threading.Thread(target=self.run, daemon=True, name="audio-mixer").start()
+        logging.info("Server-side mixing enabled (%s worker processes)", self.workers)
+
+    def stop(self):
+        self.running = False
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc in self.procs:
+            proc.join(timeout=2.0)
+
+    def shard_of(self, listener_id):
+        return zlib.crc32(listener_id.encode()) % len(self.conns)
+
+    def load_listeners(self, listeners):
+        """Swap in ``{listener_id: (addr, senders)}``; the mixer thread picks it up next tick."""
+        self.listeners = listeners
+        self._version += 1
+
+    def submit(self, sender, payload):
+        # Called on the forwarding thread; deque append is atomic.
+        queue = self.pending.get(sender)
+        if queue is None:
+            queue = self.pending.setdefault(sender, deque(maxlen=SENDER_QUEUE_FRAMES))
+        queue.append(bytes(payload))
+
+    def run(self):
+        next_tick = time.monotonic()
+        while self.running:
+            next_tick += FRAME_SEC
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -RESYNC_SEC:
+                self.late_ticks += 1
+                next_tick = time.monotonic()
+            try:
+                self.tick()
+            except (EOFError, OSError) as e:
+                logging.error("Mixer worker failed, disabling server-side mixing: %s", e)
+                self.running = False
+
+    def _push_listeners(self, listeners):
+        shards = [[] for _ in self.conns]
+        for lid, (_addr, senders) in listeners.items():
+            shards[self.shard_of(lid)].append((lid, tuple(senders)))
+        for conn, shard in zip(self.conns, shards):
+            conn.send(("listeners", shard))
+        self.shard_senders = [
+            frozenset(s for _lid, senders in shard for s in senders) for shard in shards
+        ]
+        self.seq = {lid: seq for lid, seq in self.seq.items() if lid in listeners}
+
+    def tick(self):
+        listeners = self.listeners
+        if self._sent_version != self._version:
+            self._sent_version = self._version
+            self._push_listeners(listeners)
+
+        self.ticks += 1
+        frames = {}
+        for sender, queue in list(self.pending.items()):
+            try:
+                frames[sender] = queue.popleft()
+                self.last_heard[sender] = self.ticks
+            except IndexError:
+                if self.ticks - self.last_heard.get(sender, 0) <= SENDER_IDLE_TICKS:
+                    frames[sender] = None
+                else:
+                    # A frame racing in right now is lost; the next one re-creates the queue.
+                    self.pending.pop(sender, None)
+                    self.last_heard.pop(sender, None)
+        if not frames:
+            return
+
+        busy = []
+        for conn, wanted in zip(self.conns, self.shard_senders):
+            subset = {s: f for s, f in frames.items() if s in wanted}
+            if subset:
+                conn.send(("tick", subset))
+                busy.append(conn)
+
+        timestamp = (self.ticks * FRAME) & 0xFFFFFFFF
+        for conn in busy:
+            for lid, opus in conn.recv():
+                entry = listeners.get(lid)
+                if entry is None:
+                    continue
+                seq = self.seq.get(lid, 0)
+                self.seq[lid] = (seq + 1) & 0xFFFF
+                try:
+                    self.sock.sendto(pack_header(0, seq, timestamp, MIX_SSRC) + opus, entry[0])
+                    self.mixed_out += 1
+                except OSError:
+                    pass
@@ -0,0 +1,199 @@
+import ctypes
+import errno
+import socket
+import sys
+from ctypes import POINTER, c_int, c_size_t, c_ubyte, c_uint, c_uint16, c_uint32, c_ushort, c_void_p
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+SOCKADDR_IN_SIZE = 16
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", c_void_p), ("iov_len", c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", c_void_p),
+        ("msg_namelen", c_uint32),
+        ("msg_iov", POINTER(_IoVec)),
+        ("msg_iovlen", c_size_t),
+        ("msg_control", c_void_p),
+        ("msg_controllen", c_size_t),
+        ("msg_flags", c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", c_ushort),
+        ("sin_port", c_uint16),
+        ("sin_addr", c_ubyte * 4),
+        ("sin_zero", c_ubyte * 8),
+    ]
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    if not (hasattr(libc, "recvmmsg") and hasattr(libc, "sendmmsg")):
+        return None
+    libc.recvmmsg.argtypes = [c_int, c_void_p, c_uint, c_int, c_void_p]
+    libc.recvmmsg.restype = c_int
+    libc.sendmmsg.argtypes = [c_int, c_void_p, c_uint, c_int]
+    libc.sendmmsg.restype = c_int
+    return libc
+
+
+_libc = _load_libc()
+
+
+def mmsg_available():
+    return _libc is not None
+
+
+class RecvBatch:
+    """Preallocated receive slots filled by one recvmmsg() call.
+
+    Buffers are bytearrays so callers can read them through memoryviews
+    without copying, and the slot addresses can be handed to sendmmsg()
+    to forward the payload as-is.
+    """
+
+    def __init__(self, size, bufsize):
+        self.size = size
+        self.bufsize = bufsize
+        self.buffers = [bytearray(bufsize) for _ in range(size)]
+        self.views = [memoryview(b) for b in self.buffers]
+        self._raw = [(ctypes.c_char * bufsize).from_buffer(b) for b in self.buffers]
+        self.addresses = [ctypes.addressof(r) for r in self._raw]
+        self._iov = (_IoVec * size)()
+        self._names = (_SockAddrIn * size)()
+        self._msgs = (_MMsgHdr * size)()
+        self._addr_cache = {}
+        self._used = 0
+        for i in range(size):
+            self._iov[i].iov_base = self.addresses[i]
+            self._iov[i].iov_len = bufsize
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names[i])
+            hdr.msg_namelen = SOCKADDR_IN_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self, fd):
+        """Drain up to ``size`` datagrams without blocking; returns the count."""
+        # The kernel only rewrites the name length of slots it filled last time.
+        for i in range(self._used):
+            self._msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+        n = _libc.recvmmsg(fd, self._msgs, self.size, MSG_DONTWAIT, None)
+        self._used = max(n, 0)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return 0
+            raise OSError(err, "recvmmsg: " + errno.errorcode.get(err, str(err)))
+        return n
+
+    def length(self, i):
+        return self._msgs[i].msg_len
+
+    def addr(self, i):
+        name = self._names[i]
+        key = (bytes(name.sin_addr), name.sin_port)
+        addr = self._addr_cache.get(key)
+        if addr is None:
+            addr = (socket.inet_ntoa(key[0]), socket.ntohs(key[1]))
+            if len(self._addr_cache) > 65536:
+                self._addr_cache.clear()
+            self._addr_cache[key] = addr
+        return addr
+
+
+class SendBatch:
+    """Fixed-capacity sendmmsg() queue pointing at caller-owned buffers."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.errors = 0
+        self.dropped = 0
+        self._iov = (_IoVec * capacity)()
+        self._msgs = (_MMsgHdr * capacity)()
+        self._names = {}
+        self._dests = [None] * capacity
+        for i in range(capacity):
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_namelen = SOCKADDR_IN_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+
+    def _sockaddr(self, addr):
+        entry = self._names.get(addr)
+        if entry is None:
+            name = _SockAddrIn()
+            name.sin_family = socket.AF_INET
+            name.sin_port = socket.htons(addr[1])
+            name.sin_addr[:] = socket.inet_aton(addr[0])
+            entry = self._names[addr] = (name, ctypes.addressof(name))
+        return entry[1]
+
+    def add(self, buf_address, length, addr):
+        """Queue one datagram; returns False when the batch is full."""
+        if self.count >= self.capacity:
+            return False
+        i = self.count
+        self._iov[i].iov_base = buf_address
+        self._iov[i].iov_len = length
+        self._msgs[i].msg_hdr.msg_name = self._sockaddr(addr)
+        self._dests[i] = addr
+        self.count = i + 1
+        return True
+
+    def flush(self, fd, on_unsent=None):
+        """Send everything queued; returns the number of datagrams sent.
+
+        Datagrams that could not be sent are reported to
+        ``on_unsent(addr, buf_address, length, would_block)`` while their
+        buffers are still valid, so the caller can keep a copy.
+        """
+        total = self.count
+        sent = 0
+        i = 0
+        size = ctypes.sizeof(_MMsgHdr)
+        while i < total:
+            n = _libc.sendmmsg(fd, ctypes.byref(self._msgs, i * size), total - i, MSG_DONTWAIT)
+            if n > 0:
+                i += n
+                sent += n
+                continue
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS):
+                # Kernel send buffer is full: the rest goes back to the caller.
+                self.dropped += total - i
+                if on_unsent is not None:
+                    for j in range(i, total):
+                        iov = self._iov[j]
+                        on_unsent(self._dests[j], iov.iov_base, iov.iov_len, True)
+                break
+            # Per-destination failure (e.g. ICMP unreachable): skip that datagram.
+            self.errors += 1
+            if on_unsent is not None:
+                iov = self._iov[i]
+                on_unsent(self._dests[i], iov.iov_base, iov.iov_len, False)
+            i += 1
+        self.count = 0
+        if len(self._names) > 65536:
+            # Only safe once nothing queued points into the cache.
+            self._names.clear()
+        return sent
@@ -0,0 +1,174 @@
+import logging
+import socket
+import struct
+
+RING_SIZE = 64                  # packets kept per sender (~1.3 s at 50 pps)
+SLOT_BYTES = 512                # 48 kbit/s Opus frames are ~120 bytes; larger packets are not kept
+MAX_RETRANSMIT_AGE_SEC = 0.25   # older packets would miss any receiver's jitter buffer
+NACK_RATE = 100.0               # retransmits per second per requester
+NACK_BURST = 20
+MAX_REQUESTERS = 4096
+RELAY_ADDR = struct.Struct("!4sH")   # requester IPv4 + port, ahead of a relayed NACK
+MAX_RELAY_PACKET = 512
+
+
+class RetransmitRing:
+    """The last ``size`` forwarded packets of one sender, slotted by seq.
+
+    Written on the forwarding thread for every forwarded binary packet by
+    copying into preallocated per-slot buffers, like the engine's receive
+    buffers, so storing allocates nothing. Lookups check the stored seq,
+    so a slot overwritten by a newer packet is a miss rather than a wrong
+    resend.
+    """
+
+    __slots__ = ("size", "seqs", "views", "lengths", "times", "last")
+
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.seqs = [-1] * size
+        self.views = [memoryview(bytearray(SLOT_BYTES)) for _ in range(size)]
+        self.lengths = [0] * size
+        self.times = [0.0] * size
+        self.last = None
+
+    def store(self, seq, packet, now):
+        i = seq % self.size
+        n = len(packet)
+        self.last = now
+        if n > SLOT_BYTES:
+            self.seqs[i] = -1
+            return
+        self.views[i][:n] = packet
+        self.lengths[i] = n
+        self.times[i] = now
+        self.seqs[i] = seq
+
+    def fresh(self, now, max_age):
+        """True if this ring stored a packet within ``max_age``."""
+        return self.last is not None and now - self.last <= max_age
+
+    def get(self, seq, now, max_age):
+        i = seq % self.size
+        if self.seqs[i] != seq or now - self.times[i] > max_age:
+            return None
+        # A copy: the slot is reused by the next packet with this index.
+        return bytes(self.views[i][: self.lengths[i]])
+
+
+class NackRelay:
+    """Passes NACKs between forwarding workers that share the audio port.
+
+    SO_REUSEPORT hashes a listener's NACK to any worker, but only the one
+    that forwards the sender holds its ring. A worker that has not
+    forwarded the sender lately sends the NACK, prefixed with the
+    requester's address, to its siblings over loopback, and the owner
+    answers it. ``peers`` is filled in once every worker is up.
+    """
+
+    def __init__(self, host="127.0.0.1"):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, 0))
+        self.sock.setblocking(False)
+        self.addr = self.sock.getsockname()
+        self.peers = ()
+
+    def forward(self, packet, addr):
+        try:
+            data = RELAY_ADDR.pack(socket.inet_aton(addr[0]), addr[1]) + bytes(packet)
+        except (OSError, struct.error):
+            return
+        for peer in self.peers:
+            try:
+                self.sock.sendto(data, peer)
+            except OSError:
+                pass
+
+    def drain(self, handle):
+        """Call ``handle(nack_packet, requester_addr)`` for every queued relay."""
+        while True:
+            try:
+                data = self.sock.recv(MAX_RELAY_PACKET)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logging.debug("NACK relay recv error: %s", e)
+                return
+            if len(data) <= RELAY_ADDR.size:
+                continue
+            ip, port = RELAY_ADDR.unpack_from(data)
+            handle(memoryview(data)[RELAY_ADDR.size :], (socket.inet_ntoa(ip), port))
+
+    def close(self):
+        self.sock.close()
+
+
+class _Bucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens, stamp):
+        self.tokens = tokens
+        self.stamp = stamp
+
+
+class NackResponder:
+    """Answers NACKs from the rings, bounded so NACKs cannot amplify load.
+
+    Only listeners the sender's route actually unicasts to may ask (the
+    NACK's source address must be one of its destinations), and each
+    requester gets a token bucket of ``rate`` retransmits per second.
+    """
+
+    def __init__(self, rate=NACK_RATE, burst=NACK_BURST, max_age=MAX_RETRANSMIT_AGE_SEC):
+        self.rate = rate
+        self.burst = burst
+        self.max_age = max_age
+        self.buckets = {}   # requester addr -> _Bucket
+        self.requests = 0
+        self.resent = 0
+        self.missed = 0
+        self.limited = 0
+        self.rejected = 0
+
+    def _bucket(self, addr, now):
+        bucket = self.buckets.get(addr)
+        if bucket is None:
+            if len(self.buckets) >= MAX_REQUESTERS:
+                self.buckets.clear()
+            bucket = self.buckets[addr] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.stamp) * self.rate)
+            bucket.stamp = now
+        return bucket
+
+    def respond(self, route, seqs, addr, sock, now):
+        self.requests += 1
+        if addr not in route.dest_addrs:
+            self.rejected += 1
+            if self.rejected % 100 == 1:
+                logging.warning("NACK for %s from %s, which is not one of its listeners", route.client_id, addr)
+            return
+        bucket = self._bucket(addr, now)
+        for seq in seqs:
+            packet = route.ring.get(seq, now, self.max_age)
+            if packet is None:
+                self.missed += 1
+                continue
+            if bucket.tokens < 1.0:
+                self.limited += 1
+                continue
+            bucket.tokens -= 1.0
+            try:
+                sock.sendto(packet, addr)
+            except OSError:
+                return
+            self.resent += 1
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "resent": self.resent,
+            "missed": self.missed,
+            "limited": self.limited,
+            "rejected": self.rejected,
+        }
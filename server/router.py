@@ -0,0 +1,320 @@
+import logging
+import socket
+import time
+from collections import defaultdict
+
+import shared  # noqa: F401  (packet lives in ../client)
+from nack import NackResponder, RetransmitRing
+from packet import FLAG_NACK, FLAG_RESUME, is_binary, payload_offset, unpack_header, unpack_level, unpack_nack
+
+MULTICAST_TTL = 1
+SENDER_PEEK_BYTES = 64
+
+
+class SenderStats:
+    """Plain counters bumped on the forwarding thread; readers tolerate torn snapshots."""
+
+    __slots__ = (
+        "packets_in",
+        "bytes_in",
+        "forwarded",
+        "forwarded_bytes",
+        "packets_out",
+        "bytes_out",
+        "last_seen",
+        "suppressed",
+        "resume",
+    )
+
+    def __init__(self):
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.forwarded = 0          # packets that went out to at least one destination
+        self.forwarded_bytes = 0
+        self.packets_out = 0        # copies sent, i.e. forwarded x fan-out
+        self.bytes_out = 0
+        self.last_seen = 0.0
+        self.suppressed = 0
+        self.resume = False         # the next forwarded packet follows suppressed ones
+
+
+class Route:
+    """Precomputed fan-out for one sender: ``dests`` is a tuple of ``(sock, addr)``."""
+
+    __slots__ = (
+        "client_id",
+        "ssrc",
+        "source_ip",
+        "room_id",
+        "version",
+        "dests",
+        "dest_addrs",
+        "fanout",
+        "mixed",
+        "stats",
+        "ring",
+        "base_packets",
+        "base_bytes",
+    )
+
+    def __init__(self, client_id, ssrc, source_ip, room_id, version, dests, mixed, stats, ring):
+        self.client_id = client_id
+        self.ssrc = ssrc
+        self.source_ip = source_ip
+        self.room_id = room_id
+        self.version = version
+        self.dests = dests
+        self.dest_addrs = frozenset(addr for _sock, addr in dests)
+        self.fanout = len(dests)
+        self.mixed = mixed
+        self.stats = stats
+        self.ring = ring
+        # Sender counters when this table was loaded, for per-destination totals.
+        self.base_packets = stats.forwarded
+        self.base_bytes = stats.forwarded_bytes
+
+
+class Router:
+    """Per-packet routing over a versioned snapshot of the registry.
+
+    The registry owner produces plain-data route specs
+    ``(client_id, ssrc, source_ip, room_id, unicast_addrs, room_group, mixed)``
+    where ``room_group`` is ``(room_id, (group_ip, port))`` or None (sent to
+    in addition to any unicast addresses, e.g. trunk peers) and ``mixed``
+    says whether a server-mixed listener hears the sender. ``load``
+    materializes them against this router's own sockets, so the same specs
+    can drive an in-process forwarder or a worker process.
+
+    With a ``selector`` (see ``speakers.ActiveSpeakerSelector``), packets
+    carrying a level byte are only forwarded while their sender is one of
+    the loudest speakers of its room; the first packet forwarded after a
+    suppressed run carries ``FLAG_RESUME``. Payloads of ``mixed`` senders are also
+    handed to ``mixer.submit`` (see ``mixer.MixerService``).
+
+    Forwarded binary packets are kept in a per-sender ``RetransmitRing``
+    and NACKs from listeners are answered from it (see ``nack``). NACKs
+    about senders this router does not know go to ``fallback``, the trunk
+    router, whose rings hold audio from other servers. In a shard worker,
+    NACKs for senders forwarded by a sibling go over ``relay``
+    (``nack.NackRelay``).
+    """
+
+    def __init__(self, sock, selector=None):
+        self.sock = sock
+        self.selector = selector
+        self.mixer = None
+        self.version = 0
+        self.routes = {}
+        self.routes_by_ssrc = {}
+        self.stats = {}
+        self.rings = {}
+        self.nack = NackResponder()
+        self.relay = None
+        self.fallback = None
+        self.speaker_keep = (0, None)   # (version, sender -> room) for selector.forget
+        self.speakers_version = 0
+        self.multicast_socks = {}
+        self.packet_count = defaultdict(int)
+        self.malformed_count = 0
+        self.dest_totals = {}   # addr -> [packets, bytes] from retired tables
+
+    def get_multicast_sock(self, room_id):
+        msock = self.multicast_socks.get(room_id)
+        if msock is None:
+            msock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            msock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+            msock.setblocking(False)
+            self.multicast_socks[room_id] = msock
+        return msock
+
+    def load(self, version, specs):
+        """Swap in a new table; the forwarder only ever sees complete dicts."""
+        if version <= self.version:
+            return
+        self._fold(self.routes, self.dest_totals)
+        routes = {}
+        stats = {}
+        rings = {}
+        for client_id, ssrc, source_ip, room_id, unicast_addrs, room_group, mixed in specs:
+            dests = tuple((self.sock, addr) for addr in unicast_addrs)
+            if room_group:
+                dests += ((self.get_multicast_sock(room_group[0]), room_group[1]),)
+            stats[client_id] = self.stats.get(client_id) or SenderStats()
+            rings[client_id] = self.rings.get(client_id) or RetransmitRing()
+            routes[client_id] = Route(
+                client_id, ssrc, source_ip, room_id, version, dests, mixed, stats[client_id], rings[client_id]
+            )
+        routes_by_ssrc = {route.ssrc: route for route in routes.values()}
+        self.stats = stats
+        self.rings = rings
+        self.routes = routes
+        self.routes_by_ssrc = routes_by_ssrc
+        self.version = version
+        if self.selector is not None:
+            # Applied by route_packet: the selector belongs to the forwarding thread.
+            self.speaker_keep = (version, {cid: route.room_id for cid, route in routes.items()})
+
+    @staticmethod
+    def _fold(routes, totals):
+        """Credit every destination with what each route forwarded since it was loaded."""
+        for route in routes.values():
+            stats = route.stats
+            packets = stats.forwarded - route.base_packets
+            if not packets:
+                continue
+            size = stats.forwarded_bytes - route.base_bytes
+            for _sock, addr in route.dests:
+                total = totals.get(addr)
+                if total is None:
+                    total = totals[addr] = [0, 0]
+                total[0] += packets
+                total[1] += size
+
+    def snapshot(self):
+        """Plain-data counters for metrics; safe to call from another thread or process."""
+        dests = {addr: list(total) for addr, total in list(self.dest_totals.items())}
+        routes = self.routes
+        self._fold(routes, dests)
+        senders = {
+            cid: (
+                route.stats.packets_in,
+                route.stats.bytes_in,
+                route.stats.packets_out,
+                route.stats.bytes_out,
+                route.stats.suppressed,
+                route.fanout,
+            )
+            for cid, route in routes.items()
+        }
+        return {
+            "senders": senders,
+            "dests": dests,
+            "malformed": self.malformed_count,
+            "nack": self.nack.snapshot(),
+        }
+
+    @staticmethod
+    def extract_sender_id(packet):
+        # Sender IDs are short; only the head of the packet needs copying.
+        head = bytes(packet[:SENDER_PEEK_BYTES])
+        parts = head.split(b"|", 1)
+        if len(parts) == 2:
+            sender = parts[0].decode(errors="ignore").strip()
+            if sender:
+                return sender
+
+        if b":" in head:
+            sender = head.split(b":", 1)[0].decode(errors="ignore").strip()
+            if sender:
+                return sender
+        return None
+
+    def handle_nack(self, packet, ssrc, addr, relayed=False):
+        route = self.routes_by_ssrc.get(ssrc)
+        if route is None and self.fallback is not None:
+            route = self.fallback.routes_by_ssrc.get(ssrc)
+        if route is None:
+            return
+        now = time.monotonic()
+        relay = self.relay
+        if relay is not None and relay.peers and not route.ring.fresh(now, self.nack.max_age):
+            # Another worker forwards this sender; it holds the packets.
+            if not relayed:
+                relay.forward(packet, addr)
+            return
+        self.nack.respond(route, unpack_nack(packet), addr, self.sock, now)
+
+    def handle_relayed_nack(self, packet, addr):
+        """A NACK a sibling worker received on our behalf (see ``nack.NackRelay``)."""
+        header = unpack_header(packet)
+        if header is not None and header[1] & FLAG_NACK:
+            self.handle_nack(packet, header[4], addr, relayed=True)
+
+    def route_packet(self, packet, addr):
+        """Return the ``(sock, addr)`` pairs a packet must be forwarded to.
+
+        Runs on the forwarding engine thread for every datagram, so it must
+        not block; the engine performs the actual sends in batches.
+        """
+        if not packet:
+            return None
+        if addr is None:
+            addr = ("unknown", 0)
+
+        header = None
+        if is_binary(packet):
+            header = unpack_header(packet)
+            if header is None:
+                sender_id = None
+            elif header[1] & FLAG_NACK:
+                self.handle_nack(packet, header[4], addr)
+                return None
+            else:
+                route = self.routes_by_ssrc.get(header[4])
+                sender_id = f"ssrc:{header[4]}"
+        else:
+            sender_id = self.extract_sender_id(packet)
+            route = self.routes.get(sender_id)
+
+        if sender_id is None:
+            self.malformed_count += 1
+            if self.malformed_count % 50 == 1:
+                logging.warning(
+                    "Malformed audio packets=%s latest_from=%s",
+                    self.malformed_count,
+                    addr,
+                )
+            return None
+
+        if route is None:
+            self.packet_count[sender_id] += 1
+            if self.packet_count[sender_id] % 500 == 1:
+                logging.warning("Audio from unregistered sender: %s", sender_id)
+            return None
+
+        size = len(packet)
+        stats = route.stats
+        stats.packets_in += 1
+        stats.bytes_in += size
+        now = stats.last_seen = time.monotonic()
+        if addr[0] != "unknown" and addr[0] != route.source_ip and stats.packets_in % 100 == 1:
+            logging.warning(
+                "IP mismatch warning for %s: expected %s, got %s. Allowing anyway.",
+                route.client_id,
+                route.source_ip,
+                addr[0],
+            )
+
+        if self.selector is not None and header is not None:
+            keep_version, keep = self.speaker_keep
+            if keep_version != self.speakers_version:
+                self.selector.forget(keep)
+                self.speakers_version = keep_version
+            level = unpack_level(packet, header[1])
+            if level is not None and not self.selector.admit(
+                route.room_id, route.client_id, level[0], level[1], now
+            ):
+                stats.suppressed += 1
+                stats.resume = True
+                return None
+            if stats.resume:
+                # Tell listeners the seq gap they are about to see is not loss.
+                packet[1] = header[1] | FLAG_RESUME
+                stats.resume = False
+
+        if route.mixed and self.mixer is not None:
+            if header is not None:
+                self.mixer.submit(route.client_id, packet[payload_offset(header[1]):])
+            else:
+                sep = bytes(packet[:SENDER_PEEK_BYTES]).find(b":")
+                self.mixer.submit(route.client_id, packet[sep + 1:])
+
+        fanout = route.fanout
+        if fanout:
+            if header is not None:
+                route.ring.store(header[2], packet, now)
+            stats.forwarded += 1
+            stats.forwarded_bytes += size
+            stats.packets_out += fanout
+            stats.bytes_out += fanout * size
+        return route.dests
@@ -1,38 +1,119 @@
+import argparse
 import asyncio
 import hashlib
 import logging
+import random
 import socket
 import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
+
+import shared  # noqa: F401  (packet lives in ../client)
+from expiry import TimerWheel
+from handoff import HandoffServer, handoff_path, handoff_supported, take_over
+from forwarder import MAX_PACKET_AGE_SEC, SEND_QUEUE_DEPTH, ForwardingEngine
+from metrics import METRICS_PORT, MetricsExporter, engine_snapshot
+from packet import AUDIO_VERSION
+from router import Router
+from shard import ShardPool
+from speakers import MAX_SPEAKERS, ActiveSpeakerSelector
+from trunk import TRUNK_PORT, Trunk, parse_peer
 
 DISCOVERY_PORT = 50000
 CONTROL_PORT = 50001
 AUDIO_PORT = 50002
+PROBE_PORT = 50004    # VOICE_DISCOVER probes; never shared with clients
 DEFAULT_ROOM = "main"
 MULTICAST_BASE = "239.0.0."
-MULTICAST_TTL = 1
 CLIENT_TIMEOUT_SEC = 30
+FIRST_LINE_TIMEOUT_SEC = 10  # a connection must say something before it holds a slot
+EXPIRY_TICK_SEC = 1.0
+MIX_WORKERS = 2
 SERVER_SECRET = "mysecret"
+SESSION_VERSION = 1
+SESSION_MAX_BACKLOG = 256 * 1024
 
 
 class Client:
-    def __init__(self, client_id, ip, audio_port):
+    def __init__(self, client_id, ip, audio_port, ssrc=0):
         self.client_id = client_id
+        self.ssrc = ssrc
         self.addr = (ip, audio_port)
         self.room = None
         self.targets = set()
-        self.last_heartbeat = time.time()
+        self.mixed = False
+        self.mix_hear = None  # ids a mixed listener hears; None = everyone
+        self.session = None  # control session that registered it, for targeted events
+        self.last_heartbeat = time.monotonic()
+
+
+class Session:
+    def __init__(self, writer, peer_ip):
+        self.writer = writer
+        self.peer_ip = peer_ip
+        self.client_id = None
+        self.peer = None  # server id when a trunk peer opened this session
+        self.persistent = False
+        self.pending = deque()  # lines read but not served yet (see handoff)
 
 
 class VoiceServer:
-    def __init__(self):
+    def __init__(
+        self,
+        workers=0,
+        client_timeout=CLIENT_TIMEOUT_SEC,
+        expiry_tick=EXPIRY_TICK_SEC,
+        max_speakers=MAX_SPEAKERS,
+        mix_workers=MIX_WORKERS,
+        metrics_port=METRICS_PORT,
+        metrics_host="127.0.0.1",
+        send_queue_depth=SEND_QUEUE_DEPTH,
+        max_packet_age=MAX_PACKET_AGE_SEC,
+        control_port=CONTROL_PORT,
+        audio_port=AUDIO_PORT,
+        trunk_port=TRUNK_PORT,
+        peers=(),
+        server_id=None,
+        takeover=False,
+        handoff=None,
+    ):
         self.clients = {}
+        self.remote = {}  # client_id -> trunk.RemoteClient on a peer server
+        self.ssrcs = {}
+        self.sessions = set()
+        self.connections = set()  # every open control connection, sessions or one-shot
         self.rooms = defaultdict(set)
-        self.packet_count = defaultdict(int)
-        self.malformed_count = 0
         self.loop = None
-        self.multicast_socks = {}
+        self.room_groups = {}
+        self.route_version = 0
+        self.workers = workers
+        self.max_speakers = max_speakers
+        self.mix_workers = mix_workers
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.engine_options = {"queue_depth": send_queue_depth, "max_age": max_packet_age}
+        self.mixer = None
+        self.mix_sources = {}
+        self.client_timeout = client_timeout
+        self.expiry = TimerWheel(expiry_tick, client_timeout, time.monotonic())
+        self.shard_activity = {}
+        self.shards = None
+        self.audio_sock = None
+        self.router = None
+        self.forwarder = None
+        self.control_port = control_port
+        self.audio_port = audio_port
+        self.control_server = None
+        self.metrics_server = None
+        self.discovery_sock = None
+        self.takeover = takeover
+        self.handoff_path = handoff if handoff is not None else handoff_path(control_port)
+        self.handing_off = False
+        self.trunk = None
+        if peers:
+            self.trunk = Trunk(
+                self, server_id or f"{socket.gethostname()}:{control_port}", trunk_port, peers, SERVER_SECRET
+            )
 
     @staticmethod
     def get_multicast_addr(room_id):
@@ -45,10 +126,26 @@ class VoiceServer:
         # Backward-compatible: allow old REGISTER format if secret is not supplied.
         if len(parts) == 3:
             return True
-        if len(parts) == 4:
+        if len(parts) in (4, 5):
             return parts[3] == SERVER_SECRET
         return False
 
+    @staticmethod
+    def _register_audio_version(parts):
+        # REGISTER:<id>:<port>:<secret>:<audio_version> opts into binary headers.
+        if len(parts) != 5:
+            return 0
+        try:
+            return min(int(parts[4]), AUDIO_VERSION)
+        except ValueError:
+            return 0
+
+    def _allocate_ssrc(self):
+        while True:
+            ssrc = random.getrandbits(32)
+            if ssrc and ssrc not in self.ssrcs:
+                return ssrc
+
     def broadcast_server(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
@@ -59,60 +156,261 @@ class VoiceServer:
                 logging.error("Discovery broadcast error: %s", e)
             time.sleep(2)
 
-    async def handle_control(self, reader, writer):
-        peer = writer.get_extra_info("peername")
-        peer_ip = peer[0] if peer else "0.0.0.0"
+    def answer_discovery(self, sock=None):
+        # Probes get an immediate unicast reply with everything a client needs
+        # to connect, so it does not have to wait for the next broadcast. They
+        # have a port of their own: clients on this machine share
+        # DISCOVERY_PORT for broadcasts, and the kernel would hand some
+        # unicast probes to one of them instead of to this socket.
+        s = sock
+        if s is None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                s.bind(("", PROBE_PORT))
+            except OSError as e:
+                logging.error("Discovery responder disabled: %s", e)
+                s.close()
+                return
+        s.setblocking(True)
+        self.discovery_sock = s
+        reply = f"VOICE_SERVER:{SESSION_VERSION}:{self.control_port}:{self.audio_port}".encode()
+        while True:
+            try:
+                data, addr = s.recvfrom(1024)
+                if data == b"VOICE_DISCOVER":
+                    s.sendto(reply, addr)
+            except OSError as e:
+                logging.error("Discovery reply error: %s", e)
+                time.sleep(0.1)
+
+    async def handle_control(self, reader, writer, conn=None):
+        if conn is None:
+            peer = writer.get_extra_info("peername")
+            conn = Session(writer, peer[0] if peer else "0.0.0.0")
+        self.connections.add(conn)
+        try:
+            if not conn.persistent:
+                message = await self.read_control_line(reader, conn, FIRST_LINE_TIMEOUT_SEC)
+                if message is None:
+                    return
+                if not message.startswith("#"):
+                    await self.answer_once(conn, message)
+                    return
+                conn.persistent = True
+                conn.pending.appendleft(message)
+            await self.run_session(reader, conn)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            # During a hot restart the connection belongs to the new process.
+            if not self.handing_off:
+                self.connections.discard(conn)
+                conn.writer.close()
+
+    async def read_control_line(self, reader, conn, timeout=None):
+        """Next line for ``conn``; None once the peer closes.
+
+        While a hot restart is handing the connection over, lines are only
+        stashed in ``conn.pending`` for the new process and never returned.
+        """
+        while True:
+            if conn.pending and not self.handing_off:
+                return conn.pending.popleft()
+            if timeout is None:
+                raw = await reader.readline()
+            else:
+                raw = await asyncio.wait_for(reader.readline(), timeout)
+            if not raw:
+                return None
+            line = raw.decode(errors="ignore").strip()
+            if not self.handing_off:
+                return line
+            conn.pending.append(line)
+
+    async def answer_once(self, conn, message):
         response = b"ERR\n"
+        try:
+            response = self.process_command(message, conn.peer_ip)
+        except Exception as e:
+            logging.exception("Control error from %s: %s", conn.peer_ip, e)
+        writer = conn.writer
+        writer.write(response)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def run_session(self, reader, session):
+        """Serve ``#<rid> <command>`` frames on one connection until it drops.
 
+        Any frame counts as a heartbeat for the registered client; a session
+        that stays silent past the client timeout, or closes, unregisters it.
+        """
+        writer = session.writer
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+        self.sessions.add(session)
         try:
-            raw = await reader.readline()
-            message = raw.decode(errors="ignore").strip()
-            parts = message.split(":")
-            cmd = parts[0] if parts else ""
-            client_id = parts[1] if len(parts) > 1 else ""
-
-            if cmd == "REGISTER" and self._validate_register(parts):
-                audio_port = int(parts[2])
-                if client_id in self.clients:
-                    response = b"TAKEN\n"
-                    logging.warning("Client %s already in use", client_id)
+            while True:
+                line = await self.read_control_line(reader, session, self.client_timeout)
+                if line is None:
+                    break
+                if not line.startswith("#"):
+                    continue
+                rid, _, command = line[1:].partition(" ")
+                try:
+                    response = self.process_command(command, session.peer_ip, session)
+                except Exception as e:
+                    logging.exception("Control error from %s: %s", session.peer_ip, e)
+                    response = b"ERR\n"
+                self.touch_client(session.client_id)
+                writer.write(b"#" + rid.encode() + b" " + response)
+                await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            # During a hot restart the connection belongs to the new process.
+            if not self.handing_off:
+                self.close_session(session)
+
+    def close_session(self, session):
+        self.sessions.discard(session)
+        if session.peer is not None and self.trunk is not None:
+            self.trunk.close_session(session)
+        if session.client_id is not None and session.client_id in self.clients:
+            logging.info("Control session for %s closed", session.client_id)
+            self.remove_client(session.client_id)
+        session.writer.close()
+
+    def process_command(self, message, peer_ip, session=None):
+        response = b"ERR\n"
+        parts = message.split(":")
+        cmd = parts[0] if parts else ""
+        client_id = parts[1] if len(parts) > 1 else ""
+
+        if cmd == "REGISTER" and self._validate_register(parts):
+            audio_port = int(parts[2])
+            if client_id in self.clients or client_id in self.remote:
+                response = b"TAKEN\n"
+                logging.warning("Client %s already in use", client_id)
+            else:
+                ssrc = self._allocate_ssrc()
+                client = Client(client_id, peer_ip, audio_port, ssrc)
+                self.clients[client_id] = client
+                self.ssrcs[ssrc] = client
+                self.touch_client(client_id)
+                if session is not None:
+                    session.client_id = client_id
+                    client.session = session
+                self.push_event(f"ADD:{client_id}:{ssrc}")
+                self.join_room(client_id, DEFAULT_ROOM)
+                if self._register_audio_version(parts) > 0:
+                    response = f"OK:{ssrc}\n".encode()
                 else:
-                    self.clients[client_id] = Client(client_id, peer_ip, audio_port)
-                    self.join_room(client_id, DEFAULT_ROOM)
                     response = b"OK\n"
-                    logging.info("%s registered from %s:%s", client_id, peer_ip, audio_port)
-
-            elif cmd == "LIST":
-                response = (",".join(sorted(self.clients.keys())) + "\n").encode()
-
-            elif cmd == "PING" and client_id in self.clients:
-                self.clients[client_id].last_heartbeat = time.time()
-                response = b"OK\n"
-
-            elif cmd == "JOIN" and len(parts) == 3 and client_id in self.clients:
-                room_id = parts[2].strip() or DEFAULT_ROOM
-                self.join_room(client_id, room_id)
-                m_addr = self.get_multicast_addr(room_id)
-                response = f"OK:{m_addr}\n".encode()
-
-            elif cmd in ("TARGETS", "TALK") and client_id in self.clients:
-                targets_str = parts[2] if len(parts) > 2 else ""
-                targets = {t for t in targets_str.split(",") if t}
-                self.clients[client_id].targets = targets
+                logging.info("%s registered from %s:%s ssrc=%s", client_id, peer_ip, audio_port, ssrc)
+
+        elif cmd == "HELLO" and session is not None:
+            response = f"OK:{SESSION_VERSION}\n".encode()
+
+        elif cmd == "LIST":
+            response = (",".join(sorted(list(self.clients) + list(self.remote))) + "\n").encode()
+
+        elif cmd == "ROSTER":
+            everyone = list(self.clients.items()) + list(self.remote.items())
+            roster = ",".join(f"{cid}={cl.ssrc}" for cid, cl in sorted(everyone))
+            response = f"OK:{roster}\n".encode()
+
+        elif cmd in ("PEER", "FED"):
+            if self.trunk is None:
+                response = b"ERR:NO_TRUNK\n"
+            else:
+                response = self.trunk.handle(parts, session, peer_ip)
+
+        elif cmd == "PING" and client_id in self.clients:
+            self.touch_client(client_id)
+            response = b"OK\n"
+
+        elif cmd == "JOIN" and len(parts) == 3 and client_id in self.clients:
+            room_id = parts[2].strip() or DEFAULT_ROOM
+            self.join_room(client_id, room_id)
+            m_addr = self.get_room_group(room_id)[0]
+            response = f"OK:{m_addr}\n".encode()
+
+        elif cmd in ("TARGETS", "TALK") and client_id in self.clients:
+            targets_str = parts[2] if len(parts) > 2 else ""
+            targets = {t for t in targets_str.split(",") if t}
+            self.clients[client_id].targets = targets
+            self.rebuild_routes()
+            if self.trunk is not None:
+                self.trunk.publish(client_id)
+            response = b"OK\n"
+            logging.info("%s targets updated: %s", client_id, sorted(targets))
+
+        elif cmd == "MIX" and len(parts) >= 3 and client_id in self.clients:
+            client = self.clients[client_id]
+            mode = parts[2].strip().upper()
+            if mode == "OFF":
+                client.mixed = False
+                client.mix_hear = None
+                self.rebuild_routes()
                 response = b"OK\n"
-                logging.info("%s targets updated: %s", client_id, sorted(targets))
-
-            elif cmd == "UNREGISTER" and client_id in self.clients:
-                self.remove_client(client_id)
+            elif mode == "ON" and self.ensure_mixer():
+                client.mixed = True
+                client.mix_hear = {t for t in parts[3].split(",") if t} if len(parts) > 3 else None
+                self.rebuild_routes()
                 response = b"OK\n"
+                logging.info("%s receives a server mix", client_id)
+            else:
+                response = b"ERR:MIX_UNAVAILABLE\n"
+
+        elif cmd == "REPORT" and len(parts) == 3 and client_id in self.clients:
+            for entry in parts[2].split(","):
+                sender_id, sep, values = entry.partition("=")
+                stats = values.split("/")
+                if sep and len(stats) == 3 and all(x.isdigit() for x in stats):
+                    self.relay_report(sender_id, client_id, stats)
+            response = b"OK\n"
+
+        elif cmd == "UNREGISTER" and client_id in self.clients:
+            self.remove_client(client_id)
+            if session is not None and session.client_id == client_id:
+                session.client_id = None
+            response = b"OK\n"
+
+        return response
+
+    def push_event(self, event):
+        """Send ``EVENT:<event>`` to every open session without awaiting."""
+        if not self.sessions or self.handing_off:
+            return
+        line = f"EVENT:{event}\n".encode()
+        for session in list(self.sessions):
+            if session.peer is None:
+                self._write_event(session, line)
+
+    def _write_event(self, session, line):
+        transport = session.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > SESSION_MAX_BACKLOG:
+            logging.warning("Dropping slow control session from %s", session.peer_ip)
+            transport.abort()
+            return
+        session.writer.write(line)
 
-        except Exception as e:
-            logging.exception("Control error from %s: %s", peer_ip, e)
-
-        writer.write(response)
-        await writer.drain()
-        writer.close()
-        await writer.wait_closed()
+    def relay_report(self, sender_id, receiver_id, stats):
+        """Pass one receiver report (``[loss_pct, jitter_ms, kbps]``) on to its sender."""
+        client = self.clients.get(sender_id)
+        if client is not None:
+            if client.session is not None and not self.handing_off:
+                self._write_event(client.session, f"EVENT:REPORT:{receiver_id}:{':'.join(stats)}\n".encode())
+        elif self.trunk is not None and sender_id in self.remote:
+            self.trunk.relay_report(self.remote[sender_id].server_id, sender_id, receiver_id, stats)
 
     def join_room(self, client_id, room_id):
         client = self.clients.get(client_id)
@@ -122,114 +420,208 @@ class VoiceServer:
             self.rooms[client.room].discard(client_id)
         client.room = room_id
         self.rooms[room_id].add(client_id)
+        self.rebuild_routes()
+        if self.trunk is not None:
+            self.trunk.publish(client_id)
+        self.push_event(f"ROOM:{client_id}:{room_id}")
         logging.info("%s joined room %s", client_id, room_id)
 
     def remove_client(self, client_id):
         client = self.clients.pop(client_id, None)
+        self.expiry.cancel(client_id)
+        self.shard_activity.pop(client_id, None)
+        if client:
+            self.ssrcs.pop(client.ssrc, None)
         if client and client.room:
             self.rooms[client.room].discard(client_id)
+        self.rebuild_routes()
+        if client:
+            if self.trunk is not None:
+                self.trunk.publish(client_id)
+            self.push_event(f"REMOVE:{client_id}")
         logging.info("%s disconnected", client_id)
 
+    def get_room_group(self, room_id):
+        """Cached ``(group_ip, port)`` for a room's multicast fallback."""
+        group = self.room_groups.get(room_id)
+        if group is None:
+            group = self.room_groups[room_id] = (self.get_multicast_addr(room_id), self.audio_port)
+        return group
+
+    @staticmethod
+    def mix_hears(listener, sender):
+        """Whether a server-mixed ``listener`` would receive ``sender``'s audio."""
+        if listener.client_id == sender.client_id:
+            return False
+        if listener.mix_hear is not None and sender.client_id not in listener.mix_hear:
+            return False
+        if sender.targets:
+            return listener.client_id in sender.targets
+        return bool(sender.room) and sender.room == listener.room
+
+    def route_specs(self):
+        """Plain-data fan-out per sender; see ``Router`` for the layout."""
+        specs = []
+        mixed = [c for c in self.clients.values() if c.mixed]
+        self.mix_sources = {c.client_id: set() for c in mixed}
+        for cid, client in self.clients.items():
+            unicast = tuple(
+                self.clients[tid].addr
+                for tid in sorted(client.targets)
+                if tid != cid and tid in self.clients and not self.clients[tid].mixed
+            )
+            if self.trunk is not None:
+                unicast += self.trunk.trunk_addrs(client)
+            room_group = None
+            if not client.targets and client.room:
+                room_group = (client.room, self.get_room_group(client.room))
+            heard = False
+            for listener in mixed:
+                if self.mix_hears(listener, client):
+                    self.mix_sources[listener.client_id].add(cid)
+                    heard = True
+            specs.append((cid, client.ssrc, client.addr[0], client.room, unicast, room_group, heard))
+        return specs
+
+    def rebuild_routes(self):
+        """Publish a new route table version after a registry change."""
+        if self.router is None and self.shards is None:
+            return
+        self.route_version += 1
+        specs = self.route_specs()
+        if self.router is not None:
+            self.router.load(self.route_version, specs)
+        if self.shards is not None:
+            self.shards.publish(self.route_version, specs)
+        if self.trunk is not None and self.trunk.router is not None:
+            self.trunk.router.load(self.route_version, self.trunk.route_specs())
+        if self.mixer is not None:
+            self.mixer.load_listeners(
+                {
+                    lid: (self.clients[lid].addr, frozenset(senders))
+                    for lid, senders in self.mix_sources.items()
+                }
+            )
+
+    def ensure_mixer(self):
+        """Start server-side mixing on first use; False if it cannot run here."""
+        if self.mixer is not None:
+            return True
+        if self.mix_workers <= 0 or self.router is None:
+            return False
+        try:
+            from mixer import MixerService
+
+            mixer = MixerService(self.audio_sock, self.mix_workers)
+            mixer.start()
+        except (ImportError, OSError, RuntimeError) as e:
+            logging.error("Server-side mixing unavailable: %s", e)
+            self.mix_workers = 0
+            return False
+        self.mixer = mixer
+        self.router.mixer = mixer
+        if self.trunk is not None and self.trunk.router is not None:
+            self.trunk.router.mixer = mixer
+        return True
+
+    def touch_client(self, client_id):
+        client = self.clients.get(client_id)
+        if client is None:
+            return
+        client.last_heartbeat = time.monotonic()
+        self.expiry.schedule(client_id, client.last_heartbeat + self.client_timeout)
+
+    def last_activity(self, client_id):
+        """Latest of control heartbeat and forwarded audio for a client."""
+        client = self.clients.get(client_id)
+        if client is None:
+            return None
+        seen = client.last_heartbeat
+        if self.router is not None:
+            stats = self.router.stats.get(client_id)
+            if stats is not None:
+                seen = max(seen, stats.last_seen)
+        return max(seen, self.shard_activity.get(client_id, 0.0))
+
+    def note_shard_activity(self, client_ids, when):
+        for client_id in client_ids:
+            self.shard_activity[client_id] = when
+
     async def prune_dead_clients(self):
+        # Audio activity is not pushed into the wheel per packet; a client
+        # whose slot comes due is re-checked and rescheduled if it is still
+        # talking, so expiry work stays proportional to what is due.
         while True:
-            now = time.time()
-            stale = [
-                cid
-                for cid, cl in list(self.clients.items())
-                if (now - cl.last_heartbeat) > CLIENT_TIMEOUT_SEC
-            ]
-            for cid in stale:
-                self.remove_client(cid)
-            await asyncio.sleep(10)
+            await asyncio.sleep(self.expiry.tick_sec)
+            if self.handing_off:
+                continue
+            now = time.monotonic()
+            for cid in self.expiry.advance(now):
+                seen = self.last_activity(cid)
+                if seen is None:
+                    continue
+                if now - seen > self.client_timeout:
+                    logging.info("%s timed out", cid)
+                    self.remove_client(cid)
+                else:
+                    self.expiry.schedule(cid, seen + self.client_timeout)
+
+    def stop_forwarding(self):
+        if self.forwarder is not None:
+            self.forwarder.stop()
+        if self.trunk is not None and self.trunk.forwarder is not None:
+            self.trunk.forwarder.stop()
+        if self.shards is not None:
+            self.shards.stop()
+        if self.mixer is not None:
+            self.mixer.stop()
+
+    def forwarding_snapshots(self):
+        """Latest counters of every forwarding engine, in-process or sharded."""
+        snapshots = []
+        if self.shards is not None:
+            snapshots.extend(self.shards.snapshots.values())
+        elif self.forwarder is not None:
+            snapshots.append(engine_snapshot(self.forwarder, self.router))
+        if self.trunk is not None and self.trunk.forwarder is not None:
+            snapshots.append(engine_snapshot(self.trunk.forwarder, self.trunk.router))
+        return snapshots
 
     @staticmethod
-    def extract_sender_id(packet):
-        parts = packet.split(b"|", 1)
-        if len(parts) == 2:
-            sender = parts[0].decode(errors="ignore").strip()
-            if sender:
-                return sender
-
-        if b":" in packet:
-            sender = packet.split(b":", 1)[0].decode(errors="ignore").strip()
-            if sender:
-                return sender
-        return None
-
-    async def start_audio_server(self):
+    def make_audio_socket(port=AUDIO_PORT, host="0.0.0.0"):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
-        sock.bind(("0.0.0.0", AUDIO_PORT))
+        sock.bind((host, port))
         sock.setblocking(False)
-
-        logging.info("Audio UDP listening on port %s", AUDIO_PORT)
-
-        while True:
-            packet, addr = await self.loop.sock_recvfrom(sock, 4096)
-            asyncio.create_task(self.forward_packet(sock, packet, addr))
-
-    async def forward_packet(self, sock, packet, addr):
-        if not packet:
-            return
-        if addr is None:
-            addr = ("unknown", 0)
-
-        sender_id = self.extract_sender_id(packet)
-        if sender_id is None:
-            self.malformed_count += 1
-            if self.malformed_count % 50 == 1:
-                logging.warning(
-                    "Malformed audio packets=%s latest_from=%s",
-                    self.malformed_count,
-                    addr,
-                )
-            return
-
-        sender = self.clients.get(sender_id)
-        self.packet_count[sender_id] += 1
-        pkt_count = self.packet_count[sender_id]
-
-        if sender is None:
-            if pkt_count % 500 == 1:
-                logging.warning("Audio from unregistered sender: %s", sender_id)
-            return
-
-        if addr[0] != "unknown" and addr[0] != sender.addr[0] and pkt_count % 100 == 1:
-            logging.warning(
-                "IP mismatch warning for %s: expected %s, got %s. Allowing anyway.",
-                sender_id,
-                sender.addr[0],
-                addr[0],
+        return sock
+
+    def attach_audio_socket(self, sock):
+        self.audio_sock = sock
+        selector = ActiveSpeakerSelector(self.max_speakers) if self.max_speakers > 0 else None
+        self.router = Router(sock, selector)
+        self.rebuild_routes()
+        return self.router
+
+    def start_audio_server(self, sock=None):
+        if self.workers > 0:
+            self.shards = ShardPool(
+                self.workers,
+                self.audio_port,
+                max_speakers=self.max_speakers,
+                engine_options=self.engine_options,
             )
-
-        if sender.targets:
-            target_ids = list(sender.targets)
-            for target_id in target_ids:
-                if target_id == sender_id:
-                    continue
-                target = self.clients.get(target_id)
-                if target is None:
-                    continue
-                try:
-                    await self.loop.sock_sendto(sock, packet, target.addr)
-                except OSError as e:
-                    logging.error("Send error to %s: %s", target_id, e)
-        elif sender.room:
-            m_addr = self.get_multicast_addr(sender.room)
-            msock = self.multicast_socks.get(sender.room)
-            if msock is None:
-                msock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                msock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
-                msock.setblocking(False)
-                self.multicast_socks[sender.room] = msock
-            try:
-                await self.loop.sock_sendto(msock, packet, (m_addr, AUDIO_PORT))
-            except OSError as e:
-                logging.error("Multicast send error room=%s addr=%s: %s", sender.room, m_addr, e)
-        else:
+            self.shards.start()
+            self.rebuild_routes()
+            self.shards.wait_ready()
+            self.shards.watch_activity(self.loop, self.note_shard_activity)
+            logging.info("Audio UDP listening on port %s (%s worker processes)", self.audio_port, self.workers)
             return
+        router = self.attach_audio_socket(sock or self.make_audio_socket(self.audio_port))
+        self.forwarder = ForwardingEngine(self.audio_sock, router.route_packet, **self.engine_options)
+        threading.Thread(target=self.forwarder.run, daemon=True, name="audio-forwarder").start()
+        logging.info("Audio UDP listening on port %s", self.audio_port)
 
     async def start(self):
         logging.basicConfig(
@@ -237,16 +629,165 @@ class VoiceServer:
             format="[SERVER] %(asctime)s %(levelname)s %(message)s",
         )
         self.loop = asyncio.get_running_loop()
+        takeover = take_over(self, self.handoff_path, Client) if self.takeover else None
         threading.Thread(target=self.broadcast_server, daemon=True, name="discovery-broadcast").start()
-
-        control_server = await asyncio.start_server(self.handle_control, "0.0.0.0", CONTROL_PORT)
-        logging.info("Control TCP listening on port %s", CONTROL_PORT)
+        threading.Thread(
+            target=self.answer_discovery,
+            args=(takeover.socket("discovery") if takeover is not None else None,),
+            daemon=True,
+            name="discovery-reply",
+        ).start()
+
+        if takeover is not None:
+            self.control_server = await asyncio.start_server(self.handle_control, sock=takeover.socket("control"))
+        else:
+            self.control_server = await asyncio.start_server(self.handle_control, "0.0.0.0", self.control_port)
+        logging.info("Control TCP listening on port %s", self.control_port)
 
         asyncio.create_task(self.prune_dead_clients())
-        asyncio.create_task(self.start_audio_server())
-        async with control_server:
-            await control_server.serve_forever()
+        self.start_audio_server(takeover.socket("audio") if takeover is not None else None)
+        if self.trunk is not None:
+            self.trunk.start(self.loop, self.engine_options, takeover.socket("trunk") if takeover is not None else None)
+            if self.router is not None:
+                # NACKs for audio relayed from a peer are answered from the trunk's rings.
+                self.router.fallback = self.trunk.router
+            self.rebuild_routes()
+        if self.metrics_port:
+            self.metrics_server = await MetricsExporter(self).start(
+                self.metrics_host,
+                self.metrics_port,
+                takeover.socket("metrics") if takeover is not None else None,
+            )
+        if takeover is not None:
+            await self.adopt_connections(takeover)
+            takeover.ready()
+        if handoff_supported():
+            await HandoffServer(self, self.handoff_path).start()
+        # Serve until killed or handed off; closing the control server during
+        # a hot restart must not end the process before the handoff is done.
+        await asyncio.Event().wait()
+
+    async def adopt_connections(self, takeover):
+        """Resume the control connections of the process we took over from."""
+        mixed = [c for c in self.clients.values() if c.mixed]
+        if mixed and not self.ensure_mixer():
+            for client in mixed:
+                client.mixed = False
+                client.mix_hear = None
+            self.rebuild_routes()
+        for sock, peer_ip, client_id, peer, persistent, pending in takeover.connections:
+            reader, writer = await asyncio.open_connection(sock=sock)
+            conn = Session(writer, peer_ip)
+            conn.client_id = client_id
+            conn.peer = peer
+            conn.persistent = persistent
+            conn.pending.extend(pending)
+            if client_id in self.clients:
+                self.clients[client_id].session = conn
+            if peer is not None and self.trunk is not None and peer in self.trunk.peers:
+                self.trunk.peers[peer].session = conn
+            asyncio.create_task(self.handle_control(reader, writer, conn))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LAN voice server (TCP control + UDP forwarder)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="forward audio in N processes sharing the UDP port via SO_REUSEPORT (0 = in-process)",
+    )
+    parser.add_argument(
+        "--client-timeout",
+        type=float,
+        default=CLIENT_TIMEOUT_SEC,
+        help="seconds without heartbeat or audio before a client is dropped",
+    )
+    parser.add_argument(
+        "--expiry-tick",
+        type=float,
+        default=EXPIRY_TICK_SEC,
+        help="granularity of the client expiry wheel in seconds",
+    )
+    parser.add_argument(
+        "--max-speakers",
+        type=int,
+        default=MAX_SPEAKERS,
+        help="forward only the N loudest level-tagged talkers per room (0 = forward all)",
+    )
+    parser.add_argument(
+        "--mix-workers",
+        type=int,
+        default=MIX_WORKERS,
+        help="processes for server-side mixing of MIX listeners (0 = disable; needs numpy and libopus)",
+    )
+    parser.add_argument(
+        "--send-queue",
+        type=int,
+        default=SEND_QUEUE_DEPTH,
+        help="packets buffered per destination whose sends would block",
+    )
+    parser.add_argument(
+        "--max-packet-age",
+        type=float,
+        default=MAX_PACKET_AGE_SEC,
+        help="seconds after which queued audio is dropped instead of sent",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="Prometheus /metrics HTTP port (0 = disable)",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="address the metrics endpoint binds to",
+    )
+    parser.add_argument("--control-port", type=int, default=CONTROL_PORT, help="TCP control port")
+    parser.add_argument("--audio-port", type=int, default=AUDIO_PORT, help="UDP audio port clients send to")
+    parser.add_argument(
+        "--peer",
+        action="append",
+        default=[],
+        metavar="HOST[:CONTROL_PORT]",
+        help="trunk to another server (repeat for each; list every other server on every server)",
+    )
+    parser.add_argument("--trunk-port", type=int, default=TRUNK_PORT, help="UDP port for server-to-server audio")
+    parser.add_argument("--server-id", default=None, help="name of this server among its peers (default host:control-port)")
+    parser.add_argument(
+        "--takeover",
+        action="store_true",
+        help="hot restart: take sockets, registry and control connections over from the running server",
+    )
+    parser.add_argument(
+        "--handoff-path",
+        default=None,
+        help="Unix socket used for --takeover (default: voice-server-<control-port>.sock in the temp dir)",
+    )
+    args = parser.parse_args()
+    server = VoiceServer(
+        workers=args.workers,
+        client_timeout=args.client_timeout,
+        expiry_tick=args.expiry_tick,
+        max_speakers=args.max_speakers,
+        mix_workers=args.mix_workers,
+        metrics_port=args.metrics_port,
+        metrics_host=args.metrics_host,
+        send_queue_depth=args.send_queue,
+        max_packet_age=args.max_packet_age,
+        control_port=args.control_port,
+        audio_port=args.audio_port,
+        trunk_port=args.trunk_port,
+        peers=[
+            (host, port or CONTROL_PORT) for host, port in (parse_peer(p) for p in args.peer)
+        ],
+        server_id=args.server_id,
+        takeover=args.takeover,
+        handoff=args.handoff_path,
+    )
+    asyncio.run(server.start())
 
 
 if __name__ == "__main__":
-    asyncio.run(VoiceServer().start())
+    main()
@@ -0,0 +1,205 @@
+import logging
+import multiprocessing
+import socket
+import threading
+import time
+
+from forwarder import ForwardingEngine
+from metrics import engine_snapshot
+from nack import NackRelay
+from router import Router
+from speakers import ActiveSpeakerSelector
+
+ACTIVITY_REPORT_SEC = 1.0
+WORKER_START_TIMEOUT_SEC = 10.0
+
+
+def make_reuseport_socket(port, host="0.0.0.0"):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not available on this platform; run without --workers")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
+    sock.bind((host, port))
+    sock.setblocking(False)
+    return sock
+
+
+def _apply_updates(conn, router, engine):
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            msg = None
+        if msg is None:
+            engine.stop()
+            return
+        if msg[0] == "relays":
+            router.relay.peers = tuple(addr for addr in msg[1] if addr != router.relay.addr)
+            continue
+        version, specs = msg
+        router.load(version, specs)
+
+
+def _report_activity(conn, router, engine):
+    # Lets the control process keep talkers alive and export metrics
+    # without per-packet IPC.
+    last = time.monotonic()
+    while True:
+        time.sleep(ACTIVITY_REPORT_SEC)
+        seen = [cid for cid, stats in list(router.stats.items()) if stats.last_seen > last]
+        last = time.monotonic()
+        try:
+            if seen:
+                conn.send(("seen", seen))
+            conn.send(("stats", engine_snapshot(engine, router)))
+        except (BrokenPipeError, OSError):
+            return
+
+
+def worker_main(index, port, host, conn, max_speakers=0, engine_options=None):
+    """Entry point of one forwarding worker process."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"[SHARD {index}] %(asctime)s %(levelname)s %(message)s",
+    )
+    # Join the port only with a route table in hand: once bound, the kernel
+    # starts hashing talkers here, and none of their packets may be dropped
+    # as unregistered (this is what keeps a hot restart gapless).
+    try:
+        first = conn.recv()
+    except (EOFError, OSError):
+        return
+    if first is None:
+        return
+    sock = make_reuseport_socket(port, host)
+    selector = ActiveSpeakerSelector(max_speakers) if max_speakers > 0 else None
+    router = Router(sock, selector)
+    router.relay = NackRelay()
+    router.load(*first)
+    conn.send(("ready", index, router.relay.addr))
+    engine = ForwardingEngine(sock, router.route_packet, **(engine_options or {}))
+    engine.add_reader(router.relay.sock, lambda: router.relay.drain(router.handle_relayed_nack))
+    threading.Thread(
+        target=_apply_updates, args=(conn, router, engine), daemon=True, name="route-updates"
+    ).start()
+    threading.Thread(
+        target=_report_activity, args=(conn, router, engine), daemon=True, name="activity-report"
+    ).start()
+    logging.info("Worker %s forwarding on UDP port %s", index, port)
+    engine.run()
+    router.relay.close()
+    sock.close()
+
+
+class ShardPool:
+    """N forwarding processes sharing the audio port through SO_REUSEPORT.
+
+    The kernel hashes each sender's 4-tuple onto one worker, so a talker's
+    packets stay in order on a single shard. The control process keeps the
+    authoritative registry and pushes every route table version to all
+    workers over a pipe; workers report which senders they saw on the way
+    back so audio keeps clients alive. Active-speaker ranking runs per
+    worker over the senders hashed to it, so a room can get up to
+    ``workers * max_speakers`` streams. A NACK hashed to a worker that does
+    not forward its sender is relayed to the one that does (``NackRelay``).
+    """
+
+    def __init__(self, workers, port, host="0.0.0.0", max_speakers=0, engine_options=None):
+        self.workers = workers
+        self.max_speakers = max_speakers
+        self.engine_options = engine_options or {}
+        self.port = port
+        self.host = host
+        self.procs = []
+        self.conns = []
+        self.last = None
+        self.snapshots = {}  # worker index -> latest engine_snapshot()
+        # Spawned children hold no copies of the parent's pipe ends, so a
+        # dead control process shows up as EOF in every worker.
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def start(self):
+        # Fail in the parent rather than in every child.
+        make_reuseport_socket(self.port, self.host).close()
+        for index in range(self.workers):
+            parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+            proc = self._ctx.Process(
+                target=worker_main,
+                args=(index, self.port, self.host, child_conn, self.max_speakers, self.engine_options),
+                daemon=True,
+                name=f"audio-shard-{index}",
+            )
+            proc.start()
+            child_conn.close()
+            self.procs.append(proc)
+            self.conns.append(parent_conn)
+        if self.last is not None:
+            self.publish(*self.last)
+
+    def wait_ready(self, timeout=WORKER_START_TIMEOUT_SEC):
+        """Block until every worker has a route table and is bound to the port.
+
+        Then tells every worker where its siblings' NACK relays listen.
+        """
+        deadline = time.monotonic() + timeout
+        relays = []
+        ready = True
+        for index, conn in enumerate(self.conns):
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not conn.poll(remaining):
+                    logging.warning("Shard %s is not ready after %.0f s", index, timeout)
+                    ready = False
+                    break
+                msg = conn.recv()
+                if msg and msg[0] == "ready":
+                    relays.append(msg[2])
+                    break
+            if not ready:
+                break
+        for index, conn in enumerate(self.conns):
+            try:
+                conn.send(("relays", relays))
+            except (BrokenPipeError, OSError) as e:
+                logging.error("NACK relay list to shard %s failed: %s", index, e)
+        return ready
+
+    def watch_activity(self, loop, on_seen):
+        """Deliver worker activity reports as ``on_seen(client_ids, monotonic_now)``.
+
+        Also keeps each worker's latest metrics snapshot in ``snapshots``.
+        """
+
+        def _read(index, conn):
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                loop.remove_reader(conn.fileno())
+                self.snapshots.pop(index, None)
+                return
+            if msg and msg[0] == "seen":
+                on_seen(msg[1], time.monotonic())
+            elif msg and msg[0] == "stats":
+                self.snapshots[index] = msg[1]
+
+        for index, conn in enumerate(self.conns):
+            loop.add_reader(conn.fileno(), _read, index, conn)
+
+    def publish(self, version, specs):
+        self.last = (version, specs)
+        for index, conn in enumerate(self.conns):
+            try:
+                conn.send((version, specs))
+            except (BrokenPipeError, OSError) as e:
+                logging.error("Route update to shard %s failed: %s", index, e)
+
+    def stop(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc in self.procs:
+            proc.join(timeout=2.0)
@@ -0,0 +1,12 @@
+"""Puts ../client on ``sys.path``: the server uses the client's ``packet`` and ``opus_codec``.
+
+Import it before either of them; there is only one copy of each.
+"""
+
+import os
+import sys
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+
+if CLIENT_DIR not in sys.path:
+    sys.path.append(CLIENT_DIR)
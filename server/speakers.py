@@ -0,0 +1,94 @@
+MAX_SPEAKERS = 4
+SWITCH_MARGIN_DB = 6.0     # a challenger must be this much louder to take a slot
+MIN_HOLD_SEC = 0.5         # an admitted speaker keeps its slot at least this long
+IDLE_SEC = 0.3             # a slot frees up after this long without voice
+LEVEL_SMOOTHING = 0.3      # EMA weight of the newest level sample
+SILENCE_DBOV = 127
+
+
+class _Speaker:
+    __slots__ = ("loudness", "last_voice", "admitted_at")
+
+    def __init__(self, loudness):
+        self.loudness = loudness
+        self.last_voice = 0.0
+        self.admitted_at = 0.0
+
+
+class ActiveSpeakerSelector:
+    """Keeps the ``max_speakers`` loudest talkers of each group on the air.
+
+    Levels are the per-packet audio level byte (``-dBov`` 0..127 plus a VAD
+    bit, see ``packet.pack_level``). Loudness is smoothed per sender and a
+    newcomer only displaces the quietest active speaker when it is
+    ``margin_db`` louder and that speaker has held its slot for
+    ``min_hold_sec``, so the forwarded set does not flap between talkers of
+    similar volume. Called from the forwarding thread only.
+    """
+
+    def __init__(
+        self,
+        max_speakers=MAX_SPEAKERS,
+        margin_db=SWITCH_MARGIN_DB,
+        min_hold_sec=MIN_HOLD_SEC,
+        idle_sec=IDLE_SEC,
+    ):
+        self.max_speakers = max_speakers
+        self.margin_db = margin_db
+        self.min_hold_sec = min_hold_sec
+        self.idle_sec = idle_sec
+        self.speakers = {}   # group -> {sender: _Speaker}
+        self.active = {}     # group -> set(sender)
+        self.switches = 0
+
+    def admit(self, group, sender, dbov, voice, now):
+        """Update ``sender``'s level and return True if its packet should be forwarded."""
+        speakers = self.speakers.get(group)
+        if speakers is None:
+            speakers = self.speakers[group] = {}
+            self.active[group] = set()
+        active = self.active[group]
+
+        loudness = float(SILENCE_DBOV - dbov) if voice else 0.0
+        speaker = speakers.get(sender)
+        if speaker is None:
+            speaker = speakers[sender] = _Speaker(loudness)
+        else:
+            speaker.loudness += LEVEL_SMOOTHING * (loudness - speaker.loudness)
+        if voice:
+            speaker.last_voice = now
+
+        if sender in active:
+            return True
+        if not voice:
+            return False
+
+        for other in [s for s in active if now - speakers[s].last_voice > self.idle_sec]:
+            active.discard(other)
+        if len(active) < self.max_speakers:
+            active.add(sender)
+            speaker.admitted_at = now
+            return True
+
+        weakest = min(active, key=lambda s: speakers[s].loudness)
+        held = speakers[weakest]
+        if now - held.admitted_at < self.min_hold_sec:
+            return False
+        if speaker.loudness < held.loudness + self.margin_db:
+            return False
+        active.discard(weakest)
+        active.add(sender)
+        speaker.admitted_at = now
+        self.switches += 1
+        return True
+
+    def forget(self, keep):
+        """Drop state for senders no longer in ``keep`` (``Router`` applies it after a route reload)."""
+        for group in list(self.speakers):
+            speakers = self.speakers[group]
+            for sender in [s for s in speakers if keep.get(s) != group]:
+                del speakers[sender]
+                self.active[group].discard(sender)
+            if not speakers:
+                del self.speakers[group]
+                del self.active[group]
@@ -0,0 +1,303 @@
+import asyncio
+import hmac
+import logging
+import socket
+import threading
+
+from forwarder import ForwardingEngine
+from router import Router
+
+TRUNK_PORT = 50003
+PEER_RECONNECT_SEC = 2.0
+PEER_CONNECT_TIMEOUT_SEC = 5.0
+PEER_GRACE_SEC = 5.0          # keep a vanished peer's clients routable this long
+
+
+class RemoteClient:
+    """A client registered on a peer server, as mirrored by ``FED`` frames."""
+
+    def __init__(self, client_id, ssrc, room, targets, server_id):
+        self.client_id = client_id
+        self.ssrc = ssrc
+        self.room = room
+        self.targets = targets
+        self.server_id = server_id
+        self.mixed = False
+        self.mix_hear = None
+        self.stale = False
+
+
+class Peer:
+    def __init__(self, server_id, trunk_addr, session):
+        self.server_id = server_id
+        self.trunk_addr = trunk_addr
+        self.session = session
+
+
+def parse_peer(value):
+    """``host[:control_port]`` -> ``(host, port)``."""
+    host, _, port = value.rpartition(":")
+    if not host:
+        return value, None
+    return host, int(port)
+
+
+def fed_add_line(client):
+    targets = ",".join(sorted(client.targets))
+    return f"FED:ADD:{client.client_id}:{client.ssrc}:{client.room or ''}:{targets}"
+
+
+class PeerLink:
+    """Outbound control session that mirrors this server's registry to one peer.
+
+    Each server pushes only the clients it owns, so a full mesh of links
+    (every server lists every other with ``--peer``) gives every server the
+    whole registry. After a (re)connect the peer gets a full snapshot
+    between ``FED:SYNC`` and ``FED:SYNCED`` and drops whatever it still
+    holds that the snapshot did not repeat; frames sent while the link is
+    down are simply lost.
+    """
+
+    def __init__(self, trunk, host, port):
+        self.trunk = trunk
+        self.host = host
+        self.port = port
+        self.writer = None
+        self.rid = 0
+        self.server_id = None   # the peer's id, learned from its PEER reply
+
+    def send(self, line):
+        writer = self.writer
+        if writer is None or writer.transport.is_closing():
+            return
+        self.rid += 1
+        writer.write(f"#{self.rid} {line}\n".encode())
+
+    async def _request(self, reader, writer, line):
+        self.rid += 1
+        writer.write(f"#{self.rid} {line}\n".encode())
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.readline(), PEER_CONNECT_TIMEOUT_SEC)
+        return raw.decode(errors="ignore").strip().partition(" ")[2]
+
+    async def run(self):
+        server = self.trunk.server
+        ping_sec = max(1.0, server.client_timeout / 3)
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), PEER_CONNECT_TIMEOUT_SEC
+                )
+                await self._request(reader, writer, "HELLO:1")
+                reply = await self._request(
+                    reader, writer, f"PEER:{self.trunk.server_id}:{self.trunk.port}:{self.trunk.secret}"
+                )
+                if not reply.startswith("OK"):
+                    raise ConnectionError(f"peer refused trunk: {reply}")
+                self.server_id = reply[3:]
+                logging.info("Trunk peer %s:%s linked (%s)", self.host, self.port, self.server_id)
+                self.writer = writer
+                self.send("FED:SYNC")
+                for client in list(server.clients.values()):
+                    self.send(fed_add_line(client))
+                self.send("FED:SYNCED")
+                while True:
+                    try:
+                        raw = await asyncio.wait_for(reader.readline(), ping_sec)
+                    except asyncio.TimeoutError:
+                        self.send("FED:PING")
+                        continue
+                    if not raw:
+                        break
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                logging.warning("Trunk peer %s:%s unavailable: %s", self.host, self.port, e)
+            finally:
+                self.writer = None
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(PEER_RECONNECT_SEC)
+
+
+class Trunk:
+    """Server-to-server relay over one UDP socket per server.
+
+    Local senders reach listeners on a peer through a single copy per
+    packet sent to that peer's trunk port (``Router`` gets the peer's trunk
+    address as one more unicast destination). Packets arriving on the
+    trunk port are fanned out here by a second ``Router`` whose routes only
+    ever point at local clients, so audio crosses at most one hop and never
+    loops. The registry is federated over the control protocol: ``PEER``
+    opens a peer session and ``FED`` frames keep ``server.remote`` current.
+    """
+
+    def __init__(self, server, server_id, port, peers, secret, host="0.0.0.0"):
+        self.server = server
+        self.server_id = server_id
+        self.port = port
+        self.host = host
+        self.secret = secret    # peers must present the shared server secret
+        self.links = [PeerLink(self, h, p) for h, p in peers]
+        self.peers = {}     # server_id -> Peer, learned from inbound PEER sessions
+        self.sock = None
+        self.router = None
+        self.forwarder = None
+
+    def start(self, loop, engine_options, sock=None):
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
+            sock.bind((self.host, self.port))
+            sock.setblocking(False)
+        self.sock = sock
+        self.router = Router(sock)
+        self.forwarder = ForwardingEngine(sock, self.router.route_packet, **engine_options)
+        threading.Thread(target=self.forwarder.run, daemon=True, name="trunk-forwarder").start()
+        for link in self.links:
+            loop.create_task(link.run())
+        logging.info("Trunk UDP listening on port %s as %s (%s peers)", self.port, self.server_id, len(self.links))
+
+    def publish(self, client_id):
+        client = self.server.clients.get(client_id)
+        line = fed_add_line(client) if client is not None else f"FED:DEL:{client_id}"
+        for link in self.links:
+            link.send(line)
+
+    def relay_report(self, server_id, sender_id, receiver_id, stats):
+        """Pass a receiver report on to the peer that hosts ``sender_id``."""
+        for link in self.links:
+            if link.server_id == server_id:
+                link.send(f"FED:REPORT:{sender_id}:{receiver_id}:{':'.join(stats)}")
+                return
+
+    def trunk_addrs(self, client):
+        """Trunk addresses of the peers that host a listener of ``client``, one per peer."""
+        remote = self.server.remote
+        if client.targets:
+            owners = {remote[t].server_id for t in client.targets if t in remote}
+        elif client.room:
+            owners = {rc.server_id for rc in remote.values() if rc.room == client.room}
+        else:
+            return ()
+        return tuple(self.peers[sid].trunk_addr for sid in sorted(owners) if sid in self.peers)
+
+    def handle(self, parts, session, peer_ip):
+        """``PEER:<server_id>:<trunk_port>:<secret>`` and ``FED:...`` frames from a peer session."""
+        server = self.server
+        if parts[0] == "PEER":
+            # Server ids default to host:port, so count fields from the right.
+            if len(parts) < 4 or session is None or not parts[-2].isdigit():
+                return b"ERR\n"
+            if not hmac.compare_digest(parts[-1].encode(), self.secret.encode()):
+                logging.warning("Trunk peer from %s refused: bad secret", peer_ip)
+                return b"ERR:AUTH\n"
+            server_id = ":".join(parts[1:-2])
+            trunk_port = int(parts[-2])
+            if server_id == self.server_id:
+                return b"ERR:SAME_SERVER\n"
+            # A restarted peer replaces its old session; its clients stay
+            # routable until the SYNC that follows says otherwise.
+            self.peers[server_id] = Peer(server_id, (peer_ip, trunk_port), session)
+            session.peer = server_id
+            logging.info("Trunk peer %s registered from %s:%s", server_id, peer_ip, trunk_port)
+            return f"OK:{self.server_id}\n".encode()
+
+        server_id = session.peer if session is not None else None
+        if server_id is None or len(parts) < 2:
+            return b"ERR\n"
+        op = parts[1]
+        if op == "PING":
+            return b"OK\n"
+        if op == "SYNC":
+            for rc in server.remote.values():
+                if rc.server_id == server_id:
+                    rc.stale = True
+            return b"OK\n"
+        if op == "SYNCED":
+            for client_id in [c for c, rc in server.remote.items() if rc.server_id == server_id and rc.stale]:
+                self.remove_remote(client_id)
+            return b"OK\n"
+        if op == "DEL" and len(parts) == 3:
+            rc = server.remote.get(parts[2])
+            if rc is not None and rc.server_id == server_id:
+                self.remove_remote(parts[2])
+            return b"OK\n"
+        if op == "REPORT" and len(parts) == 7:
+            # Only ever delivered to a local sender, so reports never bounce between servers.
+            if parts[2] in server.clients:
+                server.relay_report(parts[2], parts[3], parts[4:7])
+            return b"OK\n"
+        if op == "ADD" and len(parts) == 6:
+            client_id = parts[2]
+            if client_id in server.clients:
+                logging.warning("Trunk peer %s announced %s, which is registered here", server_id, client_id)
+                return b"TAKEN\n"
+            rc = server.remote.get(client_id)
+            room = parts[4] or None
+            targets = {t for t in parts[5].split(",") if t}
+            moved = rc is None or rc.room != room
+            if rc is None:
+                rc = server.remote[client_id] = RemoteClient(client_id, int(parts[3]), room, targets, server_id)
+                server.push_event(f"ADD:{client_id}:{rc.ssrc}")
+            else:
+                rc.ssrc = int(parts[3])
+                rc.room = room
+                rc.targets = targets
+                rc.server_id = server_id
+                rc.stale = False
+            server.rebuild_routes()
+            if moved and room:
+                server.push_event(f"ROOM:{client_id}:{room}")
+            return b"OK\n"
+        return b"ERR\n"
+
+    def remove_remote(self, client_id):
+        if self.server.remote.pop(client_id, None) is not None:
+            self.server.rebuild_routes()
+            self.server.push_event(f"REMOVE:{client_id}")
+
+    def drop_peer_clients(self, server_id):
+        for client_id in [c for c, rc in self.server.remote.items() if rc.server_id == server_id]:
+            self.remove_remote(client_id)
+
+    def close_session(self, session):
+        # A peer restarting (hot or cold) reconnects within moments; only
+        # forget it if no new session shows up within the grace period.
+        peer = self.peers.get(session.peer)
+        if peer is None or peer.session is not session:
+            return
+        logging.info("Trunk peer %s disconnected", peer.server_id)
+        self.server.loop.call_later(PEER_GRACE_SEC, self._expire_peer, peer)
+
+    def _expire_peer(self, peer):
+        if self.peers.get(peer.server_id) is not peer:
+            return
+        logging.info("Trunk peer %s gone, dropping its clients", peer.server_id)
+        del self.peers[peer.server_id]
+        self.drop_peer_clients(peer.server_id)
+
+    def route_specs(self):
+        """Specs for audio arriving on the trunk: remote senders to local listeners only."""
+        server = self.server
+        specs = []
+        for cid, rc in server.remote.items():
+            peer = self.peers.get(rc.server_id)
+            if peer is None:
+                continue
+            unicast = tuple(
+                server.clients[tid].addr
+                for tid in sorted(rc.targets)
+                if tid in server.clients and not server.clients[tid].mixed
+            )
+            room_group = None
+            if not rc.targets and rc.room and server.rooms.get(rc.room):
+                room_group = (rc.room, server.get_room_group(rc.room))
+            heard = False
+            for lid, sources in server.mix_sources.items():
+                if server.mix_hears(server.clients[lid], rc):
+                    sources.add(cid)
+                    heard = True
+            specs.append((cid, rc.ssrc, peer.trunk_addr[0], rc.room, unicast, room_group, heard))
+        return specs